@@ -0,0 +1,6 @@
+# Bone Flex Drivers for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# The engine module generates bone flex driver operators without any user interface,
+# so it can be used by the Bone Flex Drivers window and by batch jobs alike.
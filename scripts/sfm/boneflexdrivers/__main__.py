@@ -0,0 +1,13 @@
+# Bone Flex Drivers command line for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Runs the command line with python -m boneflexdrivers from scripts/sfm, see cli.py.
+
+
+import sys
+
+from boneflexdrivers import cli
+
+if __name__ == "__main__":
+    sys.exit(cli.main())
@@ -0,0 +1,107 @@
+# Bone Flex Drivers bake for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Bakes the flex values of bone flex drivers into their flex controls' channels,
+# so shots no longer evaluate their operators every frame, and restores the operators on unbake.
+
+
+import math
+
+from boneflexdrivers import engine, evaluate
+
+def getShotTimeRange(shot):
+    """
+    Returns the start and end of the visible part of a shot in seconds, in the shot's local time its channels are keyed in.
+    The shot's start and duration are in the movie's time, which maps to local time like SFM's DmeClip.ToChildMediaTime(),
+    so trimmed, offset and scaled shots bake the frames that are shown.
+    """
+    timeFrame = shot.timeFrame
+    start = timeFrame.start.GetValue().GetSeconds()
+    end = start + timeFrame.duration.GetValue().GetSeconds()
+    return toLocalTime(timeFrame, start), toLocalTime(timeFrame, end)
+
+def toLocalTime(timeFrame, time):
+    """
+    Converts a time in the movie's time to a shot's local time.
+    """
+    return (time - timeFrame.start.GetValue().GetSeconds()) * timeFrame.scale.GetValue() + timeFrame.offset.GetValue().GetSeconds()
+
+def getSampleTimes(start, end, frameRate):
+    """
+    Returns one time per frame from start to end, inclusive.
+    """
+    frameCount = int(math.floor((end - start) * frameRate + 1e-6))
+    return [start + frame / float(frameRate) for frame in range(frameCount + 1)]
+
+def sampleChannel(channel, times):
+    """
+    Returns the values of a channel's log at each time.
+    """
+    log = channel.log
+    return [log.GetValue(engine.vs.DmeTime_t(time)) for time in times]
+
+def copyLogKeys(source, destination):
+    """
+    Replaces the keys of a log with the keys of another log.
+    """
+    destination.ClearKeys()
+    for i in range(source.GetKeyCount()):
+        destination.SetKey(source.GetKeyTime(i), source.GetKeyValue(i))
+
+def bakeBoneFlexDriver(shot, element, generator, frameRate):
+    """
+    Samples a bone flex driver's bone channel over the shot's time range and writes the resulting flex values
+    as keys on its flex control's channel, replacing the bone flex driver's operators.
+    The channel's previous keys are kept in a backup log for unbakeBoneFlexDriver().
+    Returns an error message, or None if the bone flex driver was baked.
+    """
+    if engine.isBaked(element):
+        return "Bone flex driver '%s' is already baked" % element.GetName()
+    boneFlexDriver = engine.BoneFlexDriver.fromElement(element)
+    animationSetIndex = generator.getAnimationSetIndex(element.animationSet)
+    boneControl = animationSetIndex.controls.get(boneFlexDriver.boneName)
+    if boneControl is None:
+        return "Bone '%s' of bone flex driver '%s' could not be found" % (boneFlexDriver.boneName, boneFlexDriver.name)
+    boneChannel = boneControl.positionChannel if boneFlexDriver.usePosition else boneControl.orientationChannel
+    flexChannel = animationSetIndex.getFlexChannel(boneFlexDriver.flexName)
+    if flexChannel is None or flexChannel.log is None:
+        return "Flex '%s' of bone flex driver '%s' has no channel to bake into" % (boneFlexDriver.flexName, boneFlexDriver.name)
+    start, end = getShotTimeRange(shot)
+    times = getSampleTimes(start, end, frameRate)
+    weights = evaluate.evaluateSamples(engine.expressionCache.getFunction(boneFlexDriver), boneFlexDriver.usePosition, sampleChannel(boneChannel, times))
+    backupLog = engine.vs.CreateElement(flexChannel.log.GetType(), (element.GetName() + "_bakeBackup").encode('utf-8'), shot.GetFileId())
+    copyLogKeys(flexChannel.log, backupLog)
+    if not hasattr(element, "bakeBackupLog"):
+        element.AddAttribute("bakeBackupLog", engine.vs.AT_ELEMENT)
+    element.SetValue("bakeBackupLog", backupLog)
+    flexChannel.log.ClearKeys()
+    for time, weight in zip(times, weights):
+        flexChannel.log.SetKey(engine.vs.DmeTime_t(time), float(weight))
+    if not hasattr(element, "baked"):
+        element.AddAttribute("baked", engine.vs.AT_BOOL)
+    element.baked.SetValue(True)
+    # the flex control animates the flex again, now with the baked keys
+    generator.removeGeneratedOperatorsFromShot(shot, element)
+    animationSetIndex.setFlexControlDriven(boneFlexDriver.flexName, False)
+    return None
+
+def unbakeBoneFlexDriver(shot, element, generator):
+    """
+    Restores the keys a flex control's channel had before its bone flex driver was baked,
+    and regenerates the bone flex driver's operators.
+    Returns an error message, or None if the bone flex driver was unbaked.
+    """
+    if not engine.isBaked(element):
+        return "Bone flex driver '%s' is not baked" % element.GetName()
+    animationSetIndex = generator.getAnimationSetIndex(element.animationSet)
+    flexChannel = animationSetIndex.getFlexChannel(element.flexName.GetValue())
+    backupLog = getattr(element, "bakeBackupLog", None)
+    if flexChannel is not None and flexChannel.log is not None and backupLog is not None:
+        copyLogKeys(backupLog, flexChannel.log)
+    element.baked.SetValue(False)
+    # the backup log is only referenced by the bone flex driver, so removing the attribute removes it from the session
+    if hasattr(element, "bakeBackupLog"):
+        element.RemoveAttribute("bakeBackupLog")
+    generator.regenerateBoneFlexDriver(shot, element)
+    return None
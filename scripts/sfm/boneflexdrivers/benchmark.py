@@ -0,0 +1,130 @@
+# Bone Flex Drivers benchmark for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Measures the engine against the local datamodel on synthetic shots:
+#   python scripts/sfm/boneflexdrivers/benchmark.py --animation-sets 4 --controls 64 --drivers 32
+
+
+import os
+import sys
+import inspect
+import argparse
+import tempfile
+import timeit
+
+if __name__ == "__main__" and __package__ is None:
+    # the boneflexdrivers package lives in scripts/sfm
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+from boneflexdrivers import engine, library, localdm
+
+engine.setDatamodel(localdm)
+
+def createSession(animationSetCount, controlCount, driverCount, shotName="shot1"):
+    """
+    Creates a shot with animationSetCount animation sets of controlCount bones and driverCount flexes,
+    and returns it with driverCount bone flex drivers per animation set.
+    Bone flex drivers alternate between rotation and translation and cycle through axes and bones.
+    """
+    shot = localdm.createShot(shotName)
+    boneNames = ["bone%d" % j for j in range(controlCount)]
+    flexNames = ["flex%d" % j for j in range(driverCount)]
+    for i in range(animationSetCount):
+        animationSet = localdm.createAnimationSet(shot, "model%d" % i, boneNames, flexNames, "models/benchmark/model%d.mdl" % i)
+        for j in range(driverCount):
+            boneFlexDriver = engine.BoneFlexDriver("boneFlexDriver%d" % (j + 1), flexNames[j], boneNames[j % controlCount], usePosition=j % 2 == 1, boneAxis="XYZ"[j % 3])
+            engine.addBoneFlexDriver(shot, animationSet, boneFlexDriver)
+    return shot
+
+def measure(name, operation, repeat):
+    """
+    Runs an operation repeat times and returns its name, best time in milliseconds,
+    and the elements allocated and attribute lookups of a single run.
+    """
+    best = None
+    elements = 0
+    lookups = 0
+    for i in range(repeat):
+        localdm.resetStats()
+        start = timeit.default_timer()
+        operation()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        elements = localdm.stats["elements"]
+        lookups = localdm.stats["lookups"]
+    return (name, best * 1000.0, elements, lookups)
+
+def runBenchmark(animationSetCount, controlCount, driverCount, repeat):
+    """
+    Benchmarks operator generation, in-place edits and import/export, returning a list of result rows.
+    """
+    localdm.clearDocument()
+    engine.expressionCache.clear()
+    shot = createSession(animationSetCount, controlCount, driverCount)
+    generator = engine.OperatorGenerator()
+    boneFlexDrivers = engine.getBoneFlexDrivers(shot)
+    firstBoneFlexDriver = boneFlexDrivers[0]
+    results = []
+    def generateFullGraph():
+        generator.optimizedGraph = False
+        generator.generateShot(shot)
+    def generateOptimizedGraph():
+        generator.optimizedGraph = True
+        generator.generateShot(shot)
+    results.append(measure("generate shot (full graph)", generateFullGraph, repeat))
+    fullCounts = generator.countShotOperators(shot)
+    results.append(measure("generate shot (optimized graph)", generateOptimizedGraph, repeat))
+    optimizedCounts = generator.countShotOperators(shot)
+    results.append(measure("regenerate one bone flex driver", lambda: generator.regenerateBoneFlexDriver(shot, firstBoneFlexDriver), repeat))
+    results.append(measure("update one expression", lambda: generator.updateBoneFlexDriverExpression(firstBoneFlexDriver), repeat))
+    results.append(measure("prune shared operators", lambda: generator.pruneSharedOperators(shot), repeat))
+    exported = {}
+    def exportAll():
+        for i in range(shot.animationSets.count()):
+            animSetName = shot.animationSets[i].GetName()
+            exported[animSetName] = engine.exportBoneFlexDrivers(shot, animSetName)
+    results.append(measure("export every animation set", exportAll, repeat))
+    importShot = createSession(animationSetCount, controlCount, 0, "shot2")
+    def importAll():
+        while engine.getBoneFlexDrivers(importShot, True).count() > 0:
+            engine.getBoneFlexDrivers(importShot).remove(0)
+        for i in range(importShot.animationSets.count()):
+            animationSet = importShot.animationSets[i]
+            engine.importBoneFlexDrivers(importShot, animationSet, exported.get(animationSet.GetName(), []), [])
+    results.append(measure("import every animation set", importAll, repeat))
+    sessionData = engine.exportSession([shot])
+    libraryFile, libraryFileName = tempfile.mkstemp(".jsonl")
+    os.close(libraryFile)
+    jsonFile, jsonFileName = tempfile.mkstemp(".json")
+    os.close(jsonFile)
+    try:
+        library.saveLibrary(libraryFileName, sessionData["models"])
+        engine.saveBoneFlexDriversFile(jsonFileName, sessionData)
+        modelName = engine.getModelName(shot.animationSets[0])
+        results.append(measure("read one model (session JSON)", lambda: engine.loadBoneFlexDriversFile(jsonFileName)["models"][modelName], repeat))
+        results.append(measure("read one model (library)", lambda: library.loadLibraryModel(libraryFileName, modelName), repeat))
+    finally:
+        os.remove(libraryFileName)
+        os.remove(jsonFileName)
+    return results, fullCounts, optimizedCounts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Bone Flex Drivers engine on synthetic shots.")
+    parser.add_argument("--animation-sets", type=int, default=4, help="animation sets in the shot")
+    parser.add_argument("--controls", type=int, default=64, help="bone controls per animation set")
+    parser.add_argument("--drivers", type=int, default=32, help="bone flex drivers (and flexes) per animation set")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per operation, the best time is reported")
+    args = parser.parse_args(argv)
+    results, fullCounts, optimizedCounts = runBenchmark(args.animation_sets, args.controls, args.drivers, args.repeat)
+    print("%d animation set(s) x %d control(s) x %d bone flex driver(s)" % (args.animation_sets, args.controls, args.drivers))
+    print("%-34s %12s %12s %12s" % ("operation", "time (ms)", "elements", "lookups"))
+    for name, milliseconds, elements, lookups in results:
+        print("%-34s %12.3f %12d %12d" % (name, milliseconds, elements, lookups))
+    print("full graph: %d operator(s), %d attribute reference(s)" % (fullCounts[1], fullCounts[2]))
+    print("optimized graph: %d operator(s), %d attribute reference(s)" % (optimizedCounts[1], optimizedCounts[2]))
+    cacheStats = engine.expressionCache.getStats()
+    print("expression cache: %d hit(s), %d miss(es), %d entries" % (cacheStats["hits"], cacheStats["misses"], cacheStats["size"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Bone Flex Drivers command line for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Applies bone flex driver files to keyvalues2 session files and regenerates their operators without SFM:
+#   python scripts/sfm/boneflexdrivers/cli.py --library drivers.jsonl --output-dir out sessions/*.dmx
+#   python -m boneflexdrivers --regenerate --in-place --jobs 4 sessions/*.dmx
+
+
+import os
+import sys
+import inspect
+import argparse
+import multiprocessing
+import timeit
+
+if __name__ == "__main__" and __package__ is None:
+    # the boneflexdrivers package lives in scripts/sfm
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+from boneflexdrivers import engine, library, localdm, dmx
+
+engine.setDatamodel(localdm)
+
+def loadBoneFlexDriversByModel(fileName, modelNames, modelName=None):
+    """
+    Reads a dictionary of model paths to exported JSON entries from a library, session JSON
+    or JSON file of a single animation set, which is applied to modelName.
+    Only the sections of the given models are read from libraries.
+    """
+    if library.isLibraryFile(fileName):
+        return library.loadLibrary(fileName, modelNames)
+    boneFlexDriversToLoad = engine.loadBoneFlexDriversFile(fileName)
+    if engine.isSessionData(boneFlexDriversToLoad):
+        return boneFlexDriversToLoad.get("models")
+    if not modelName:
+        raise ValueError("A model path is needed to apply the bone flex drivers of a single animation set")
+    return {modelName: boneFlexDriversToLoad}
+
+def replaceFile(source, destination):
+    """
+    Moves a file over another, which os.rename() refuses to do on Windows.
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+        return
+    if os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+def processFile(fileName, outputFileName, libraryFileName=None, modelName=None, regenerate=False, optimizedGraph=True):
+    """
+    Reads a session, applies bone flex drivers from a file to every animation set of a matching model,
+    generates the operators of the applied bone flex drivers (or of every bone flex driver with regenerate)
+    and writes the session to outputFileName.
+    Returns a dictionary of counts for the summary.
+    """
+    start = timeit.default_timer()
+    localdm.resetStats()
+    # only the elements the drivers touch are read from the session, and only the changed ones are written back
+    document = dmx.readLazyDmx(fileName)
+    # write next to the output and move it over, so a failed write never truncates a session
+    temporaryFileName = outputFileName + ".tmp"
+    try:
+        summary = applyBoneFlexDrivers(document, libraryFileName, modelName, regenerate, optimizedGraph)
+        dmx.writeLazyDmx(temporaryFileName, document)
+    except Exception:
+        if os.path.exists(temporaryFileName):
+            os.remove(temporaryFileName)
+        raise
+    finally:
+        # the session is copied while it is written, so it can only be replaced once it is closed
+        document.close()
+    replaceFile(temporaryFileName, outputFileName)
+    summary["loaded"] = document.loadCount
+    summary["indexed"] = len(document.index.spans)
+    summary["elements"] = localdm.stats["elements"]
+    summary["seconds"] = timeit.default_timer() - start
+    return summary
+
+def applyBoneFlexDrivers(document, libraryFileName, modelName, regenerate, optimizedGraph):
+    """
+    Applies bone flex drivers to the shots of a document and generates their operators, see processFile().
+    Returns a dictionary of counts for the summary.
+    """
+    shots = dmx.getShots(document.root)
+    generator = engine.OperatorGenerator(optimizedGraph)
+    summary = {"shots": len(shots), "imported": 0, "skipped": 0, "removed": 0}
+    importedShots = []
+    if libraryFileName:
+        boneFlexDriversByModel = loadBoneFlexDriversByModel(libraryFileName, engine.getSessionModelNames(shots), modelName)
+        importedShots, results = engine.importSession(shots, boneFlexDriversByModel)
+        summary["imported"] = len([result for result in results if result.imported])
+        summary["skipped"] = len(results) - summary["imported"]
+    if regenerate:
+        # the same regeneration as the window's generateOperators()
+        for shot in shots:
+            summary["removed"] += generator.generateShot(shot)
+    else:
+        for shot, elements in importedShots:
+            summary["removed"] += generator.generateBoneFlexDrivers(shot, elements)
+    boneFlexDriverCount = 0
+    operatorCount = 0
+    for shot in shots:
+        counts = generator.countShotOperators(shot)
+        boneFlexDriverCount += counts[0]
+        operatorCount += counts[1]
+    summary["boneFlexDrivers"] = boneFlexDriverCount
+    summary["operators"] = operatorCount
+    return summary
+
+def processFileTask(task):
+    """
+    Runs processFile() in a worker process, returning the file name with its summary or error message.
+    """
+    fileName = task[0]
+    try:
+        return fileName, processFile(*task), None
+    except Exception as e:
+        return fileName, None, str(e)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply bone flex drivers to keyvalues2 DMX sessions and regenerate their operators without SFM.")
+    parser.add_argument("files", nargs="+", help="keyvalues2 DMX session files")
+    parser.add_argument("--library", help="library, session JSON or animation set JSON file of bone flex drivers to apply to animation sets of matching models")
+    parser.add_argument("--model", help="model path to apply the bone flex drivers of an animation set JSON file to")
+    parser.add_argument("--regenerate", action="store_true", help="regenerate the operators of every bone flex driver")
+    parser.add_argument("--full-graph", action="store_true", help="generate the full operator graph instead of sharing unpack stages")
+    parser.add_argument("--output-dir", help="folder to write processed sessions to, with their file names")
+    parser.add_argument("--in-place", action="store_true", help="overwrite the sessions")
+    parser.add_argument("--jobs", type=int, default=0, help="sessions processed at once, defaults to the number of processors")
+    args = parser.parse_args(argv)
+    if not args.library and not args.regenerate:
+        parser.error("nothing to do, pass --library and/or --regenerate")
+    if bool(args.output_dir) == bool(args.in_place):
+        parser.error("pass either --output-dir or --in-place")
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    tasks = []
+    for fileName in args.files:
+        outputFileName = fileName if args.in_place else os.path.join(args.output_dir, os.path.basename(fileName))
+        tasks.append((fileName, outputFileName, args.library, args.model, args.regenerate, not args.full_graph))
+    jobs = min(args.jobs or multiprocessing.cpu_count(), len(tasks))
+    start = timeit.default_timer()
+    if jobs <= 1:
+        outcomes = [processFileTask(task) for task in tasks]
+    else:
+        # sessions share nothing, so each is read, processed and written by its own process
+        pool = multiprocessing.Pool(jobs)
+        try:
+            outcomes = pool.map(processFileTask, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    failedCount = 0
+    print("%-40s %8s %10s %10s %10s %10s %15s %10s" % ("file", "shots", "drivers", "imported", "skipped", "operators", "elements read", "time (s)"))
+    for fileName, summary, error in outcomes:
+        if error is not None:
+            failedCount += 1
+            print("%-40s error: %s" % (os.path.basename(fileName), error))
+            continue
+        print("%-40s %8d %10d %10d %10d %10d %15s %10.3f" % (os.path.basename(fileName), summary["shots"], summary["boneFlexDrivers"], summary["imported"], summary["skipped"], summary["operators"], "%d/%d" % (summary["loaded"], summary["indexed"]), summary["seconds"]))
+    print("%d of %d session(s) processed in %.3f s with %d process(es)" % (len(tasks) - failedCount, len(tasks), timeit.default_timer() - start, jobs))
+    return 1 if failedCount > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
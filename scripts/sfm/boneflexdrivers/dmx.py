@@ -0,0 +1,927 @@
+# Bone Flex Drivers DMX reader and writer for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Reads keyvalues2 text DMX files, such as SFM sessions, into local datamodel elements and writes them back,
+# so bone flex driver operators can be generated for sessions outside of SFM.
+# Files are tokenized as they are read, so a session is never held in memory as both text and elements.
+
+
+import io
+import os
+import re
+
+from boneflexdrivers import localdm
+
+chunkSize = 1 << 20 # bytes read from a file at a time
+
+headerPattern = re.compile(br'<!--\s*dmx\s+encoding\s+(\S+)\s+(\d+)\s+format\s+(\S+)\s+(\d+)\s*-->')
+# whitespace, comments, quoted strings, symbols and bare words
+tokenPattern = re.compile(br'\s+|//[^\n]*|"((?:[^"\\]|\\.)*)"|([{}\[\],])|([^\s{}\[\],"/]+)', re.S)
+escapePattern = re.compile(r'\\(.)', re.S)
+escapes = {"n": "\n", "t": "\t", "v": "\v", "b": "\b", "r": "\r", "f": "\f", "a": "\a"}
+# characters written as an escape sequence, the reverse of escapes along with backslashes and quotes
+escapedCharacters = dict([(character, "\\" + escapeName) for escapeName, character in escapes.items()])
+escapedCharacters.update({"\\": "\\\\", "\"": "\\\""})
+escapedCharacterPattern = re.compile(r'[\\"\x00-\x1f]')
+
+# keyvalues2 types read as values, other types are kept as written, see RawValue
+valueTypes = {
+    "int": localdm.AT_INT,
+    "float": localdm.AT_FLOAT,
+    "bool": localdm.AT_BOOL,
+    "string": localdm.AT_STRING,
+    "time": localdm.AT_TIME,
+    "vector3": localdm.AT_VECTOR3,
+    "quaternion": localdm.AT_QUATERNION,
+}
+arrayTypes = {
+    "float_array": (localdm.AT_FLOAT_ARRAY, "float"),
+    "time_array": (localdm.AT_TIME_ARRAY, "time"),
+    "vector3_array": (localdm.AT_VECTOR3_ARRAY, "vector3"),
+    "quaternion_array": (localdm.AT_QUATERNION_ARRAY, "quaternion"),
+}
+# keyvalues2 value types without an array suffix, written as a single string
+rawTypes = ("void", "color", "vector2", "vector4", "qangle", "matrix", "binary")
+typeNames = dict([(attributeType, typeName) for typeName, attributeType in valueTypes.items()])
+typeNames.update([(attributeType, typeName) for typeName, (attributeType, valueTypeName) in arrayTypes.items()])
+typeNames[localdm.AT_ELEMENT] = "element"
+typeNames[localdm.AT_ELEMENT_ARRAY] = "element_array"
+
+TOKEN_STRING = 0
+TOKEN_SYMBOL = 1
+TOKEN_ELEMENT = 2 # an inline element left out of a lazily read element's tokens, see LazyDmxDocument
+
+class RawValue(object):
+    """
+    The text of an attribute whose type the engine never reads, such as a color or binary blob,
+    kept as written so it is saved unchanged. Arrays hold a list of texts.
+    """
+    __slots__ = ("typeName", "text")
+    def __init__(self, typeName, text):
+        self.typeName = typeName
+        self.text = text
+
+class DmxDocument(object):
+    """
+    The root element of a DMX file and its header's encoding and format.
+    """
+    def __init__(self, root, formatName="sfm_session", formatVersion=22, encodingVersion=1):
+        self.root = root
+        self.formatName = formatName
+        self.formatVersion = formatVersion
+        self.encodingVersion = encodingVersion
+    def getHeader(self):
+        return "<!-- dmx encoding keyvalues2 %d format %s %d -->\n" % (self.encodingVersion, self.formatName, self.formatVersion)
+
+def unescape(text):
+    return escapePattern.sub(lambda match: escapes.get(match.group(1), match.group(1)), text)
+
+def iterTokens(fileObject, offset=0):
+    """
+    Yields (kind, text, offset) tokens from a binary file object, reading it a chunk at a time.
+    Quoted strings are unescaped and decoded from UTF-8, comments are skipped.
+    """
+    buffer = b""
+    position = 0
+    endOfFile = False
+    while True:
+        match = tokenPattern.match(buffer, position)
+        if match is None or (match.end() == len(buffer) and not endOfFile):
+            # the next token may continue in the next chunk
+            if endOfFile:
+                if position < len(buffer):
+                    raise ValueError("Unexpected character at byte %d of DMX file" % (offset + position))
+                return
+            chunk = fileObject.read(chunkSize)
+            endOfFile = not chunk
+            offset += position
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        quoted, symbol, word = match.groups()
+        if quoted is not None:
+            text = quoted.decode("utf-8", "replace")
+            yield (TOKEN_STRING, unescape(text) if "\\" in text else text, offset + position)
+        elif symbol is not None:
+            yield (TOKEN_SYMBOL, symbol.decode("ascii"), offset + position)
+        elif word is not None:
+            yield (TOKEN_STRING, word.decode("utf-8", "replace"), offset + position)
+        position = match.end()
+
+def readHeader(fileObject):
+    """
+    Reads the header comment of a DMX file, returning its encoding, encoding version, format and format version.
+    Raises ValueError if the file is not a keyvalues2 text DMX file.
+    """
+    match = headerPattern.match(fileObject.readline().strip())
+    if match is None:
+        raise ValueError("Not a DMX file")
+    encoding = match.group(1).decode("ascii")
+    if encoding != "keyvalues2":
+        raise ValueError("Only keyvalues2 text DMX files are supported, not '%s'" % encoding)
+    return encoding, int(match.group(2)), match.group(3).decode("ascii"), int(match.group(4))
+
+def parseValue(typeName, text):
+    """
+    Converts the text of a keyvalues2 value to the value the local datamodel stores.
+    """
+    if typeName == "int":
+        return int(text)
+    if typeName == "float":
+        return float(text)
+    if typeName == "bool":
+        return text.strip() not in ("0", "", "false")
+    if typeName == "time":
+        return localdm.DmeTime_t(float(text))
+    if typeName == "vector3":
+        return localdm.Vector(*[float(component) for component in text.split()])
+    if typeName == "quaternion":
+        return localdm.Quaternion(*[float(component) for component in text.split()])
+    return text
+
+class DmxReader(object):
+    """
+    Builds local datamodel elements from the tokens of a keyvalues2 file in a single pass.
+    Element references by id are resolved once every element has been read.
+    """
+    def __init__(self, tokens, fileId=0):
+        self.tokens = tokens
+        self.fileId = fileId
+        self.elementsById = {}
+        self.references = [] # (element, attribute name, array index or None, referenced id)
+    def nextToken(self):
+        try:
+            return next(self.tokens)
+        except StopIteration:
+            raise ValueError("Unexpected end of DMX file")
+    def expectSymbol(self, symbol):
+        kind, text, offset = self.nextToken()
+        if kind != TOKEN_SYMBOL or text != symbol:
+            raise ValueError("Expected '%s' at byte %d of DMX file, found '%s'" % (symbol, offset, text))
+    def readDocument(self):
+        """
+        Reads every top-level element and returns the first, which is the root.
+        """
+        root = None
+        for kind, text, offset in self.tokens:
+            if kind != TOKEN_STRING:
+                raise ValueError("Expected an element type at byte %d of DMX file, found '%s'" % (offset, text))
+            element = self.readElement(text)
+            if root is None:
+                root = element
+        self.resolveReferences()
+        return root
+    def readElement(self, elementType):
+        """
+        Reads the body of an element whose type was just read.
+        """
+        kind, text, offset = self.nextToken()
+        if kind == TOKEN_ELEMENT:
+            return self.getReference(text) # an inline element left out of a lazily read element
+        if kind != TOKEN_SYMBOL or text != "{":
+            raise ValueError("Expected '{' at byte %d of DMX file, found '%s'" % (offset, text))
+        uniqueId, attributes, references = self.readAttributes()
+        element = localdm.loadElement(elementType, uniqueId, self.fileId, attributes)
+        if uniqueId is not None:
+            self.elementsById[uniqueId] = element
+        for name, index, referencedId in references:
+            self.references.append((element, name, index, referencedId))
+        return element
+    def getReference(self, referencedId):
+        """
+        Returns the element an attribute references by id while reading, or None to resolve it once every element is read.
+        """
+        return None
+    def readAttributes(self):
+        """
+        Reads the attributes of an element body up to its closing brace.
+        Returns the element's id, its (name, type, value) attributes,
+        and the (name, array index or None, id) of every element it references by id.
+        """
+        uniqueId = None
+        attributes = []
+        references = []
+        while True:
+            kind, name, offset = self.nextToken()
+            if kind == TOKEN_SYMBOL and name == "}":
+                return uniqueId, attributes, references
+            if kind != TOKEN_STRING:
+                raise ValueError("Expected an attribute name at byte %d of DMX file, found '%s'" % (offset, name))
+            kind, typeName, offset = self.nextToken()
+            if typeName == "elementid":
+                uniqueId = self.nextToken()[1]
+            elif typeName == "element":
+                referencedId = self.nextToken()[1]
+                attributes.append((name, localdm.AT_ELEMENT, self.getReference(referencedId) if referencedId else None))
+                if referencedId:
+                    references.append((name, None, referencedId))
+            elif typeName == "element_array":
+                array = localdm.ElementArray()
+                for item in self.readArray(True):
+                    if item is None or isinstance(item, localdm.Element):
+                        array.AddToTail(item)
+                    elif item:
+                        references.append((name, array.AddToTail(self.getReference(item)), item))
+                    else:
+                        array.AddToTail(None)
+                attributes.append((name, localdm.AT_ELEMENT_ARRAY, array))
+            elif typeName.endswith("_array"):
+                texts = self.readArray(False)
+                if typeName in arrayTypes:
+                    attributeType, valueTypeName = arrayTypes[typeName]
+                    attributes.append((name, attributeType, [parseValue(valueTypeName, text) for text in texts]))
+                else:
+                    attributes.append((name, typeName, RawValue(typeName, texts)))
+            elif typeName in valueTypes or typeName in rawTypes:
+                text = self.nextToken()[1]
+                if typeName in valueTypes:
+                    attributes.append((name, valueTypes[typeName], parseValue(typeName, text)))
+                else:
+                    attributes.append((name, typeName, RawValue(typeName, text)))
+            else:
+                # an inline element, written as its type followed by its body
+                attributes.append((name, localdm.AT_ELEMENT, self.readElement(typeName)))
+    def readArray(self, elementArray):
+        """
+        Reads a bracketed array, returning the text of each value,
+        or for element arrays the id of each referenced element and the element of each inline element.
+        """
+        self.expectSymbol("[")
+        items = []
+        while True:
+            kind, text, offset = self.nextToken()
+            if kind == TOKEN_SYMBOL:
+                if text == "]":
+                    return items
+                if text == ",":
+                    continue
+                raise ValueError("Unexpected '%s' at byte %d of DMX file" % (text, offset))
+            if not elementArray:
+                items.append(text)
+            elif text == "element":
+                items.append(self.nextToken()[1])
+            else:
+                items.append(self.readElement(text))
+    def resolveReferences(self):
+        """
+        Points every attribute written as an element id at its element, or at None if the element is missing.
+        """
+        for element, name, index, referencedId in self.references:
+            referencedElement = self.elementsById.get(referencedId)
+            if index is None:
+                element.SetValue(name, referencedElement)
+            else:
+                getAttributeValue(element, name).items[index] = referencedElement
+        self.references = []
+
+def readDmx(fileName, fileId=0):
+    """
+    Reads a keyvalues2 DMX file into local datamodel elements and returns its document.
+    Raises ValueError if the file is not a keyvalues2 DMX file or is malformed.
+    """
+    with io.open(fileName, "rb") as f:
+        encoding, encodingVersion, formatName, formatVersion = readHeader(f)
+        root = DmxReader(iterTokens(f, f.tell()), fileId).readDocument()
+    if root is None:
+        raise ValueError("DMX file has no elements")
+    return DmxDocument(root, formatName, formatVersion, encodingVersion)
+
+def escapeCharacter(match):
+    character = match.group(0)
+    escaped = escapedCharacters.get(character)
+    if escaped is None:
+        raise ValueError("Strings with the control character %r cannot be written to a keyvalues2 DMX file" % character)
+    return escaped
+
+def escape(text):
+    """
+    Escapes a string for a keyvalues2 quoted string, raising ValueError for control characters keyvalues2 has no escape for.
+    """
+    return escapedCharacterPattern.sub(escapeCharacter, text)
+
+def formatFloat(value):
+    """
+    Formats a float with as few digits as read back exactly, without a trailing ".0".
+    """
+    text = repr(float(value))
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text
+
+def formatValue(attributeType, value):
+    """
+    Returns the keyvalues2 text of a value the local datamodel stores.
+    """
+    if attributeType in (localdm.AT_FLOAT, localdm.AT_FLOAT_ARRAY):
+        return formatFloat(value)
+    if attributeType == localdm.AT_BOOL:
+        return "1" if value else "0"
+    if attributeType in (localdm.AT_TIME, localdm.AT_TIME_ARRAY):
+        return formatFloat(value.GetSeconds())
+    if attributeType in (localdm.AT_VECTOR3, localdm.AT_VECTOR3_ARRAY):
+        return "%s %s %s" % (formatFloat(value.x), formatFloat(value.y), formatFloat(value.z))
+    if attributeType in (localdm.AT_QUATERNION, localdm.AT_QUATERNION_ARRAY):
+        return "%s %s %s %s" % (formatFloat(value.x), formatFloat(value.y), formatFloat(value.z), formatFloat(value.w))
+    if attributeType == localdm.AT_INT:
+        return str(int(value))
+    return localdm.toText(value)
+
+def getAttributeValue(element, name):
+    # logs override GetValue() with their value at a time
+    return localdm.Element.GetValue(element, name)
+
+def iterElementReferences(element):
+    """
+    Yields every element an element's attributes reference, once per reference.
+    """
+    for name in element.GetAttributeNames():
+        attributeType = element.GetAttributeType(name)
+        if attributeType == localdm.AT_ELEMENT:
+            if getAttributeValue(element, name) is not None:
+                yield getAttributeValue(element, name)
+        elif attributeType == localdm.AT_ELEMENT_ARRAY:
+            for item in getAttributeValue(element, name):
+                if item is not None:
+                    yield item
+
+def countReferences(root):
+    """
+    Walks every element reachable from the root, returning them in the order they are found
+    and the number of references to each, keyed by unique id.
+    """
+    elements = [root]
+    referenceCounts = {root.GetId().__str__(): 0}
+    stack = [root]
+    while stack:
+        for child in iterElementReferences(stack.pop()):
+            uniqueId = child.GetId().__str__()
+            if uniqueId in referenceCounts:
+                referenceCounts[uniqueId] += 1
+                continue
+            referenceCounts[uniqueId] = 1
+            elements.append(child)
+            stack.append(child)
+    return elements, referenceCounts
+
+class DmxWriter(object):
+    """
+    Writes elements as keyvalues2 text, like SFM: the root and every element referenced more than once
+    are written at the top level and referenced by id, other elements are written inline where they are referenced.
+    Elements no longer reachable from the root are dropped.
+    """
+    def __init__(self, fileObject):
+        self.fileObject = fileObject
+        self.referenceCounts = {}
+        self.pending = []
+    def write(self, text):
+        self.pending.append(text)
+    def flush(self):
+        """
+        Writes the text formatted so far to the file.
+        """
+        if self.pending:
+            self.fileObject.write("".join(self.pending).encode("utf-8"))
+            self.pending = []
+    def writeDocument(self, document):
+        elements, self.referenceCounts = countReferences(document.root)
+        self.fileObject.write(document.getHeader().encode("utf-8"))
+        for element in elements:
+            if element is document.root or self.referenceCounts[element.GetId().__str__()] > 1:
+                self.writeElement(element, "")
+                self.write("\n\n")
+                # every top-level element is written as soon as it is formatted
+                self.flush()
+    def isInline(self, element, child):
+        """
+        Returns True if a child element referenced by an element is written inline rather than by id.
+        """
+        return self.referenceCounts.get(child.GetId().__str__(), 0) == 1
+    def writeInlineElement(self, child, indent, writeType=True):
+        self.writeElement(child, indent, writeType)
+    def writeElement(self, element, indent, writeType=True):
+        """
+        Writes an element's type, unless it was written as an attribute's type, and its body up to the closing brace.
+        """
+        if writeType:
+            self.write("%s\"%s\"\n" % (indent, element.GetType()))
+        self.write("%s{\n" % indent)
+        attributeIndent = indent + "\t"
+        self.write("%s\"id\" \"elementid\" \"%s\"\n" % (attributeIndent, element.GetId().__str__()))
+        self.writeAttribute(element, "name", attributeIndent)
+        for name in element.GetAttributeNames():
+            if name != "name":
+                self.writeAttribute(element, name, attributeIndent)
+        self.write("%s}" % indent)
+    def writeAttribute(self, element, name, indent):
+        attributeType = element.GetAttributeType(name)
+        value = getAttributeValue(element, name)
+        quotedName = "%s\"%s\"" % (indent, escape(name))
+        if attributeType == localdm.AT_ELEMENT:
+            if value is not None and self.isInline(element, value):
+                self.write("%s \"%s\"\n" % (quotedName, value.GetType()))
+                self.writeInlineElement(value, indent, False)
+                self.write("\n")
+            else:
+                self.write("%s \"element\" \"%s\"\n" % (quotedName, value.GetId().__str__() if value is not None else ""))
+            return
+        if attributeType == localdm.AT_ELEMENT_ARRAY:
+            self.write("%s \"element_array\"\n%s[\n" % (quotedName, indent))
+            itemIndent = indent + "\t"
+            for i, child in enumerate(value):
+                if i > 0:
+                    self.write(",\n")
+                if child is not None and self.isInline(element, child):
+                    self.writeInlineElement(child, itemIndent)
+                else:
+                    self.write("%s\"element\" \"%s\"" % (itemIndent, child.GetId().__str__() if child is not None else ""))
+            self.write("\n%s]\n" % indent if len(value) > 0 else "%s]\n" % indent)
+            return
+        if isinstance(value, RawValue):
+            typeName = value.typeName
+            texts = value.text
+        else:
+            typeName = typeNames.get(attributeType, "string")
+            texts = [formatValue(attributeType, item) for item in value] if typeName.endswith("_array") else formatValue(attributeType, value)
+        if isinstance(texts, list):
+            self.write("%s \"%s\"\n%s[\n" % (quotedName, typeName, indent))
+            self.write(",\n".join(["%s\t\"%s\"" % (indent, escape(text)) for text in texts]))
+            self.write("\n%s]\n" % indent if texts else "%s]\n" % indent)
+        else:
+            self.write("%s \"%s\" \"%s\"\n" % (quotedName, typeName, escape(texts)))
+
+def writeDmx(fileName, document):
+    """
+    Writes a document to a keyvalues2 DMX file.
+    """
+    with io.open(fileName, "wb") as f:
+        DmxWriter(f).writeDocument(document)
+
+def getShots(root):
+    """
+    Returns the shots of a session, which are the film clips in the tracks of its active clip's sub-clip track group,
+    or every film clip with animation sets if the file is not laid out like a session.
+    """
+    shots = []
+    activeClip = getattr(root, "activeClip", None)
+    subClipTrackGroup = getattr(activeClip, "subClipTrackGroup", None) if activeClip is not None else None
+    if subClipTrackGroup is not None:
+        for track in getattr(subClipTrackGroup, "tracks", []):
+            if track is None:
+                continue
+            for child in getattr(track, "children", []):
+                if child is not None and child.GetType() == "DmeFilmClip":
+                    shots.append(child)
+        return shots
+    elements, referenceCounts = countReferences(root)
+    return [element for element in elements if element.GetType() == "DmeFilmClip" and element.HasAttribute("animationSets")]
+
+# Lazy reading: a single pass indexes the byte offsets of every element, which is then read when it is first used,
+# and only the elements that changed are written back.
+
+STATE_NAME = 0
+STATE_TYPE = 1
+STATE_VALUE = 2
+
+class DmxIndex(object):
+    """
+    The byte offsets of every element with an id in a keyvalues2 file, found in a single pass without creating elements.
+    """
+    def __init__(self):
+        self.spans = {} # id -> [type, offset of "{", offset after "}", id of the element it is written inline in or None]
+        self.children = {} # id -> ids of the elements written inline in it, in file order
+        self.topLevel = [] # (offset of the type, offset after "}", id or None) of each top-level element
+        self.referenceCounts = {} # id -> number of references by id
+    def getReferenceCount(self, uniqueId):
+        """
+        Returns the number of attributes referencing an element in the file, by id or by writing it inline.
+        """
+        span = self.spans.get(uniqueId)
+        return self.referenceCounts.get(uniqueId, 0) + (1 if span is not None and span[3] is not None else 0)
+    def scan(self, tokens):
+        """
+        Indexes the elements of a file from its tokens, following the keyvalues2 grammar
+        just enough to find element bodies, ids and references.
+        """
+        # element frames are [True, state, attribute type, type, offset of "{", offset of the type, id, child ids],
+        # array frames are [False, is an element array, pending element type, expecting an id]
+        stack = []
+        pendingType = None
+        referenceCounts = self.referenceCounts
+        for kind, text, offset in tokens:
+            if not stack:
+                if kind == TOKEN_STRING:
+                    pendingType = (text, offset)
+                elif text == "{" and pendingType is not None:
+                    stack.append([True, STATE_NAME, None, pendingType[0], offset, pendingType[1], None, []])
+                    pendingType = None
+                else:
+                    raise ValueError("Unexpected '%s' at byte %d of DMX file" % (text, offset))
+                continue
+            frame = stack[-1]
+            if frame[0]:
+                state = frame[1]
+                if kind == TOKEN_SYMBOL:
+                    if text == "}" and state == STATE_NAME:
+                        self.addElement(stack.pop(), offset + 1, stack)
+                    elif text == "[" and state == STATE_VALUE and frame[2].endswith("_array"):
+                        frame[1] = STATE_NAME
+                        stack.append([False, frame[2] == "element_array", None, False])
+                    elif text == "{" and state == STATE_VALUE:
+                        frame[1] = STATE_NAME
+                        stack.append([True, STATE_NAME, None, frame[2], offset, None, None, []])
+                    else:
+                        raise ValueError("Unexpected '%s' at byte %d of DMX file" % (text, offset))
+                elif state == STATE_VALUE:
+                    if frame[2] == "elementid":
+                        frame[6] = text
+                    elif frame[2] == "element" and text:
+                        referenceCounts[text] = referenceCounts.get(text, 0) + 1
+                    frame[1] = STATE_NAME
+                else:
+                    if state == STATE_TYPE:
+                        frame[2] = text
+                    frame[1] = state + 1
+            elif kind == TOKEN_SYMBOL:
+                if text == "]":
+                    stack.pop()
+                elif text == "{" and frame[2] is not None:
+                    stack.append([True, STATE_NAME, None, frame[2], offset, None, None, []])
+                    frame[2] = None
+                elif text != ",":
+                    raise ValueError("Unexpected '%s' at byte %d of DMX file" % (text, offset))
+            elif frame[1]:
+                if frame[3]:
+                    if text:
+                        referenceCounts[text] = referenceCounts.get(text, 0) + 1
+                    frame[3] = False
+                elif text == "element":
+                    frame[3] = True
+                else:
+                    frame[2] = text
+        if stack or pendingType is not None:
+            raise ValueError("Unexpected end of DMX file")
+    def addElement(self, frame, end, stack):
+        """
+        Records an element whose closing brace was just read.
+        Elements without an id are read as part of the element they are written in.
+        """
+        uniqueId = frame[6]
+        parentFrame = None
+        for candidate in reversed(stack):
+            if candidate[0]:
+                parentFrame = candidate
+                break
+        if uniqueId is None:
+            if parentFrame is not None:
+                parentFrame[7].extend(frame[7])
+            else:
+                self.topLevel.append((frame[5], end, None))
+            return
+        self.spans[uniqueId] = [frame[3], frame[4], end, None]
+        for childId in frame[7]:
+            self.spans[childId][3] = uniqueId
+        if frame[7]:
+            self.children[uniqueId] = frame[7]
+        if parentFrame is not None:
+            parentFrame[7].append(uniqueId)
+        else:
+            self.topLevel.append((frame[5], end, uniqueId))
+
+def getElementReferenceIds(element):
+    return [child.GetId().__str__() for child in iterElementReferences(element)]
+
+class LazyElementArray(localdm.ElementArray):
+    """
+    An element array of a lazily read element, marking the element dirty when it changes.
+    """
+    __slots__ = ("owner",)
+    def __init__(self, owner, items):
+        localdm.ElementArray.__init__(self)
+        self.owner = owner
+        self.items = items
+    def remove(self, index):
+        self.owner._dirty = True
+        localdm.ElementArray.remove(self, index)
+    def AddToTail(self, element):
+        self.owner._dirty = True
+        return localdm.ElementArray.AddToTail(self, element)
+
+class LazyElement(localdm.Element):
+    """
+    An element of a lazily read DMX file. Its id and type are known from the file's index,
+    and its attributes are read from the file the first time they are used.
+    Changes mark it dirty, so only changed elements are written back, see LazyDmxWriter.
+    """
+    def __init__(self, document, elementType, uniqueId):
+        self._loaded = True # the base class adds the type's default attributes, which loading replaces
+        localdm.Element.__init__(self, elementType, "", document.fileId, uniqueId)
+        self._document = document
+        self._loaded = False
+        self._dirty = False
+        self._sourceReferences = []
+    def _load(self):
+        if not self._loaded:
+            self._loaded = True
+            self._document.loadAttributes(self)
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        self._load()
+        return localdm.Element.__getattr__(self, name)
+    def GetName(self):
+        self._load()
+        return localdm.Element.GetName(self)
+    def SetName(self, name):
+        self._load()
+        self._dirty = True
+        localdm.Element.SetName(self, name)
+    def HasAttribute(self, name):
+        self._load()
+        return localdm.Element.HasAttribute(self, name)
+    def GetAttributeNames(self):
+        self._load()
+        return localdm.Element.GetAttributeNames(self)
+    def GetAttributeType(self, name):
+        self._load()
+        return localdm.Element.GetAttributeType(self, name)
+    def AddAttribute(self, name, attributeType):
+        self._load()
+        if not localdm.Element.HasAttribute(self, name):
+            self._dirty = True
+        return localdm.Element.AddAttribute(self, name, attributeType)
+    def RemoveAttribute(self, name):
+        self._load()
+        self._dirty = True
+        localdm.Element.RemoveAttribute(self, name)
+    def SetValue(self, name, value):
+        self._load()
+        self._dirty = True
+        localdm.Element.SetValue(self, name, value)
+    def GetValue(self, name):
+        self._load()
+        return localdm.Element.GetValue(self, name)
+
+class LazyDmxReader(DmxReader):
+    """
+    Reads the attributes of a single lazily read element, referencing other elements without reading them.
+    """
+    def __init__(self, tokens, document):
+        DmxReader.__init__(self, tokens, document.fileId)
+        self.document = document
+    def getReference(self, referencedId):
+        return self.document.getElement(referencedId)
+
+class LazyDmxDocument(DmxDocument):
+    """
+    A keyvalues2 DMX file indexed in a single pass, whose elements are read from the file when they are first used.
+    The file stays open until close() is called.
+    """
+    def __init__(self, fileName, fileId=0):
+        self.fileName = fileName
+        self.fileId = fileId
+        self.elements = {}
+        self.loadCount = 0
+        self.fileObject = io.open(fileName, "rb")
+        try:
+            encoding, encodingVersion, formatName, formatVersion = readHeader(self.fileObject)
+            self.index = DmxIndex()
+            self.index.scan(iterTokens(self.fileObject, self.fileObject.tell()))
+            if not self.index.topLevel or self.index.topLevel[0][2] is None:
+                raise ValueError("DMX file has no root element with an id")
+        except Exception:
+            self.fileObject.close()
+            raise
+        DmxDocument.__init__(self, self.getElement(self.index.topLevel[0][2]), formatName, formatVersion, encodingVersion)
+    def close(self):
+        self.fileObject.close()
+    def getElement(self, uniqueId):
+        """
+        Returns the element with the given id without reading its attributes, or None if the file has no such element.
+        """
+        element = self.elements.get(uniqueId)
+        if element is None:
+            span = self.index.spans.get(uniqueId)
+            if span is None:
+                return None
+            element = LazyElement(self, span[0], uniqueId)
+            self.elements[uniqueId] = element
+        return element
+    def readRange(self, start, end):
+        self.fileObject.seek(start)
+        return self.fileObject.read(end - start)
+    def iterElementTokens(self, uniqueId):
+        """
+        Yields the tokens of an element's body, with each element written inline in it replaced by a single token.
+        """
+        span = self.index.spans[uniqueId]
+        position = span[1]
+        for childId in self.index.children.get(uniqueId, ()):
+            childSpan = self.index.spans[childId]
+            for token in iterTokens(io.BytesIO(self.readRange(position, childSpan[1])), position):
+                yield token
+            yield (TOKEN_ELEMENT, childId, childSpan[1])
+            position = childSpan[2]
+        for token in iterTokens(io.BytesIO(self.readRange(position, span[2])), position):
+            yield token
+    def loadAttributes(self, element):
+        """
+        Reads the attributes of an element from the file.
+        """
+        reader = LazyDmxReader(self.iterElementTokens(element.GetId().__str__()), self)
+        reader.expectSymbol("{")
+        uniqueId, attributes, references = reader.readAttributes()
+        for i, (name, attributeType, value) in enumerate(attributes):
+            if attributeType == localdm.AT_ELEMENT_ARRAY:
+                attributes[i] = (name, attributeType, LazyElementArray(element, value.items))
+        localdm.setAttributes(element, attributes)
+        element._sourceReferences = getElementReferenceIds(element)
+        self.loadCount += 1
+
+class LazyDmxWriter(DmxWriter):
+    """
+    Writes a lazily read document by copying its file and rewriting only what changed:
+    dirty elements are formatted again where they were, elements no longer referenced are left out,
+    and new elements are written inline in the element referencing them, or at the end of the file when shared.
+    """
+    def __init__(self, fileObject):
+        DmxWriter.__init__(self, fileObject)
+        self.document = None
+        self.index = None
+        self.dirty = set()
+        self.dropped = set()
+        self.orphans = []
+        self.newElements = []
+        self.newCounts = {}
+        self.written = set()
+    def plan(self):
+        """
+        Finds the elements to format again, the elements to leave out, and the new elements to write.
+        """
+        index = self.index
+        dirtyElements = [element for element in self.document.elements.values() if element._loaded and element._dirty]
+        # how the references to each element changed
+        deltas = {}
+        for element in dirtyElements:
+            for uniqueId in element._sourceReferences:
+                deltas[uniqueId] = deltas.get(uniqueId, 0) - 1
+        for element in self.findNewElements(dirtyElements)[0]:
+            for uniqueId in getElementReferenceIds(element):
+                deltas[uniqueId] = deltas.get(uniqueId, 0) + 1
+        # leave out elements nothing references anymore, along with whatever only they referenced
+        rootId = self.document.root.GetId().__str__()
+        worklist = [uniqueId for uniqueId, delta in deltas.items() if delta < 0]
+        while worklist:
+            uniqueId = worklist.pop()
+            if uniqueId in self.dropped or uniqueId == rootId or uniqueId not in index.spans:
+                continue
+            if index.getReferenceCount(uniqueId) + deltas.get(uniqueId, 0) > 0:
+                continue
+            self.dropped.add(uniqueId)
+            element = self.document.getElement(uniqueId)
+            if element._loaded and element._dirty:
+                referenceIds = getElementReferenceIds(element)
+            else:
+                element._load()
+                referenceIds = element._sourceReferences
+            for referenceId in referenceIds:
+                deltas[referenceId] = deltas.get(referenceId, 0) - 1
+            worklist.extend(referenceIds)
+        dirtyElements = [element for element in dirtyElements if element.GetId().__str__() not in self.dropped]
+        self.dirty = set([element.GetId().__str__() for element in dirtyElements])
+        formattedElements, self.newCounts = self.findNewElements(dirtyElements)
+        self.newElements = formattedElements[len(dirtyElements):]
+        # elements written inline in an element that no longer references them, but still referenced by id elsewhere
+        for uniqueId in list(self.dirty) + list(self.dropped):
+            referenceIds = set() if uniqueId in self.dropped else set(getElementReferenceIds(self.document.getElement(uniqueId)))
+            for childId in index.children.get(uniqueId, ()):
+                if childId not in self.dropped and childId not in referenceIds:
+                    self.orphans.append(childId)
+    def findNewElements(self, dirtyElements):
+        """
+        Returns the dirty elements followed by every new element they reference, directly or through other new elements,
+        and the number of references to each new element.
+        """
+        formattedElements = list(dirtyElements)
+        newCounts = {}
+        i = 0
+        while i < len(formattedElements):
+            for child in iterElementReferences(formattedElements[i]):
+                if isinstance(child, LazyElement):
+                    continue
+                uniqueId = child.GetId().__str__()
+                if uniqueId not in newCounts:
+                    newCounts[uniqueId] = 0
+                    formattedElements.append(child)
+                newCounts[uniqueId] += 1
+            i += 1
+        return formattedElements, newCounts
+    def isInline(self, element, child):
+        uniqueId = child.GetId().__str__()
+        if isinstance(child, LazyElement):
+            # elements of the file stay inline in the element they were written in
+            return self.index.spans[uniqueId][3] == element.GetId().__str__() and uniqueId not in self.written and uniqueId not in self.dropped
+        return self.newCounts.get(uniqueId, 0) == 1
+    def writeInlineElement(self, child, indent, writeType=True):
+        if not isinstance(child, LazyElement):
+            self.writeElement(child, indent, writeType)
+            return
+        uniqueId = child.GetId().__str__()
+        self.written.add(uniqueId)
+        if writeType:
+            self.write("%s\"%s\"\n" % (indent, child.GetType()))
+        self.writeSource(uniqueId, indent)
+    def writeSource(self, uniqueId, indent):
+        """
+        Writes the body of an element of the file, formatting it again if it is dirty,
+        or copying it from the file with its dirty inline elements formatted again.
+        """
+        if uniqueId in self.dirty:
+            self.writeElement(self.document.getElement(uniqueId), indent, False)
+            return
+        span = self.index.spans[uniqueId]
+        self.write(indent)
+        self.copyRange(span[1], span[2], self.getReplacements(uniqueId))
+    def getReplacements(self, withinId):
+        """
+        Returns the (start, end, id) of the dirty elements written inline in an element, or at the top level for None,
+        that are not written inline in another dirty element.
+        """
+        spans = self.index.spans
+        replacements = []
+        for uniqueId in self.dirty:
+            parentId = spans[uniqueId][3]
+            while parentId is not None and parentId != withinId and parentId not in self.dirty and parentId not in self.dropped:
+                parentId = spans[parentId][3]
+            if parentId == withinId:
+                replacements.append((spans[uniqueId][1], spans[uniqueId][2], uniqueId))
+        replacements.sort()
+        return replacements
+    def getIndent(self, start, position):
+        """
+        Returns the whitespace between the start of a line and an offset, if nothing else precedes it on the line.
+        """
+        data = self.document.readRange(max(position, start - 256), start)
+        indent = data[data.rfind(b"\n") + 1:]
+        if indent.strip() or len(indent) == len(data) and start - len(data) > position:
+            return b""
+        return indent
+    def copyBytes(self, start, end):
+        self.flush()
+        while start < end:
+            data = self.document.readRange(start, min(end, start + chunkSize))
+            self.fileObject.write(data)
+            start += len(data)
+    def copyRange(self, start, end, replacements):
+        """
+        Copies a range of the file, writing the given dirty elements in place of their bodies and leaving out dropped ones.
+        """
+        position = start
+        for replacementStart, replacementEnd, uniqueId in replacements:
+            if uniqueId is None:
+                self.copyBytes(position, replacementStart)
+            else:
+                indent = self.getIndent(replacementStart, position)
+                self.copyBytes(position, replacementStart - len(indent))
+                self.writeSource(uniqueId, indent.decode("utf-8"))
+            position = replacementEnd
+        self.copyBytes(position, end)
+    def writeDocument(self, document):
+        self.document = document
+        self.index = document.index
+        self.plan()
+        replacements = self.getReplacements(None)
+        for start, end, uniqueId in self.index.topLevel:
+            if uniqueId in self.dropped:
+                # leave out the element along with the blank lines after it
+                following = document.readRange(end, end + 16)
+                replacements.append((start, end + len(following) - len(following.lstrip()), None))
+        replacements.sort()
+        document.fileObject.seek(0, 2)
+        self.copyRange(0, document.fileObject.tell(), replacements)
+        for uniqueId in self.orphans:
+            self.write("\"%s\"\n" % self.index.spans[uniqueId][0])
+            self.writeSource(uniqueId, "")
+            self.write("\n\n")
+            self.flush()
+        for element in self.newElements:
+            if self.newCounts[element.GetId().__str__()] > 1:
+                self.writeElement(element, "")
+                self.write("\n\n")
+                self.flush()
+
+def readLazyDmx(fileName, fileId=0):
+    """
+    Indexes a keyvalues2 DMX file and returns its document, whose elements are read when they are first used.
+    Raises ValueError if the file is not a keyvalues2 DMX file or is malformed.
+    """
+    return LazyDmxDocument(fileName, fileId)
+
+def writeLazyDmx(fileName, document):
+    """
+    Writes a lazily read document to another file, rewriting only the elements that changed.
+    """
+    if os.path.abspath(fileName) == os.path.abspath(document.fileName):
+        raise ValueError("A lazily read DMX file is copied while it is written, so it cannot be written in place")
+    with io.open(fileName, "wb") as f:
+        LazyDmxWriter(f).writeDocument(document)
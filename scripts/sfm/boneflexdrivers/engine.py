@@ -0,0 +1,1141 @@
+# Bone Flex Drivers engine for Source Filmmaker (SFM)
+# Generates bone flex driver operators without any user interface
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# MIT License
+# 
+# Copyright (c) 2025 KiwifruitDev
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import hashlib
+import numbers
+from collections import OrderedDict
+
+from boneflexdrivers import evaluate
+
+try:
+    import vs
+except ImportError:
+    vs = None # set with setDatamodel() when running outside of SFM
+
+stringTypes = (str, type(u"")) # JSON strings are unicode in Python 2
+
+def setDatamodel(datamodel):
+    """
+    Sets the module used to create elements and attributes, in place of SFM's vs module.
+    """
+    global vs
+    vs = datamodel
+
+def getDatamodel():
+    """
+    Returns the module used to create elements and attributes.
+    """
+    return vs
+
+# elements visited by scans and lookups, and operators created, for profiling
+stats = {"reads": 0, "operators": 0}
+
+def resetStats():
+    stats["reads"] = 0
+    stats["operators"] = 0
+
+class BoneFlexDriver(object):
+    """
+    Settings of a single bone flex driver, independent of the element it is stored in.
+    """
+    __slots__ = ("name", "active", "flexName", "boneName", "minFlexRange", "maxFlexRange", "usePosition", "boneAxis", "minBoneRange", "maxBoneRange", "clamp", "boneDefaultPosition")
+    def __init__(self, name, flexName, boneName, active=True, minFlexRange=0.0, maxFlexRange=1.0, usePosition=False, boneAxis="X", minBoneRange=0.0, maxBoneRange=90.0, clamp=True, boneDefaultPosition=0.0):
+        self.name = name
+        self.active = active
+        self.flexName = flexName
+        self.boneName = boneName
+        self.minFlexRange = minFlexRange
+        self.maxFlexRange = maxFlexRange
+        self.usePosition = usePosition
+        self.boneAxis = boneAxis
+        self.minBoneRange = minBoneRange
+        self.maxBoneRange = maxBoneRange
+        self.clamp = clamp
+        self.boneDefaultPosition = boneDefaultPosition
+    @classmethod
+    def fromElement(cls, element):
+        """
+        Reads a bone flex driver from its element, using defaults for attributes added by later versions.
+        """
+        stats["reads"] += 1
+        return cls(
+            element.name.GetValue(),
+            element.flexName.GetValue(),
+            element.boneName.GetValue(),
+            active=element.active.GetValue(),
+            minFlexRange=element.minFlexRange.GetValue() if hasattr(element, "minFlexRange") else 0.0,
+            maxFlexRange=element.maxFlexRange.GetValue() if hasattr(element, "maxFlexRange") else 1.0,
+            usePosition=element.usePosition.GetValue() if hasattr(element, "usePosition") else False,
+            boneAxis=element.boneAxis.GetValue() if hasattr(element, "boneAxis") else "X",
+            minBoneRange=element.minBoneRange.GetValue() if hasattr(element, "minBoneRange") else 0.0,
+            maxBoneRange=element.maxBoneRange.GetValue() if hasattr(element, "maxBoneRange") else 90.0,
+            clamp=element.clamp.GetValue() if hasattr(element, "clamp") else True,
+            boneDefaultPosition=element.boneDefaultPosition.GetValue() if hasattr(element, "boneDefaultPosition") else 0.0,
+        )
+    @classmethod
+    def fromDict(cls, boneFlexDriverData):
+        """
+        Reads a bone flex driver from an exported JSON entry.
+        Raises ValueError if the entry is malformed or missing required fields.
+        """
+        if not isinstance(boneFlexDriverData, dict):
+            raise ValueError("Malformed bone flex driver entry: %s" % str(boneFlexDriverData))
+        for field in ("name", "flexName", "boneName", "boneAxis"):
+            if field in boneFlexDriverData and not isinstance(boneFlexDriverData[field], stringTypes):
+                raise ValueError("Field '%s' of bone flex driver must be a string: %s" % (field, str(boneFlexDriverData)))
+        for field in ("minFlexRange", "maxFlexRange", "minBoneRange", "maxBoneRange", "boneDefaultPosition"):
+            if field in boneFlexDriverData and (not isinstance(boneFlexDriverData[field], numbers.Real) or isinstance(boneFlexDriverData[field], bool)):
+                raise ValueError("Field '%s' of bone flex driver must be a number: %s" % (field, str(boneFlexDriverData)))
+        for field in ("active", "usePosition", "clamp"):
+            if field in boneFlexDriverData and not isinstance(boneFlexDriverData[field], bool):
+                raise ValueError("Field '%s' of bone flex driver must be true or false: %s" % (field, str(boneFlexDriverData)))
+        name = boneFlexDriverData.get("name", "").strip()
+        flexName = boneFlexDriverData.get("flexName", "").strip()
+        boneName = boneFlexDriverData.get("boneName", "").strip()
+        if not name or not flexName or not boneName:
+            raise ValueError("Missing required fields in bone flex driver: %s" % str(boneFlexDriverData))
+        boneAxis = boneFlexDriverData.get("boneAxis", "X").upper()
+        if boneAxis not in ("X", "Y", "Z"):
+            raise ValueError("Bone axis of bone flex driver must be X, Y or Z: %s" % str(boneFlexDriverData))
+        return cls(
+            name,
+            flexName,
+            boneName,
+            active=boneFlexDriverData.get("active", False),
+            minFlexRange=float(boneFlexDriverData.get("minFlexRange", 0.0)),
+            maxFlexRange=float(boneFlexDriverData.get("maxFlexRange", 1.0)),
+            usePosition=boneFlexDriverData.get("usePosition", True),
+            boneAxis=boneAxis,
+            minBoneRange=float(boneFlexDriverData.get("minBoneRange", 0.0)),
+            maxBoneRange=float(boneFlexDriverData.get("maxBoneRange", 90.0)),
+            clamp=boneFlexDriverData.get("clamp", True),
+            boneDefaultPosition=float(boneFlexDriverData.get("boneDefaultPosition", 0.0)),
+        )
+    def toDict(self):
+        """
+        Returns the bone flex driver as an exported JSON entry.
+        """
+        return {
+            "name": self.name,
+            "active": self.active,
+            "flexName": self.flexName,
+            "boneName": self.boneName,
+            "minFlexRange": self.minFlexRange,
+            "maxFlexRange": self.maxFlexRange,
+            "usePosition": self.usePosition,
+            "boneAxis": self.boneAxis,
+            "minBoneRange": self.minBoneRange,
+            "maxBoneRange": self.maxBoneRange,
+            "clamp": self.clamp,
+            "boneDefaultPosition": self.boneDefaultPosition,
+        }
+    def createElement(self, shot, animationSet):
+        """
+        Creates the element storing this bone flex driver in the shot's file.
+        """
+        element = vs.CreateElement("DmElement", self.name.encode('utf-8'), shot.GetFileId())
+        element.AddAttribute("active", vs.AT_BOOL).SetValue(self.active)
+        element.AddAttribute("flexName", vs.AT_STRING).SetValue(self.flexName.encode('utf-8'))
+        element.AddAttribute("boneName", vs.AT_STRING).SetValue(self.boneName.encode('utf-8'))
+        element.AddAttribute("minFlexRange", vs.AT_FLOAT).SetValue(self.minFlexRange)
+        element.AddAttribute("maxFlexRange", vs.AT_FLOAT).SetValue(self.maxFlexRange)
+        element.AddAttribute("usePosition", vs.AT_BOOL).SetValue(self.usePosition)
+        element.AddAttribute("boneAxis", vs.AT_STRING).SetValue(self.boneAxis.encode('utf-8'))
+        element.AddAttribute("minBoneRange", vs.AT_FLOAT).SetValue(self.minBoneRange)
+        element.AddAttribute("maxBoneRange", vs.AT_FLOAT).SetValue(self.maxBoneRange)
+        element.AddAttribute("clamp", vs.AT_BOOL).SetValue(self.clamp)
+        element.AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(self.boneDefaultPosition)
+        element.AddAttribute("generatedOperators", vs.AT_ELEMENT_ARRAY)
+        if animationSet is not None:
+            element.AddAttribute("animationSet", vs.AT_ELEMENT).SetValue(animationSet)
+        return element
+    def getComponents(self, optimizedGraph=True):
+        """
+        Returns the unpacked bone components that are connected to this bone flex driver's eval operator.
+        Rotation always needs the whole quaternion, while the optimized graph only connects the chosen axis of a translation.
+        """
+        if not self.usePosition:
+            return ["w", "x", "y", "z"]
+        if not optimizedGraph:
+            return ["x", "y", "z"]
+        axis = self.boneAxis.lower()
+        if axis not in ("x", "y", "z"):
+            axis = "x" # matches the expression's fallback axis
+        return [axis]
+    def buildExpression(self):
+        """
+        Builds the DmeExpressionOperator expression that maps this bone flex driver's bone channel to its flex value.
+        """
+        # if rotate is selected, use quaternion to euler conversion
+        isX = "rtod(atan2(2*(w*x + y*z), 1 - 2*(x*x + y*y)))"
+        isY = "rtod(asin(2*(w*y - z*x)))"
+        isZ = "rtod(atan2(2*(w*z + x*y), 1 - 2*(y*y + z*z)))"
+        if self.usePosition:
+            # if translate is selected, use the default position as a base and the min/max bone ranges as offsets
+            isX = "(x - %f)" % self.boneDefaultPosition
+            isY = "(y - %f)" % self.boneDefaultPosition
+            isZ = "(z - %f)" % self.boneDefaultPosition
+        axisExpr = {"X": isX, "Y": isY, "Z": isZ}.get(self.boneAxis.upper(), isX)
+        axisExpr = "ramp(%s, %f, %f)" % (axisExpr, self.minBoneRange, self.maxBoneRange)
+        if self.clamp:
+            axisExpr = "clamp(%s, 0, 1)" % axisExpr
+        # Map flex range from minFlexRange to maxFlexRange
+        axisExpr = "lerp(%s, %f, %f)" % (axisExpr, self.minFlexRange, self.maxFlexRange)
+        return axisExpr
+    def getExpressionKey(self):
+        """
+        Returns the parameters buildExpression() depends on, as a key for the expression cache.
+        """
+        boneAxis = self.boneAxis.upper()
+        if boneAxis not in ("X", "Y", "Z"):
+            boneAxis = "X" # matches the expression's fallback axis
+        # the default position is only part of translate expressions
+        boneDefaultPosition = self.boneDefaultPosition if self.usePosition else 0.0
+        return (bool(self.usePosition), boneAxis, boneDefaultPosition, self.minBoneRange, self.maxBoneRange, self.minFlexRange, self.maxFlexRange, bool(self.clamp))
+
+class ExpressionCache(object):
+    """
+    Least recently used cache of bone flex driver expressions and their compiled callables, keyed by expression parameters.
+    Counts hits and misses for profiling.
+    """
+    def __init__(self, maxSize=256):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def getEntry(self, boneFlexDriver):
+        """
+        Returns the [expression, compiled callable or None] entry of a bone flex driver's parameters,
+        building the expression on a miss and evicting the least recently used entry when the cache is full.
+        """
+        key = boneFlexDriver.getExpressionKey()
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            entry = [boneFlexDriver.buildExpression(), None]
+            if len(self.entries) >= self.maxSize:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self.entries[key] = entry # most recently used
+        return entry
+    def getExpression(self, boneFlexDriver):
+        """
+        Returns the DmeExpressionOperator expression of a bone flex driver.
+        """
+        return self.getEntry(boneFlexDriver)[0]
+    def getFunction(self, boneFlexDriver):
+        """
+        Returns a Python callable computing the same flex weights as a bone flex driver's expression,
+        see evaluate.compileExpression(). The callable is compiled the first time it is asked for.
+        """
+        entry = self.getEntry(boneFlexDriver)
+        if entry[1] is None:
+            entry[1] = evaluate.compileExpression(entry[0])
+        return entry[1]
+    def getStats(self):
+        """
+        Returns the hits, misses and size of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxSize": self.maxSize}
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+expressionCache = ExpressionCache() # shared by operator generation and baking
+
+class AnimationSetIndex(object):
+    """
+    Name lookups for an animation set's controls and its game model's global flex controllers.
+    Control names are normalized by stripping the " (disabled)" suffix given to driven flex controls.
+    """
+    __slots__ = ("controlCount", "controls", "controlNames", "flexControllers", "flexNames", "boneNames", "flexControls")
+    def __init__(self, animationSet):
+        self.controlCount = animationSet.controls.count()
+        self.controls = {}
+        self.controlNames = []
+        for j in range(self.controlCount):
+            control = animationSet.controls[j]
+            if control is None:
+                continue
+            controlName = control.GetName().replace(" (disabled)", "")
+            if controlName not in self.controls:
+                self.controls[controlName] = control
+                self.controlNames.append(controlName)
+        self.flexControllers = {}
+        self.flexNames = []
+        flexControlNames = set()
+        gameModel = getattr(animationSet, "gameModel", None)
+        if gameModel is not None:
+            for j in range(gameModel.globalFlexControllers.count()):
+                flexController = gameModel.globalFlexControllers[j]
+                if flexController is None:
+                    continue
+                flexName = flexController.GetName()
+                self.flexControllers[flexName] = flexController
+                self.flexNames.append(flexName)
+                flexControlNames.add(flexName)
+                flexControlNames.add(flexName.replace("left_", "").replace("right_", "").replace("multi_", ""))
+        # the name cannot be the same as a flex, and rig script controls are skipped
+        self.boneNames = [controlName for controlName in self.controlNames if controlName not in flexControlNames and " - " not in controlName]
+        self.flexControls = {}
+        stats["reads"] += self.controlCount + len(self.flexNames)
+    def getFlexControl(self, flexName):
+        """
+        Returns the control animating a flex, resolving left_/right_ flexes to their shared stereo control.
+        """
+        if flexName not in self.flexControls:
+            control = self.controls.get(flexName)
+            if control is None:
+                control = self.controls.get(flexName.replace("left_", ""))
+            if control is None:
+                control = self.controls.get(flexName.replace("right_", ""))
+            self.flexControls[flexName] = control
+        return self.flexControls[flexName]
+    def getFlexChannel(self, flexName):
+        """
+        Returns the channel animating a flex, which is the left or right value channel of a stereo control, or None.
+        """
+        control = self.getFlexControl(flexName)
+        if control is None:
+            return None
+        # if channel attribute doesn't exist, find "left"/"right" + "valuechannel"
+        if not hasattr(control, "channel"):
+            if flexName.startswith("left_"):
+                return control.leftvaluechannel
+            elif flexName.startswith("right_"):
+                return control.rightvaluechannel
+            return None
+        return control.channel
+    def getFlexWeights(self, flexNames):
+        """
+        Reads the current flexWeight of the global flex controllers of many flexes in one pass,
+        with the flex controllers looked up in the index and a single GetValue() each.
+        Returns a list with a weight, or None for flexes without a global flex controller, per flex name.
+        """
+        flexControllers = self.flexControllers
+        stats["reads"] += len(flexNames)
+        flexWeights = []
+        for flexName in flexNames:
+            flexController = flexControllers.get(flexName)
+            flexWeights.append(flexController.flexWeight.GetValue() if flexController is not None else None)
+        return flexWeights
+    def setFlexControlDriven(self, flexName, driven):
+        """
+        Disconnects a flex's control from its flex while a bone flex driver drives it, or reconnects it.
+        """
+        control = self.getFlexControl(flexName)
+        if control is None:
+            return
+        controlName = control.GetName().replace(" (disabled)", "")
+        newValue = "flexWeight"
+        if driven:
+            control.SetName(controlName + " (disabled)")
+            newValue = "disabled"
+        else:
+            control.SetName(controlName)
+        channel = self.getFlexChannel(flexName)
+        if channel is not None:
+            channel.toAttribute.SetValue(newValue)
+
+def getBoneFlexDrivers(shot, create=False):
+    """
+    Returns the boneFlexDrivers array of a shot, or None if it has none and create is False.
+    """
+    boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
+    if boneFlexDrivers is None and create:
+        boneFlexDrivers = shot.AddAttribute("boneFlexDrivers", vs.AT_ELEMENT_ARRAY)
+    return boneFlexDrivers
+
+def isBaked(element):
+    """
+    Returns True if a bone flex driver's flex values have been baked into its flex control's channel.
+    """
+    return hasattr(element, "baked") and element.baked.GetValue()
+
+def hasLiveOperators(element):
+    """
+    Returns True if a bone flex driver is evaluated by operators, meaning it is active and not baked.
+    """
+    return element.active.GetValue() and not isBaked(element)
+
+def findAnimationSet(shot, animSetName):
+    """
+    Returns the shot's first animation set with the given name, or None.
+    """
+    for i in range(shot.animationSets.count()):
+        if shot.animationSets[i].GetName() == animSetName:
+            return shot.animationSets[i]
+    return None
+
+def addBoneFlexDriver(shot, animationSet, boneFlexDriver):
+    """
+    Stores a bone flex driver in the shot's boneFlexDrivers array and returns its element.
+    """
+    boneFlexDrivers = getBoneFlexDrivers(shot, True)
+    return boneFlexDrivers[boneFlexDrivers.AddToTail(boneFlexDriver.createElement(shot, animationSet))]
+
+def removeBoneFlexDriverElement(shot, element):
+    """
+    Removes a bone flex driver from its shot's boneFlexDrivers array.
+    """
+    boneFlexDrivers = getBoneFlexDrivers(shot)
+    if boneFlexDrivers is None:
+        return
+    uniqueId = element.GetId().__str__()
+    for i in range(boneFlexDrivers.count()):
+        if boneFlexDrivers[i].GetId().__str__() == uniqueId:
+            boneFlexDrivers.remove(i)
+            break
+
+def exportBoneFlexDrivers(shot, animSetName):
+    """
+    Returns the JSON entries of every bone flex driver in the shot that belongs to the named animation set.
+    """
+    boneFlexDriversToSave = []
+    boneFlexDrivers = getBoneFlexDrivers(shot)
+    if boneFlexDrivers is None:
+        return boneFlexDriversToSave
+    for i in range(boneFlexDrivers.count()):
+        if boneFlexDrivers[i].animationSet.GetName() == animSetName:
+            boneFlexDriversToSave.append(BoneFlexDriver.fromElement(boneFlexDrivers[i]).toDict())
+    return boneFlexDriversToSave
+
+class ImportResult(object):
+    """
+    Outcome of a single exported JSON entry in a bulk import.
+    """
+    __slots__ = ("entry", "name", "flexName", "boneName", "imported", "reason", "shotName", "animSetName")
+    def __init__(self, entry, name, flexName, boneName, imported, reason="", shotName="", animSetName=""):
+        self.entry = entry
+        self.name = name
+        self.flexName = flexName
+        self.boneName = boneName
+        self.imported = imported
+        self.reason = reason
+        self.shotName = shotName
+        self.animSetName = animSetName
+
+def validateBoneFlexDrivers(boneFlexDriversToLoad, flexesInUse):
+    """
+    Checks every exported JSON entry before anything is created, skipping malformed entries
+    and entries whose flex is already in use, either by flexesInUse or by an earlier entry.
+    Returns the bone flex drivers to import and an ImportResult per entry.
+    Raises ValueError if the entries are not a list.
+    """
+    if not isinstance(boneFlexDriversToLoad, list):
+        raise ValueError("Invalid bone flex drivers file format. Expected a list of bone flex drivers.")
+    usedFlexes = set(flexesInUse)
+    entryFlexes = {}
+    boneFlexDrivers = []
+    results = []
+    for entry, boneFlexDriverData in enumerate(boneFlexDriversToLoad):
+        try:
+            boneFlexDriver = BoneFlexDriver.fromDict(boneFlexDriverData)
+        except ValueError as e:
+            name = ""
+            if isinstance(boneFlexDriverData, dict):
+                name = boneFlexDriverData.get("name", "")
+            results.append(ImportResult(entry, name if isinstance(name, stringTypes) else "", "", "", False, str(e)))
+            continue
+        result = ImportResult(entry, boneFlexDriver.name, boneFlexDriver.flexName, boneFlexDriver.boneName, False)
+        results.append(result)
+        if boneFlexDriver.flexName in entryFlexes:
+            result.reason = "Flex '%s' is already used by entry %d" % (boneFlexDriver.flexName, entryFlexes[boneFlexDriver.flexName] + 1)
+            continue
+        if boneFlexDriver.flexName in usedFlexes:
+            result.reason = "Flex '%s' is already in use by another bone flex driver" % boneFlexDriver.flexName
+            continue
+        entryFlexes[boneFlexDriver.flexName] = entry
+        result.imported = True
+        boneFlexDrivers.append(boneFlexDriver)
+    return boneFlexDrivers, results
+
+def skipMissingImportTarget(results, animationSet, animSetName, shotName):
+    """
+    Marks every entry validated for import as skipped when the animation set it is imported to,
+    or the animation set's model, could not be found.
+    Returns True if the entries can be imported.
+    """
+    reason = None
+    if animationSet is None:
+        reason = "Animation set '%s' and its model could not be found in shot '%s'" % (animSetName, shotName)
+    elif getattr(animationSet, "gameModel", None) is None:
+        reason = "Animation set '%s' has no model" % animSetName
+    if reason is None:
+        return True
+    for result in results:
+        if result.imported:
+            result.imported = False
+            result.reason = reason
+    return False
+
+def addBoneFlexDrivers(shot, animationSet, boneFlexDrivers):
+    """
+    Stores many bone flex drivers in the shot's boneFlexDrivers array in one pass and returns their elements.
+    """
+    boneFlexDriversArray = getBoneFlexDrivers(shot, True)
+    return [boneFlexDriversArray[boneFlexDriversArray.AddToTail(boneFlexDriver.createElement(shot, animationSet))] for boneFlexDriver in boneFlexDrivers]
+
+def importBoneFlexDrivers(shot, animationSet, boneFlexDriversToLoad, flexesInUse):
+    """
+    Adds bone flex drivers from exported JSON entries to an animation set, skipping flexes that are already in use.
+    Every entry is validated before any element is created. Imported flexes are added to flexesInUse.
+    Returns the imported elements and a list of error messages for the entries that were skipped.
+    Raises ValueError if the entries are not a list.
+    """
+    boneFlexDrivers, results = validateBoneFlexDrivers(boneFlexDriversToLoad, flexesInUse)
+    importedElements = addBoneFlexDrivers(shot, animationSet, boneFlexDrivers)
+    flexesInUse.extend([boneFlexDriver.flexName for boneFlexDriver in boneFlexDrivers])
+    errors = []
+    for result in results:
+        if not result.imported:
+            errors.append("Could not import Bone Flex Driver '%s'\n%s" % (result.name, result.reason))
+    return importedElements, errors
+
+def normalizeModelName(modelName):
+    """
+    Returns a model path in lowercase with forward slashes, so paths written either way match.
+    """
+    return modelName.replace("\\", "/").lower()
+
+def getModelName(animationSet):
+    """
+    Returns the model path of an animation set's game model, normalized to lowercase with forward slashes,
+    or None if it has no game model.
+    """
+    gameModel = getattr(animationSet, "gameModel", None)
+    if gameModel is None:
+        return None
+    return normalizeModelName(gameModel.modelName.GetValue())
+
+def getSessionModelNames(shots):
+    """
+    Returns the model paths of every animation set in the given shots.
+    """
+    modelNames = set()
+    for shot in shots:
+        for i in range(shot.animationSets.count()):
+            modelName = getModelName(shot.animationSets[i])
+            if modelName:
+                modelNames.add(modelName)
+    return modelNames
+
+def getFlexesInUseByAnimationSet(shot):
+    """
+    Returns the flexes used by a shot's bone flex drivers, as a set per animation set unique id.
+    """
+    flexesInUse = {}
+    boneFlexDrivers = getBoneFlexDrivers(shot)
+    if boneFlexDrivers is None:
+        return flexesInUse
+    for i in range(boneFlexDrivers.count()):
+        animationSet = getattr(boneFlexDrivers[i], "animationSet", None)
+        if animationSet is not None:
+            flexesInUse.setdefault(animationSet.GetId().__str__(), set()).add(boneFlexDrivers[i].flexName.GetValue())
+    return flexesInUse
+
+def isSessionData(data):
+    """
+    Returns True if loaded JSON is a session export rather than the bone flex drivers of a single animation set.
+    """
+    return isinstance(data, dict) and data.get("format") == "boneFlexDriversSession"
+
+def exportSession(shots):
+    """
+    Returns the JSON entries of every bone flex driver in the given shots, keyed by model path.
+    Animation sets of the same model share one list, where the first bone flex driver of each flex in shot order is kept.
+    """
+    boneFlexDriversByModel = {}
+    flexesByModel = {}
+    for shot in shots:
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            continue
+        for i in range(boneFlexDrivers.count()):
+            element = boneFlexDrivers[i]
+            modelName = getModelName(getattr(element, "animationSet", None))
+            if not modelName:
+                continue
+            flexes = flexesByModel.setdefault(modelName, set())
+            flexName = element.flexName.GetValue()
+            if flexName in flexes:
+                continue
+            flexes.add(flexName)
+            boneFlexDriversByModel.setdefault(modelName, []).append(BoneFlexDriver.fromElement(element).toDict())
+    return {"format": "boneFlexDriversSession", "models": boneFlexDriversByModel}
+
+def importSession(shots, boneFlexDriversByModel):
+    """
+    Adds bone flex drivers to every animation set in the given shots whose model has entries in boneFlexDriversByModel,
+    a dictionary of model paths to exported JSON entries. Each animation set's entries are validated
+    against the flexes it already uses before its elements are created. No operators are generated.
+    Returns a list of (shot, imported elements) per shot that had bone flex drivers imported,
+    and an ImportResult per entry and animation set, along with a skipped ImportResult per entry of models no animation set uses.
+    Raises ValueError if boneFlexDriversByModel is not a dictionary of lists.
+    """
+    if not isinstance(boneFlexDriversByModel, dict):
+        raise ValueError("Invalid bone flex drivers session format. Expected bone flex drivers keyed by model path.")
+    entriesByModel = {}
+    for modelName, boneFlexDriversToLoad in boneFlexDriversByModel.items():
+        if not isinstance(boneFlexDriversToLoad, list):
+            raise ValueError("Invalid bone flex drivers of model '%s'. Expected a list of bone flex drivers." % modelName)
+        entriesByModel[normalizeModelName(modelName)] = boneFlexDriversToLoad
+    importedShots = []
+    results = []
+    usedModelNames = set()
+    for shot in shots:
+        flexesInUse = None
+        elements = []
+        for i in range(shot.animationSets.count()):
+            animationSet = shot.animationSets[i]
+            boneFlexDriversToLoad = entriesByModel.get(getModelName(animationSet))
+            if boneFlexDriversToLoad is None:
+                continue
+            usedModelNames.add(getModelName(animationSet))
+            if flexesInUse is None:
+                flexesInUse = getFlexesInUseByAnimationSet(shot)
+            boneFlexDrivers, animationSetResults = validateBoneFlexDrivers(boneFlexDriversToLoad, flexesInUse.get(animationSet.GetId().__str__(), ()))
+            for result in animationSetResults:
+                result.shotName = shot.GetName()
+                result.animSetName = animationSet.GetName()
+            results.extend(animationSetResults)
+            elements.extend(addBoneFlexDrivers(shot, animationSet, boneFlexDrivers))
+        if elements:
+            importedShots.append((shot, elements))
+    for modelName in sorted(entriesByModel.keys()):
+        if modelName in usedModelNames:
+            continue
+        modelResults = validateBoneFlexDrivers(entriesByModel[modelName], ())[1]
+        for result in modelResults:
+            if result.imported:
+                result.imported = False
+                result.reason = "No animation set in the session uses model '%s'" % modelName
+        results.extend(modelResults)
+    return importedShots, results
+
+def loadBoneFlexDriversFile(fileName):
+    """
+    Reads exported JSON entries from a file.
+    """
+    with open(fileName, 'r') as f:
+        return json.load(f)
+
+def saveBoneFlexDriversFile(fileName, boneFlexDriversToSave):
+    """
+    Writes exported JSON entries to a file.
+    """
+    with open(fileName, 'w') as f:
+        json.dump(boneFlexDriversToSave, f, indent=4)
+
+class OperatorGenerator(object):
+    """
+    Builds, edits and removes the SFM operators that evaluate bone flex drivers.
+    Caches the animation set indexes and shared operator indexes it looks operators up in.
+    """
+    def __init__(self, optimizedGraph=True):
+        self.optimizedGraph = optimizedGraph
+        self.animationSetIndexes = {}
+        self.sharedOperatorIndexes = {}
+    def getAnimationSetIndex(self, animationSet):
+        """
+        Returns the cached control and flex controller index of an animation set,
+        rebuilding it when the animation set's control count has changed.
+        """
+        uniqueId = animationSet.GetId().__str__()
+        animationSetIndex = self.animationSetIndexes.get(uniqueId)
+        if animationSetIndex is None or animationSetIndex.controlCount != animationSet.controls.count():
+            animationSetIndex = AnimationSetIndex(animationSet)
+            self.animationSetIndexes[uniqueId] = animationSetIndex
+        return animationSetIndex
+    def clearCaches(self):
+        """
+        Discards every cached animation set and shared operator index,
+        after the session may have changed outside the generator, such as by SFM's undo and redo.
+        """
+        self.animationSetIndexes = {}
+        self.sharedOperatorIndexes = {}
+    def invalidateSharedOperatorIndexes(self):
+        """
+        Discards the cached shared operator index of every shot, so removed shared stages are never reused.
+        """
+        self.sharedOperatorIndexes = {}
+    def generateShot(self, shot):
+        """
+        Regenerates the operators of every bone flex driver in a shot.
+        Only operators generated for bone flex drivers are removed, operators of rig scripts and other tools are kept.
+        Returns the number of bone flex drivers removed because their animation set is invalid.
+        """
+        self.sharedOperatorIndexes.pop(shot.GetId().__str__(), None)
+        self.removeOperatorsFromShot(shot, self.getOwnedOperatorIds(shot))
+        sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+        if sharedOperators is not None:
+            while sharedOperators.count() > 0:
+                sharedOperators.remove(0)
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            return 0
+        removedCount = 0
+        i = 0
+        while i < boneFlexDrivers.count():
+            if hasLiveOperators(boneFlexDrivers[i]) and not self.generateBoneFlexDriverOperators(shot, boneFlexDrivers[i]):
+                # remove this bone flex driver, as its animation set is invalid
+                boneFlexDrivers.remove(i)
+                removedCount += 1
+                continue
+            i += 1
+        return removedCount
+    def refreshShot(self, shot):
+        """
+        Regenerates the operators of the bone flex drivers in a shot whose operators are missing from the shot
+        or were generated from other settings, leaving every other operator untouched.
+        Falls back to generateShot() when a shared transform and unpack stage is missing from the shot.
+        Returns the number of bone flex drivers removed because their animation set is invalid,
+        and the number of bone flex drivers whose operators were regenerated.
+        """
+        self.sharedOperatorIndexes.pop(shot.GetId().__str__(), None)
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            return self.generateShot(shot), 0
+        operatorIds = self.getOperatorIds(shot.operators)
+        sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+        if sharedOperators is not None:
+            for j in range(sharedOperators.count()):
+                if sharedOperators[j] is None or sharedOperators[j].GetId().__str__() not in operatorIds:
+                    return self.generateShot(shot), boneFlexDrivers.count()
+        staleElements = []
+        staleOperatorIds = set()
+        for i in range(boneFlexDrivers.count()):
+            if not self.hasCurrentOperators(boneFlexDrivers[i], operatorIds):
+                staleElements.append(boneFlexDrivers[i])
+                self.getOperatorIds(getattr(boneFlexDrivers[i], "generatedOperators", None), staleOperatorIds)
+        if not staleElements:
+            return 0, 0
+        self.removeOperatorsFromShot(shot, staleOperatorIds)
+        removedCount = self.generateBoneFlexDrivers(shot, staleElements)
+        self.pruneSharedOperators(shot)
+        return removedCount, len(staleElements)
+    def hasCurrentOperators(self, element, operatorIds):
+        """
+        Returns True if the operators of a bone flex driver are all in its shot, whose operator ids are given,
+        and were generated from its current fingerprint. Inactive and baked bone flex drivers are current
+        when none of their stale operators are left in the shot.
+        """
+        generatedOperators = getattr(element, "generatedOperators", None)
+        if generatedOperators is None:
+            return True
+        if not hasLiveOperators(element):
+            for j in range(generatedOperators.count()):
+                if generatedOperators[j] is not None and generatedOperators[j].GetId().__str__() in operatorIds:
+                    return False
+            return True
+        if generatedOperators.count() == 0 or not hasattr(element, "operatorFingerprint"):
+            return False
+        for j in range(generatedOperators.count()):
+            if generatedOperators[j] is None or generatedOperators[j].GetId().__str__() not in operatorIds:
+                return False
+        if element.animationSet is None or getattr(element.animationSet, "gameModel", None) is None:
+            return False # let the regeneration remove it
+        return element.operatorFingerprint.GetValue() == self.getFingerprint(element)
+    def getFingerprint(self, element, boneFlexDriver=None):
+        """
+        Returns a hash of everything a bone flex driver's operators are generated from: its settings and expression,
+        its animation set, the bone channel element its transform reads, the flex controller its result writes,
+        and the graph layout.
+        """
+        if boneFlexDriver is None:
+            boneFlexDriver = BoneFlexDriver.fromElement(element)
+        animationSet = element.animationSet
+        animationSetIndex = self.getAnimationSetIndex(animationSet)
+        boneControl = animationSetIndex.controls.get(boneFlexDriver.boneName)
+        boneElement = None
+        if boneControl is not None:
+            if boneFlexDriver.usePosition:
+                boneElement = boneControl.positionChannel.toElement
+            else:
+                boneElement = boneControl.orientationChannel.toElement
+        flexController = animationSetIndex.flexControllers.get(boneFlexDriver.flexName)
+        parts = [
+            element.GetName(),
+            animationSet.GetId().__str__(),
+            animationSet.GetName(),
+            json.dumps(boneFlexDriver.toDict(), sort_keys=True),
+            boneFlexDriver.buildExpression(), # not through the cache, which would count every refresh as a hit
+            boneElement.GetId().__str__() if boneElement is not None else "",
+            flexController.GetId().__str__() if flexController is not None else "",
+            "optimized" if self.optimizedGraph else "full",
+        ]
+        # element names are bytes in SFM's Python 2, keep the hash the same in Python 3
+        parts = [part.decode("utf-8", "replace") if isinstance(part, bytes) else part for part in parts]
+        return hashlib.sha1(u"\n".join(parts).encode("utf-8")).hexdigest()
+    def setFingerprint(self, element, boneFlexDriver=None):
+        """
+        Stores the fingerprint of the settings a bone flex driver's operators were just generated or updated from.
+        """
+        if not hasattr(element, "operatorFingerprint"):
+            element.AddAttribute("operatorFingerprint", vs.AT_STRING)
+        element.operatorFingerprint.SetValue(self.getFingerprint(element, boneFlexDriver))
+    def generateBoneFlexDrivers(self, shot, elements):
+        """
+        Generates the operators of newly added bone flex drivers in a single pass, leaving every other operator untouched.
+        Returns the number of bone flex drivers removed because their animation set is invalid.
+        """
+        removedCount = 0
+        for element in elements:
+            if hasLiveOperators(element) and not self.generateBoneFlexDriverOperators(shot, element):
+                # remove this bone flex driver, as its animation set is invalid
+                removeBoneFlexDriverElement(shot, element)
+                removedCount += 1
+        return removedCount
+    def regenerateBoneFlexDriver(self, shot, element):
+        """
+        Rebuilds the operator chain of a single bone flex driver within its shot.
+        Returns False if the bone flex driver was removed because its animation set is invalid.
+        """
+        self.removeGeneratedOperatorsFromShot(shot, element)
+        if hasLiveOperators(element) and not self.generateBoneFlexDriverOperators(shot, element):
+            # remove this bone flex driver, as its animation set is invalid
+            removeBoneFlexDriverElement(shot, element)
+            return False
+        return True
+    def removeBoneFlexDriver(self, shot, element):
+        """
+        Removes a bone flex driver from its shot along with its generated operators, which are only owned through its element,
+        reconnects its flex control, and removes shared stages nothing reads from anymore.
+        """
+        self.removeGeneratedOperatorsFromShot(shot, element)
+        if element.animationSet is not None:
+            self.getAnimationSetIndex(element.animationSet).setFlexControlDriven(element.flexName.GetValue(), False)
+        removeBoneFlexDriverElement(shot, element)
+        self.pruneSharedOperators(shot)
+    def getOperatorIds(self, operators, operatorIds=None):
+        """
+        Adds the unique ids of every operator in an operators array to a set, which is returned.
+        """
+        if operatorIds is None:
+            operatorIds = set()
+        if operators is None:
+            return operatorIds
+        stats["reads"] += operators.count()
+        for j in range(operators.count()):
+            if operators[j] is not None:
+                operatorIds.add(operators[j].GetId().__str__())
+        return operatorIds
+    def getOwnedOperatorIds(self, shot):
+        """
+        Returns the unique ids of every operator in a shot that was generated for a bone flex driver,
+        including inactive bone flex drivers' stale operators and shared transform and unpack stages.
+        """
+        ownedIds = self.getOperatorIds(getattr(shot, "boneFlexDriverSharedOperators", None))
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is not None:
+            for i in range(boneFlexDrivers.count()):
+                self.getOperatorIds(getattr(boneFlexDrivers[i], "generatedOperators", None), ownedIds)
+        return ownedIds
+    def removeOperatorsFromShot(self, shot, operatorIds):
+        """
+        Removes the operators with the given unique ids from a shot's operators array in a single backwards pass.
+        """
+        if not operatorIds:
+            return
+        stats["reads"] += shot.operators.count()
+        for j in range(shot.operators.count() - 1, -1, -1):
+            if shot.operators[j] is not None and shot.operators[j].GetId().__str__() in operatorIds:
+                shot.operators.remove(j)
+    def removeGeneratedOperatorsFromShot(self, shot, element):
+        """
+        Removes a bone flex driver's generated operators from its shot's operators array.
+        """
+        self.removeOperatorsFromShot(shot, self.getOperatorIds(getattr(element, "generatedOperators", None)))
+    def generateBoneFlexDriverOperators(self, shot, element):
+        """
+        Creates the operator chain of a single bone flex driver and adds it to the shot's operators.
+        Returns False if the bone flex driver's animation set is invalid and it should be removed.
+        """
+        generatedOperators = getattr(element, "generatedOperators", None)
+        if generatedOperators is None:
+            return True
+        if getattr(element.animationSet, "gameModel", None) is None:
+            return False # its animation set is invalid
+        # Clear existing operators
+        while generatedOperators.count() > 0:
+            generatedOperators.remove(0)
+        # Create new operators based on the bone flex driver properties
+        prefix = element.GetName() + "_" + element.animationSet.GetName() + "_" + element.boneName.GetValue() + "_" + element.flexName.GetValue() + "_"
+        if not hasattr(element, "usePosition"):
+            element.AddAttribute("usePosition", vs.AT_BOOL).SetValue(False)
+        if element.usePosition.GetValue():
+            if not hasattr(element, "boneDefaultPosition"):
+                element.AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(0.0)
+        boneFlexDriver = BoneFlexDriver.fromElement(element)
+        animationSetIndex = self.getAnimationSetIndex(element.animationSet)
+        animationSetIndex.setFlexControlDriven(boneFlexDriver.flexName, boneFlexDriver.active)
+        boneControl = animationSetIndex.controls.get(boneFlexDriver.boneName)
+        if self.optimizedGraph:
+            # bone flex drivers reading the same bone channel share one transform and unpack stage
+            unpack = self.getSharedUnpackOperator(shot, element, boneControl)
+        else:
+            unpack = self.createUnpackOperators(shot, prefix, boneFlexDriver.usePosition, boneControl, generatedOperators)
+        eval = vs.CreateElement("DmeExpressionOperator", (prefix + "eval").encode('utf-8'), shot.GetFileId())
+        eval = generatedOperators[generatedOperators.AddToTail(eval)]
+        eval.expr.SetValue(expressionCache.getExpression(boneFlexDriver))
+        # Connect each unpacked component read by the expression
+        components = boneFlexDriver.getComponents(self.optimizedGraph)
+        for component in components:
+            eval.AddAttribute(component, vs.AT_FLOAT)
+            connection = vs.CreateElement("DmeConnectionOperator", (prefix + component).encode('utf-8'), shot.GetFileId())
+            connection = generatedOperators[generatedOperators.AddToTail(connection)]
+            connectionInput = vs.CreateElement("DmeAttributeReference", (prefix + component + "_input").encode('utf-8'), shot.GetFileId())
+            connection.SetValue("input", connectionInput)
+            connectionInput.SetValue("element", unpack)
+            connectionInput.attribute.SetValue(component)
+            connectionOutput = vs.CreateElement("DmeAttributeReference", (prefix + component + "_output").encode('utf-8'), shot.GetFileId())
+            connection.outputs.AddToTail(connectionOutput)
+            connectionOutput.SetValue("element", eval)
+            connectionOutput.attribute.SetValue(component)
+        result = vs.CreateElement("DmeConnectionOperator", (prefix + "result").encode('utf-8'), shot.GetFileId())
+        result = generatedOperators[generatedOperators.AddToTail(result)]
+        resultInput = vs.CreateElement("DmeAttributeReference", (prefix + "result_input").encode('utf-8'), shot.GetFileId())
+        result.SetValue("input", resultInput)
+        resultInput.SetValue("element", eval)
+        resultInput.attribute.SetValue("result")
+        resultOutput = vs.CreateElement("DmeAttributeReference", (prefix + "result_output").encode('utf-8'), shot.GetFileId())
+        result.outputs.AddToTail(resultOutput)
+        flexController = animationSetIndex.flexControllers.get(boneFlexDriver.flexName)
+        if flexController is not None:
+            resultOutput.SetValue("element", flexController)
+        resultOutput.attribute.SetValue("flexWeight")
+        stats["operators"] += 2 + len(components)
+        for j in range(generatedOperators.count()):
+            shot.operators.AddToTail(generatedOperators[j])
+        self.setFingerprint(element, boneFlexDriver)
+        return True
+    def createUnpackOperators(self, shot, prefix, usePosition, boneControl, operators):
+        """
+        Creates the transform and unpack operators that split a bone's position or orientation into components.
+        Both operators are added to the given operators array, and the unpack operator is returned.
+        """
+        transform = vs.CreateElement("DmeConnectionOperator", (prefix + "transform").encode('utf-8'), shot.GetFileId())
+        transform = operators[operators.AddToTail(transform)]
+        transformInput = vs.CreateElement("DmeAttributeReference", (prefix + "transform_input").encode('utf-8'), shot.GetFileId())
+        transform.SetValue("input", transformInput)
+        if boneControl is not None:
+            # position or rotation?
+            if usePosition:
+                transformInput.SetValue("element", boneControl.positionChannel.toElement)
+            else:
+                transformInput.SetValue("element", boneControl.orientationChannel.toElement)
+        if usePosition:
+            transformInput.attribute.SetValue("position")
+        else:
+            transformInput.attribute.SetValue("orientation")
+        transformOutput = vs.CreateElement("DmeAttributeReference", (prefix + "transform_output").encode('utf-8'), shot.GetFileId())
+        transform.outputs.AddToTail(transformOutput)
+        unpackOperator = "DmeUnpackQuaternionOperator"
+        if usePosition:
+            unpackOperator = "DmeUnpackVector3Operator"
+        unpack = vs.CreateElement(unpackOperator, (prefix + "unpack").encode('utf-8'), shot.GetFileId())
+        unpack = operators[operators.AddToTail(unpack)]
+        transformOutput.SetValue("element", unpack)
+        if usePosition:
+            transformOutput.attribute.SetValue("vector")
+        else:
+            transformOutput.attribute.SetValue("quaternion")
+        stats["operators"] += 2
+        return unpack
+    def getSharedUnpackPrefix(self, element):
+        """
+        Returns the name prefix of the shared transform and unpack stage a bone flex driver reads from.
+        Bone flex drivers share a stage when they use the same bone channel of the same animation set.
+        """
+        channel = "orientation"
+        if hasattr(element, "usePosition") and element.usePosition.GetValue():
+            channel = "position"
+        return "boneflexdriver_shared_" + element.animationSet.GetId().__str__() + "_" + element.boneName.GetValue() + "_" + channel + "_"
+    def getSharedOperatorIndex(self, shot):
+        """
+        Returns the cached name index of a shot's shared transform and unpack operators.
+        """
+        uniqueId = shot.GetId().__str__()
+        sharedOperatorIndex = self.sharedOperatorIndexes.get(uniqueId)
+        if sharedOperatorIndex is None:
+            sharedOperatorIndex = {}
+            sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+            if sharedOperators is not None:
+                for j in range(sharedOperators.count()):
+                    if sharedOperators[j] is not None:
+                        sharedOperatorIndex[sharedOperators[j].GetName()] = sharedOperators[j]
+            self.sharedOperatorIndexes[uniqueId] = sharedOperatorIndex
+        return sharedOperatorIndex
+    def getSharedUnpackOperator(self, shot, element, boneControl):
+        """
+        Returns the shared unpack operator for a bone flex driver's bone channel,
+        creating the shared transform and unpack stage in the shot if no other bone flex driver has yet.
+        """
+        prefix = self.getSharedUnpackPrefix(element)
+        sharedOperatorIndex = self.getSharedOperatorIndex(shot)
+        unpack = sharedOperatorIndex.get(prefix + "unpack")
+        if unpack is not None:
+            return unpack
+        sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+        if sharedOperators is None:
+            sharedOperators = shot.AddAttribute("boneFlexDriverSharedOperators", vs.AT_ELEMENT_ARRAY)
+        firstOperator = sharedOperators.count()
+        unpack = self.createUnpackOperators(shot, prefix, element.usePosition.GetValue(), boneControl, sharedOperators)
+        for j in range(firstOperator, sharedOperators.count()):
+            sharedOperatorIndex[sharedOperators[j].GetName()] = sharedOperators[j]
+            shot.operators.AddToTail(sharedOperators[j])
+        return unpack
+    def pruneSharedOperators(self, shot):
+        """
+        Removes shared transform and unpack stages that no active bone flex driver in the shot reads from anymore.
+        """
+        sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+        if sharedOperators is None or sharedOperators.count() == 0:
+            return
+        usedPrefixes = set()
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is not None and self.optimizedGraph:
+            for i in range(boneFlexDrivers.count()):
+                if hasLiveOperators(boneFlexDrivers[i]):
+                    usedPrefixes.add(self.getSharedUnpackPrefix(boneFlexDrivers[i]))
+        unusedIds = set()
+        for j in range(sharedOperators.count() - 1, -1, -1):
+            sharedOperator = sharedOperators[j]
+            if sharedOperator is not None and sharedOperator.GetName().rsplit("_", 1)[0] + "_" in usedPrefixes:
+                continue
+            if sharedOperator is not None:
+                unusedIds.add(sharedOperator.GetId().__str__())
+            sharedOperators.remove(j)
+        if not unusedIds:
+            return
+        self.removeOperatorsFromShot(shot, unusedIds)
+        self.sharedOperatorIndexes.pop(shot.GetId().__str__(), None)
+    def findGeneratedOperator(self, element, suffix):
+        """
+        Returns the generated operator of a bone flex driver whose name ends with the given suffix, or None.
+        """
+        generatedOperators = getattr(element, "generatedOperators", None)
+        if generatedOperators is None:
+            return None
+        for j in range(generatedOperators.count()):
+            if generatedOperators[j] is not None and generatedOperators[j].GetName().endswith("_" + suffix):
+                return generatedOperators[j]
+        return None
+    def updateBoneFlexDriverExpression(self, element):
+        """
+        Rewrites the expression of a bone flex driver's existing eval operator in place.
+        Returns False if the bone flex driver has no eval operator to update,
+        or if the expression now reads a component that is not connected.
+        """
+        eval = self.findGeneratedOperator(element, "eval")
+        if eval is None:
+            return False
+        boneFlexDriver = BoneFlexDriver.fromElement(element)
+        for component in boneFlexDriver.getComponents(self.optimizedGraph):
+            if self.findGeneratedOperator(element, component) is None:
+                return False # e.g. the axis of an optimized translate driver changed
+        eval.expr.SetValue(expressionCache.getExpression(boneFlexDriver))
+        self.setFingerprint(element, boneFlexDriver)
+        return True
+    def retargetBoneFlexDriverInput(self, shot, element):
+        """
+        Points a bone flex driver's existing operators at its current bone: the connections of the optimized graph
+        read from the shared unpack stage of the new bone, and the full graph's transform reads the new bone itself.
+        The shared stage of the previous bone is left for pruneSharedOperators().
+        Returns False if the bone flex driver has no operators to retarget or its bone could not be found.
+        """
+        boneControl = self.getAnimationSetIndex(element.animationSet).controls.get(element.boneName.GetValue())
+        if boneControl is None:
+            return False
+        if self.optimizedGraph:
+            connections = []
+            for component in BoneFlexDriver.fromElement(element).getComponents(True):
+                connection = self.findGeneratedOperator(element, component)
+                if connection is None or connection.input is None:
+                    return False
+                connections.append(connection)
+            unpack = self.getSharedUnpackOperator(shot, element, boneControl)
+            for connection in connections:
+                connection.input.SetValue("element", unpack)
+            self.setFingerprint(element)
+            return True
+        transform = self.findGeneratedOperator(element, "transform")
+        if transform is None or transform.input is None:
+            return False
+        if hasattr(element, "usePosition") and element.usePosition.GetValue():
+            transform.input.SetValue("element", boneControl.positionChannel.toElement)
+        else:
+            transform.input.SetValue("element", boneControl.orientationChannel.toElement)
+        self.setFingerprint(element)
+        return True
+    def countShotOperators(self, shot):
+        """
+        Counts the live operators and attribute references generated for bone flex drivers in a shot,
+        along with the operators the full (unoptimized) graph would have generated for them.
+        Returns a tuple of (bone flex drivers, operators, attribute references, full graph operators).
+        """
+        boneFlexDriverCount = 0
+        operatorCount = 0
+        referenceCount = 0
+        fullOperatorCount = 0
+        boneFlexDrivers = getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            return (boneFlexDriverCount, operatorCount, referenceCount, fullOperatorCount)
+        operatorArrays = []
+        for i in range(boneFlexDrivers.count()):
+            element = boneFlexDrivers[i]
+            if not hasLiveOperators(element):
+                continue
+            generatedOperators = getattr(element, "generatedOperators", None)
+            if generatedOperators is None:
+                continue
+            boneFlexDriverCount += 1
+            operatorArrays.append(generatedOperators)
+            # transform, unpack, eval and result, plus one connection per component
+            fullOperatorCount += 4 + len(BoneFlexDriver.fromElement(element).getComponents(False))
+        sharedOperators = getattr(shot, "boneFlexDriverSharedOperators", None)
+        if sharedOperators is not None:
+            operatorArrays.append(sharedOperators)
+        for operators in operatorArrays:
+            stats["reads"] += operators.count()
+            for j in range(operators.count()):
+                operator = operators[j]
+                if operator is None:
+                    continue
+                operatorCount += 1
+                if hasattr(operator, "input") and operator.input is not None:
+                    referenceCount += 1
+                if hasattr(operator, "outputs"):
+                    referenceCount += operator.outputs.count()
+        return (boneFlexDriverCount, operatorCount, referenceCount, fullOperatorCount)
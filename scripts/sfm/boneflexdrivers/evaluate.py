@@ -0,0 +1,214 @@
+# Bone Flex Drivers evaluator for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Evaluates the math of bone flex driver expressions for many samples and bone flex drivers per call,
+# using NumPy when it is installed and plain Python otherwise.
+
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def expressionFloat(value):
+    """
+    Rounds a parameter the way it is written into the expression string, with "%f".
+    """
+    return float("%f" % value)
+
+def divide(numerator, denominator):
+    """
+    Divides like the expression operator's floats, giving infinity or NaN instead of raising on zero.
+    """
+    if denominator == 0.0:
+        if numerator == 0.0 or numerator != numerator:
+            return float("nan")
+        return math.copysign(float("inf"), numerator) * math.copysign(1.0, denominator)
+    return numerator / denominator
+
+def asin(value):
+    """
+    Arc sine that gives NaN outside of [-1, 1] instead of raising.
+    """
+    if value < -1.0 or value > 1.0 or value != value:
+        return float("nan")
+    return math.asin(value)
+
+def clamp(value, minimum, maximum):
+    """
+    Clamps like the expression operator's clamp(), which lets NaN through.
+    """
+    if value != value:
+        return value
+    return min(max(value, minimum), maximum)
+
+def getAxisValues(usePosition, boneAxis, boneDefaultPosition, x, y, z, w):
+    """
+    Returns the rotation in degrees, or the offset from the default position, on the chosen axis for each sample.
+    Components are sequences (or NumPy arrays) of equal length, w is ignored for translation.
+    """
+    axis = boneAxis.upper()
+    if numpy is not None:
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        z = numpy.asarray(z, dtype=numpy.float64)
+        if usePosition:
+            return {"Y": y, "Z": z}.get(axis, x) - boneDefaultPosition
+        w = numpy.asarray(w, dtype=numpy.float64)
+        with numpy.errstate(invalid="ignore"):
+            if axis == "Y":
+                return numpy.degrees(numpy.arcsin(2 * (w * y - z * x)))
+            if axis == "Z":
+                return numpy.degrees(numpy.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z)))
+            return numpy.degrees(numpy.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y)))
+    if usePosition:
+        return [value - boneDefaultPosition for value in {"Y": y, "Z": z}.get(axis, x)]
+    # quaternion to euler conversion
+    if axis == "Y":
+        return [math.degrees(asin(2 * (qw * qy - qz * qx))) for qx, qy, qz, qw in zip(x, y, z, w)]
+    if axis == "Z":
+        return [math.degrees(math.atan2(2 * (qw * qz + qx * qy), 1 - 2 * (qy * qy + qz * qz))) for qx, qy, qz, qw in zip(x, y, z, w)]
+    return [math.degrees(math.atan2(2 * (qw * qx + qy * qz), 1 - 2 * (qx * qx + qy * qy))) for qx, qy, qz, qw in zip(x, y, z, w)]
+
+def remap(values, minBoneRange, maxBoneRange, clampWeights, minFlexRange, maxFlexRange):
+    """
+    Applies lerp(clamp(ramp(value, minBoneRange, maxBoneRange), 0, 1), minFlexRange, maxFlexRange) to each value,
+    where ramp(x, a, b) is (x - a) / (b - a) and lerp(t, a, b) is a + (b - a) * t.
+    """
+    boneRange = maxBoneRange - minBoneRange
+    flexRange = maxFlexRange - minFlexRange
+    if numpy is not None:
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            weights = (numpy.asarray(values, dtype=numpy.float64) - minBoneRange) / numpy.float64(boneRange)
+            if clampWeights:
+                weights = numpy.clip(weights, 0.0, 1.0) # NaN passes through
+            return minFlexRange + flexRange * weights
+    weights = [divide(value - minBoneRange, boneRange) for value in values]
+    if clampWeights:
+        weights = [clamp(weight, 0.0, 1.0) for weight in weights]
+    return [minFlexRange + flexRange * weight for weight in weights]
+
+def evaluateComponents(boneFlexDriver, x, y, z, w=None):
+    """
+    Computes the flex weights of a bone flex driver for samples of its bone channel's components,
+    with exactly the math of the expression built by BoneFlexDriver.buildExpression().
+    Returns a NumPy array when NumPy is installed, or a list.
+    """
+    values = getAxisValues(boneFlexDriver.usePosition, boneFlexDriver.boneAxis, expressionFloat(boneFlexDriver.boneDefaultPosition), x, y, z, w)
+    return remap(values, expressionFloat(boneFlexDriver.minBoneRange), expressionFloat(boneFlexDriver.maxBoneRange), boneFlexDriver.clamp, expressionFloat(boneFlexDriver.minFlexRange), expressionFloat(boneFlexDriver.maxFlexRange))
+
+def evaluateBoneFlexDriver(boneFlexDriver, samples):
+    """
+    Computes the flex weights of a bone flex driver for bone channel samples,
+    which are quaternions with x, y, z and w or vectors with x, y and z.
+    """
+    return evaluateSamples(lambda x, y, z, w: evaluateComponents(boneFlexDriver, x, y, z, w), boneFlexDriver.usePosition, samples)
+
+def evaluateBoneFlexDrivers(boneFlexDrivers, x, y, z, w):
+    """
+    Computes the flex weights of many bone flex drivers at once.
+    Components have one row of samples per bone flex driver (w is ignored for translate rows),
+    and one row of flex weights is returned per bone flex driver.
+    With NumPy, the rows are evaluated together as 2D arrays.
+    """
+    if numpy is None:
+        return [evaluateComponents(boneFlexDrivers[i], x[i], y[i], z[i], w[i] if w is not None else None) for i in range(len(boneFlexDrivers))]
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    z = numpy.asarray(z, dtype=numpy.float64)
+    w = numpy.ones_like(x) if w is None else numpy.asarray(w, dtype=numpy.float64)
+    # one column of parameters per bone flex driver, broadcast over its samples
+    def column(values):
+        return numpy.asarray(values, dtype=numpy.float64).reshape(-1, 1)
+    usePosition = numpy.asarray([boneFlexDriver.usePosition for boneFlexDriver in boneFlexDrivers], dtype=bool).reshape(-1, 1)
+    axis = numpy.asarray([{"Y": 1, "Z": 2}.get(boneFlexDriver.boneAxis.upper(), 0) for boneFlexDriver in boneFlexDrivers]).reshape(-1, 1)
+    boneDefaultPosition = column([expressionFloat(boneFlexDriver.boneDefaultPosition) for boneFlexDriver in boneFlexDrivers])
+    minBoneRange = column([expressionFloat(boneFlexDriver.minBoneRange) for boneFlexDriver in boneFlexDrivers])
+    maxBoneRange = column([expressionFloat(boneFlexDriver.maxBoneRange) for boneFlexDriver in boneFlexDrivers])
+    minFlexRange = column([expressionFloat(boneFlexDriver.minFlexRange) for boneFlexDriver in boneFlexDrivers])
+    maxFlexRange = column([expressionFloat(boneFlexDriver.maxFlexRange) for boneFlexDriver in boneFlexDrivers])
+    clampWeights = numpy.asarray([bool(boneFlexDriver.clamp) for boneFlexDriver in boneFlexDrivers], dtype=bool).reshape(-1, 1)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        rotation = numpy.choose(axis, [
+            numpy.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y)),
+            numpy.arcsin(2 * (w * y - z * x)),
+            numpy.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z)),
+        ])
+        translation = numpy.choose(axis, [x, y, z]) - boneDefaultPosition
+        values = numpy.where(usePosition, translation, numpy.degrees(rotation))
+        weights = (values - minBoneRange) / (maxBoneRange - minBoneRange)
+        weights = numpy.where(clampWeights, numpy.clip(weights, 0.0, 1.0), weights)
+        return minFlexRange + (maxFlexRange - minFlexRange) * weights
+
+def ramp(value, minimum, maximum):
+    """
+    The expression operator's ramp(), (value - minimum) / (maximum - minimum).
+    """
+    if numpy is not None:
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return (value - minimum) / numpy.float64(maximum - minimum)
+    return divide(value - minimum, maximum - minimum)
+
+def clampExpression(value, minimum, maximum):
+    """
+    The expression operator's clamp(), which lets NaN through.
+    """
+    if numpy is not None:
+        return numpy.clip(value, minimum, maximum)
+    return clamp(value, minimum, maximum)
+
+def lerp(value, minimum, maximum):
+    """
+    The expression operator's lerp(), minimum + (maximum - minimum) * value.
+    """
+    return minimum + (maximum - minimum) * value
+
+def expressionAsin(value):
+    """
+    The expression operator's asin(), giving NaN outside of [-1, 1].
+    """
+    if numpy is not None:
+        with numpy.errstate(invalid="ignore"):
+            return numpy.arcsin(value)
+    return asin(value)
+
+def getExpressionNamespace():
+    """
+    Returns the functions a bone flex driver expression can call, working on NumPy arrays when NumPy is installed.
+    """
+    if numpy is not None:
+        return {"__builtins__": {}, "rtod": numpy.degrees, "atan2": numpy.arctan2, "asin": expressionAsin, "ramp": ramp, "clamp": clampExpression, "lerp": lerp}
+    return {"__builtins__": {}, "rtod": math.degrees, "atan2": math.atan2, "asin": expressionAsin, "ramp": ramp, "clamp": clampExpression, "lerp": lerp}
+
+def compileExpression(expression):
+    """
+    Compiles an expression built by BoneFlexDriver.buildExpression() into a Python callable
+    taking sequences of the x, y, z and w components (w may be None for translation) and returning the flex weights.
+    Only expressions built by the engine should be compiled, as they are evaluated as Python code.
+    """
+    function = eval("lambda x, y, z, w: " + expression, getExpressionNamespace())
+    if numpy is not None:
+        def evaluateArrays(x, y, z, w=None):
+            x = numpy.asarray(x, dtype=numpy.float64)
+            w = numpy.ones_like(x) if w is None else numpy.asarray(w, dtype=numpy.float64)
+            with numpy.errstate(invalid="ignore"):
+                return function(x, numpy.asarray(y, dtype=numpy.float64), numpy.asarray(z, dtype=numpy.float64), w)
+        return evaluateArrays
+    def evaluateSequences(x, y, z, w=None):
+        if w is None:
+            w = [1.0] * len(x)
+        return [function(qx, qy, qz, qw) for qx, qy, qz, qw in zip(x, y, z, w)]
+    return evaluateSequences
+
+def evaluateSamples(function, usePosition, samples):
+    """
+    Calls a compiled expression on bone channel samples, which are quaternions or vectors.
+    """
+    x = [sample.x for sample in samples]
+    y = [sample.y for sample in samples]
+    z = [sample.z for sample in samples]
+    w = None if usePosition else [sample.w for sample in samples]
+    return function(x, y, z, w)
@@ -0,0 +1,209 @@
+# Bone Flex Drivers library format for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Libraries hold the bone flex drivers of many models in newline-delimited JSON:
+#   {"format": "boneFlexDriversLibrary", "version": 1, "index": {"models/hero.mdl": {"offset": 0, "count": 2}}}
+#   {"model": "models/hero.mdl", "count": 2}
+#   {"name": "boneFlexDriver1", "flexName": "...", ...}
+#   {"name": "boneFlexDriver2", "flexName": "...", ...}
+# The first line indexes each model's section by its byte offset from the start of the second line,
+# so a model's bone flex drivers are read without parsing the rest of the file.
+# A stale index, such as after editing a library by hand, is rebuilt from the section lines when it is found.
+
+
+import io
+import json
+
+from boneflexdrivers import engine
+
+libraryFormat = "boneFlexDriversLibrary"
+libraryVersion = 1
+libraryPrefix = b'{"format":"boneFlexDriversLibrary"'
+
+def encodeLine(value):
+    """
+    Returns a value as a compact line of UTF-8 encoded JSON.
+    """
+    line = json.dumps(value, separators=(",", ":"), sort_keys=True, ensure_ascii=False) + "\n"
+    if not isinstance(line, bytes):
+        line = line.encode("utf-8")
+    return line
+
+def decodeLine(line):
+    """
+    Parses a line of UTF-8 encoded JSON.
+    """
+    return json.loads(line.decode("utf-8"))
+
+def writeLibrary(fileObject, boneFlexDriversByModel):
+    """
+    Writes a dictionary of model paths to exported JSON entries to a binary file object as a library.
+    Model paths are normalized, and sections are written in model path order.
+    """
+    normalizedBoneFlexDrivers = {}
+    for modelName, boneFlexDriversToSave in boneFlexDriversByModel.items():
+        # paths written either way share one section
+        normalizedBoneFlexDrivers.setdefault(engine.normalizeModelName(modelName), []).extend(boneFlexDriversToSave)
+    sections = []
+    index = {}
+    offset = 0
+    for modelName in sorted(normalizedBoneFlexDrivers.keys()):
+        boneFlexDriversToSave = normalizedBoneFlexDrivers[modelName]
+        lines = [encodeLine({"model": modelName, "count": len(boneFlexDriversToSave)})]
+        lines.extend([encodeLine(boneFlexDriverData) for boneFlexDriverData in boneFlexDriversToSave])
+        index[modelName] = {"offset": offset, "count": len(boneFlexDriversToSave)}
+        offset += sum([len(line) for line in lines])
+        sections.append(lines)
+    fileObject.write(encodeLine({"format": libraryFormat, "version": libraryVersion, "index": index}))
+    for lines in sections:
+        for line in lines:
+            fileObject.write(line)
+
+def saveLibrary(fileName, boneFlexDriversByModel):
+    """
+    Writes a dictionary of model paths to exported JSON entries to a library file.
+    """
+    with io.open(fileName, "wb") as f:
+        writeLibrary(f, boneFlexDriversByModel)
+
+def readLibraryHeader(fileObject):
+    """
+    Reads the header line of a library from a binary file object positioned at its start.
+    Returns the header, with the body's position added as "bodyOffset", or None if the file is not a library.
+    Raises ValueError if the library was written by a newer version or its version is not supported.
+    """
+    # keys are sorted, so a library starts with its format and other files are rejected without reading further
+    start = fileObject.tell()
+    if fileObject.read(len(libraryPrefix)) != libraryPrefix:
+        return None
+    fileObject.seek(start)
+    header = decodeLine(fileObject.readline())
+    version = header.get("version")
+    if isinstance(version, int) and version > libraryVersion:
+        raise ValueError("Bone flex drivers library version %s is newer than supported version %d" % (version, libraryVersion))
+    if not isinstance(version, int) or isinstance(version, bool) or version < 1:
+        raise ValueError("Bone flex drivers library version %s is not supported" % (version,))
+    header["bodyOffset"] = fileObject.tell()
+    return header
+
+def isSectionHeader(value):
+    return isinstance(value, dict) and "model" in value
+
+def readNextValue(fileObject):
+    """
+    Parses the next line of a library that is not blank, or returns None at the end of the file.
+    """
+    for line in iter(fileObject.readline, b""):
+        if line.strip():
+            return decodeLine(line)
+    return None
+
+def readLibrarySection(fileObject, header, modelName):
+    """
+    Reads the exported JSON entries of a model's section at the offset the index gives.
+    Returns an empty list if the library has no section for the model, or None if the index does not match the section.
+    """
+    modelName = engine.normalizeModelName(modelName)
+    section = header.get("index", {}).get(modelName)
+    if section is None:
+        return []
+    fileObject.seek(header["bodyOffset"] + section["offset"])
+    try:
+        sectionHeader = readNextValue(fileObject)
+        if not isSectionHeader(sectionHeader) or sectionHeader.get("model") != modelName:
+            return None
+        boneFlexDriversToLoad = []
+        for i in range(section["count"]):
+            boneFlexDriverData = readNextValue(fileObject)
+            if boneFlexDriverData is None or isSectionHeader(boneFlexDriverData):
+                return None # the section is shorter than indexed
+            boneFlexDriversToLoad.append(boneFlexDriverData)
+        # the section must end where the next one starts, or the file ends
+        nextValue = readNextValue(fileObject)
+        if nextValue is not None and not isSectionHeader(nextValue):
+            return None # the section is longer than indexed
+    except ValueError:
+        return None # the offset is not at the start of a line
+    return boneFlexDriversToLoad
+
+def scanLibraryIndex(fileObject, bodyOffset):
+    """
+    Rebuilds a library's index by reading every line after its header, counting the entries after each section header.
+    Raises ValueError if an entry comes before the first section header.
+    """
+    index = {}
+    section = None
+    offset = 0
+    fileObject.seek(bodyOffset)
+    for line in iter(fileObject.readline, b""):
+        if line.strip():
+            value = decodeLine(line)
+            if isSectionHeader(value):
+                section = {"offset": offset, "count": 0}
+                index[engine.normalizeModelName(value["model"])] = section
+            elif section is None:
+                raise ValueError("Bone flex drivers library has an entry outside of a model's section at byte %d" % (bodyOffset + offset))
+            else:
+                section["count"] += 1
+        offset += len(line)
+    return index
+
+def iterLibraryModel(fileObject, header, modelName):
+    """
+    Yields the exported JSON entries of a model from a library, parsing only that model's section.
+    Yields nothing if the library has no section for the model.
+    A stale index is rebuilt in the header with scanLibraryIndex() the first time it is found.
+    Raises ValueError if the model's section cannot be read even with a rebuilt index.
+    """
+    boneFlexDriversToLoad = readLibrarySection(fileObject, header, modelName)
+    if boneFlexDriversToLoad is None and not header.get("rebuiltIndex"):
+        header["index"] = scanLibraryIndex(fileObject, header["bodyOffset"])
+        header["rebuiltIndex"] = True
+        boneFlexDriversToLoad = readLibrarySection(fileObject, header, modelName)
+    if boneFlexDriversToLoad is None:
+        raise ValueError("Bone flex drivers library index does not match the section of model '%s'" % modelName)
+    for boneFlexDriverData in boneFlexDriversToLoad:
+        yield boneFlexDriverData
+
+def isLibraryFile(fileName):
+    """
+    Returns True if a file is a library, reading only its first line.
+    """
+    with io.open(fileName, "rb") as f:
+        return readLibraryHeader(f) is not None
+
+def getLibraryModelNames(fileName):
+    """
+    Returns the model paths indexed by a library file, reading only its first line.
+    """
+    with io.open(fileName, "rb") as f:
+        header = readLibraryHeader(f)
+    if header is None:
+        return []
+    return sorted(header.get("index", {}).keys())
+
+def loadLibrary(fileName, modelNames=None):
+    """
+    Reads a dictionary of model paths to exported JSON entries from a library file,
+    parsing only the sections of the given models, or every section if modelNames is None.
+    Raises ValueError if the file is not a library.
+    """
+    boneFlexDriversByModel = {}
+    with io.open(fileName, "rb") as f:
+        header = readLibraryHeader(f)
+        if header is None:
+            raise ValueError("Not a bone flex drivers library")
+        if modelNames is None:
+            modelNames = list(header.get("index", {}).keys())
+        for modelName in modelNames:
+            modelName = engine.normalizeModelName(modelName)
+            if modelName in header.get("index", {}): # the index may be rebuilt while reading
+                boneFlexDriversByModel[modelName] = list(iterLibraryModel(f, header, modelName))
+    return boneFlexDriversByModel
+
+def loadLibraryModel(fileName, modelName):
+    """
+    Reads the exported JSON entries of a single model from a library file, or an empty list if it has none.
+    """
+    return loadLibrary(fileName, [modelName]).get(engine.normalizeModelName(modelName), [])
@@ -0,0 +1,425 @@
+# Bone Flex Drivers local datamodel for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# MIT License
+#
+# Copyright (c) 2025 KiwifruitDev
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A pure-Python stand-in for the parts of SFM's vs, g_pDataModel and sfmApp used by the engine.
+# Pass this module to engine.setDatamodel() to generate operators outside of SFM.
+
+
+import bisect
+import math
+import uuid
+from collections import OrderedDict
+
+AT_ELEMENT = 1
+AT_INT = 2
+AT_FLOAT = 3
+AT_BOOL = 4
+AT_STRING = 5
+AT_TIME = 7
+AT_VECTOR3 = 10
+AT_QUATERNION = 12
+AT_ELEMENT_ARRAY = 15
+AT_FLOAT_ARRAY = 17
+AT_TIME_ARRAY = 23
+AT_VECTOR3_ARRAY = 26
+AT_QUATERNION_ARRAY = 28
+
+# Counters read by the benchmark, see resetStats()
+stats = {"elements": 0, "lookups": 0}
+
+def resetStats():
+    """
+    Resets the element allocation and attribute lookup counters.
+    """
+    stats["elements"] = 0
+    stats["lookups"] = 0
+
+def toText(value):
+    """
+    Decodes the utf-8 encoded byte strings the script passes to the datamodel.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+class DmeTime_t(object):
+    """
+    A time in seconds, stored as SFM's ten thousand ticks per second.
+    """
+    __slots__ = ("ticks",)
+    def __init__(self, seconds=0.0):
+        self.ticks = int(round(seconds * 10000.0))
+    def GetSeconds(self):
+        return self.ticks / 10000.0
+    def __eq__(self, other):
+        return isinstance(other, DmeTime_t) and self.ticks == other.ticks
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    def __hash__(self):
+        return hash(self.ticks)
+
+class Vector(object):
+    """
+    A 3D vector value with x, y and z components.
+    """
+    __slots__ = ("x", "y", "z")
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+class Quaternion(object):
+    """
+    A quaternion value with x, y, z and w components.
+    """
+    __slots__ = ("x", "y", "z", "w")
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.w = w
+
+# Attributes every element of a type starts with, as (name, type, default value)
+elementTypeAttributes = {
+    "DmeConnectionOperator": [("input", AT_ELEMENT, None), ("outputs", AT_ELEMENT_ARRAY, None)],
+    "DmeAttributeReference": [("element", AT_ELEMENT, None), ("attribute", AT_STRING, "")],
+    "DmeExpressionOperator": [("expr", AT_STRING, ""), ("result", AT_FLOAT, 0.0)],
+    "DmeUnpackQuaternionOperator": [("quaternion", AT_QUATERNION, Quaternion()), ("x", AT_FLOAT, 0.0), ("y", AT_FLOAT, 0.0), ("z", AT_FLOAT, 0.0), ("w", AT_FLOAT, 1.0)],
+    "DmeUnpackVector3Operator": [("vector", AT_VECTOR3, Vector()), ("x", AT_FLOAT, 0.0), ("y", AT_FLOAT, 0.0), ("z", AT_FLOAT, 0.0)],
+    "DmeTransform": [("position", AT_VECTOR3, Vector()), ("orientation", AT_QUATERNION, Quaternion())],
+    "DmeChannel": [("fromElement", AT_ELEMENT, None), ("fromAttribute", AT_STRING, ""), ("toElement", AT_ELEMENT, None), ("toAttribute", AT_STRING, ""), ("log", AT_ELEMENT, None)],
+    "DmeGlobalFlexControllerOperator": [("flexWeight", AT_FLOAT, 0.0)],
+    "DmeFilmClip": [("timeFrame", AT_ELEMENT, None), ("animationSets", AT_ELEMENT_ARRAY, None), ("operators", AT_ELEMENT_ARRAY, None)],
+    "DmeTimeFrame": [("start", AT_TIME, DmeTime_t()), ("duration", AT_TIME, DmeTime_t()), ("offset", AT_TIME, DmeTime_t()), ("scale", AT_FLOAT, 1.0)],
+    "DmeAnimationSet": [("controls", AT_ELEMENT_ARRAY, None)],
+    "DmeGameModel": [("modelName", AT_STRING, ""), ("globalFlexControllers", AT_ELEMENT_ARRAY, None)],
+}
+
+def getValueType(value):
+    """
+    Returns the attribute type SFM would infer for a value set on a missing attribute.
+    """
+    if value is None or isinstance(value, Element):
+        return AT_ELEMENT
+    if isinstance(value, bool):
+        return AT_BOOL
+    if isinstance(value, int):
+        return AT_INT
+    if isinstance(value, float):
+        return AT_FLOAT
+    return AT_STRING
+
+class ElementId(object):
+    """
+    Unique id of an element, printed like SFM's DmObjectId_t.
+    """
+    __slots__ = ("value",)
+    def __init__(self, value=None):
+        self.value = value or str(uuid.uuid4())
+    def __str__(self):
+        return self.value
+
+class Attribute(object):
+    """
+    A scalar attribute of an element, with SFM's GetValue/SetValue accessors.
+    """
+    __slots__ = ("element", "name")
+    def __init__(self, element, name):
+        self.element = element
+        self.name = name
+    def GetValue(self):
+        return self.element._attributes[self.name][1]
+    def SetValue(self, value):
+        self.element.SetValue(self.name, value)
+
+class ElementArray(object):
+    """
+    An element array attribute.
+    """
+    __slots__ = ("items",)
+    def __init__(self):
+        self.items = []
+    def count(self):
+        return len(self.items)
+    def remove(self, index):
+        del self.items[index]
+    def AddToTail(self, element):
+        self.items.append(element)
+        return len(self.items) - 1
+    def __getitem__(self, index):
+        return self.items[index]
+    def __len__(self):
+        return len(self.items)
+    def __iter__(self):
+        return iter(self.items)
+
+class Element(object):
+    """
+    A datamodel element: element and element array attributes read as the element or array itself,
+    other attributes read as an Attribute.
+    """
+    def __init__(self, elementType, name, fileId, uniqueId=None):
+        self._type = elementType
+        self._id = ElementId(uniqueId)
+        self._fileId = fileId
+        self._attributes = {"name": (AT_STRING, toText(name))}
+        for attributeName, attributeType, value in elementTypeAttributes.get(elementType, []):
+            self.AddAttribute(attributeName, attributeType)
+            if value is not None:
+                self._attributes[attributeName] = (attributeType, value)
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        stats["lookups"] += 1
+        attribute = self._attributes.get(name)
+        if attribute is None:
+            raise AttributeError(name)
+        if attribute[0] in (AT_ELEMENT, AT_ELEMENT_ARRAY):
+            return attribute[1]
+        return Attribute(self, name)
+    def GetType(self):
+        return self._type
+    def GetId(self):
+        return self._id
+    def GetFileId(self):
+        return self._fileId
+    def GetName(self):
+        return self._attributes["name"][1]
+    def SetName(self, name):
+        self._attributes["name"] = (AT_STRING, toText(name))
+    def HasAttribute(self, name):
+        return name in self._attributes
+    def GetAttributeNames(self):
+        return list(self._attributes.keys())
+    def GetAttributeType(self, name):
+        return self._attributes[name][0]
+    def AddAttribute(self, name, attributeType):
+        """
+        Adds an attribute, or returns the existing one, like SFM's AddAttribute.
+        Element arrays are returned as the array itself.
+        """
+        if name not in self._attributes:
+            value = None
+            if attributeType == AT_ELEMENT_ARRAY:
+                value = ElementArray()
+            elif attributeType in (AT_FLOAT_ARRAY, AT_TIME_ARRAY, AT_VECTOR3_ARRAY, AT_QUATERNION_ARRAY):
+                value = []
+            elif attributeType == AT_FLOAT:
+                value = 0.0
+            elif attributeType == AT_TIME:
+                value = DmeTime_t()
+            elif attributeType == AT_INT:
+                value = 0
+            elif attributeType == AT_BOOL:
+                value = False
+            elif attributeType == AT_STRING:
+                value = ""
+            self._attributes[name] = (attributeType, value)
+        if self._attributes[name][0] == AT_ELEMENT_ARRAY:
+            return self._attributes[name][1]
+        return Attribute(self, name)
+    def RemoveAttribute(self, name):
+        self._attributes.pop(name, None)
+    def SetValue(self, name, value):
+        """
+        Sets an attribute's value, adding it as an element attribute if it does not exist.
+        """
+        attribute = self._attributes.get(name)
+        if attribute is None:
+            self._attributes[name] = (getValueType(value), toText(value))
+            return
+        self._attributes[name] = (attribute[0], toText(value))
+    def GetValue(self, name):
+        return self._attributes[name][1]
+
+class Log(Element):
+    """
+    A DmeFloatLog, DmeVector3Log or DmeQuaternionLog with a single layer of keys sorted by time.
+    Values between keys are interpolated linearly, and held before the first and after the last key.
+    """
+    def __init__(self, elementType, name, fileId, uniqueId=None):
+        Element.__init__(self, elementType, name, fileId, uniqueId)
+        self._times = []
+        self._values = []
+    def GetKeyCount(self):
+        return len(self._times)
+    def GetKeyTime(self, index):
+        return DmeTime_t(self._times[index] / 10000.0)
+    def GetKeyValue(self, index):
+        return self._values[index]
+    def ClearKeys(self):
+        self._times = []
+        self._values = []
+    def SetKey(self, time, value):
+        """
+        Sets the value of the key at a time, inserting a key if there is none.
+        """
+        ticks = time.ticks
+        index = bisect.bisect_left(self._times, ticks)
+        if index < len(self._times) and self._times[index] == ticks:
+            self._values[index] = value
+            return
+        self._times.insert(index, ticks)
+        self._values.insert(index, value)
+    def GetValue(self, time):
+        """
+        Returns the log's value at a time.
+        """
+        if not self._times:
+            return None
+        ticks = time.ticks
+        index = bisect.bisect_right(self._times, ticks)
+        if index == 0:
+            return self._values[0]
+        if index == len(self._times):
+            return self._values[-1]
+        t = float(ticks - self._times[index - 1]) / (self._times[index] - self._times[index - 1])
+        return interpolate(self._values[index - 1], self._values[index], t)
+
+def interpolate(a, b, t):
+    """
+    Linearly interpolates floats and vectors, and normalized-linearly interpolates quaternions.
+    """
+    if isinstance(a, Quaternion):
+        if a.x * b.x + a.y * b.y + a.z * b.z + a.w * b.w < 0.0:
+            b = Quaternion(-b.x, -b.y, -b.z, -b.w) # take the shortest path
+        q = Quaternion(a.x + (b.x - a.x) * t, a.y + (b.y - a.y) * t, a.z + (b.z - a.z) * t, a.w + (b.w - a.w) * t)
+        length = math.sqrt(q.x * q.x + q.y * q.y + q.z * q.z + q.w * q.w) or 1.0
+        return Quaternion(q.x / length, q.y / length, q.z / length, q.w / length)
+    if isinstance(a, Vector):
+        return Vector(a.x + (b.x - a.x) * t, a.y + (b.y - a.y) * t, a.z + (b.z - a.z) * t)
+    return a + (b - a) * t
+
+def CreateElement(elementType, name, fileId):
+    """
+    Creates an element of the given type, counting it as an allocation.
+    """
+    stats["elements"] += 1
+    if elementType.endswith("Log"):
+        return Log(elementType, name, fileId)
+    return Element(elementType, name, fileId)
+
+def setAttributes(element, attributes):
+    """
+    Replaces every attribute of an element with the given (name, type, value) attributes in order,
+    like reading the element from a file.
+    """
+    element._attributes = OrderedDict([("name", (AT_STRING, ""))])
+    for attributeName, attributeType, value in attributes:
+        element._attributes[attributeName] = (attributeType, value)
+
+def loadElement(elementType, uniqueId, fileId, attributes):
+    """
+    Creates an element read from a file, with exactly the given (name, type, value) attributes in order
+    instead of its type's defaults. Logs are read as plain elements, keeping their layers as attributes.
+    """
+    stats["elements"] += 1
+    element = Element(elementType, "", fileId, uniqueId)
+    setAttributes(element, attributes)
+    return element
+
+class DataModel(object):
+    """
+    Stand-in for g_pDataModel, tracking the undo state instead of recording undo history.
+    """
+    def __init__(self):
+        self.undoEnabled = True
+        self.undoDepth = 0
+    def SetUndoEnabled(self, enabled):
+        self.undoEnabled = enabled
+    def IsUndoEnabled(self):
+        return self.undoEnabled
+    def StartUndo(self, description, redoDescription, chainId=0):
+        self.undoDepth += 1
+    def FinishUndo(self):
+        self.undoDepth -= 1
+    def AbortUndoableOperation(self):
+        self.undoDepth -= 1
+
+g_pDataModel = DataModel()
+
+class App(object):
+    """
+    Stand-in for sfmApp, holding the shots of a single document.
+    """
+    def __init__(self):
+        self.shots = []
+    def HasDocument(self):
+        return len(self.shots) > 0
+    def GetShots(self):
+        return self.shots
+
+sfmApp = App()
+
+def createShot(name, fileId=0, duration=10.0):
+    """
+    Creates an empty shot lasting duration seconds and adds it to the document.
+    """
+    shot = CreateElement("DmeFilmClip", name, fileId)
+    timeFrame = CreateElement("DmeTimeFrame", name + "_timeFrame", fileId)
+    timeFrame.duration.SetValue(DmeTime_t(duration))
+    shot.SetValue("timeFrame", timeFrame)
+    sfmApp.shots.append(shot)
+    return shot
+
+def createAnimationSet(shot, name, boneNames, flexNames, modelName=""):
+    """
+    Creates an animation set in a shot with a transform control per bone,
+    and a flex control and global flex controller per flex, like a model's animation set in SFM.
+    """
+    fileId = shot.GetFileId()
+    animationSet = CreateElement("DmeAnimationSet", name, fileId)
+    gameModel = CreateElement("DmeGameModel", name, fileId)
+    gameModel.modelName.SetValue(modelName)
+    animationSet.AddAttribute("gameModel", AT_ELEMENT).SetValue(gameModel)
+    for boneName in boneNames:
+        transform = CreateElement("DmeTransform", boneName, fileId)
+        control = CreateElement("DmElement", boneName, fileId)
+        for channelName, attributeName, logType in (("positionChannel", "position", "DmeVector3Log"), ("orientationChannel", "orientation", "DmeQuaternionLog")):
+            channel = CreateElement("DmeChannel", boneName + "_" + attributeName, fileId)
+            channel.SetValue("toElement", transform)
+            channel.toAttribute.SetValue(attributeName)
+            channel.SetValue("log", CreateElement(logType, boneName + "_" + attributeName + "_log", fileId))
+            control.AddAttribute(channelName, AT_ELEMENT).SetValue(channel)
+        animationSet.controls.AddToTail(control)
+    for flexName in flexNames:
+        flexController = CreateElement("DmeGlobalFlexControllerOperator", flexName, fileId)
+        gameModel.globalFlexControllers.AddToTail(flexController)
+        control = CreateElement("DmElement", flexName, fileId)
+        channel = CreateElement("DmeChannel", flexName + "_flex_channel", fileId)
+        channel.SetValue("toElement", flexController)
+        channel.toAttribute.SetValue("flexWeight")
+        channel.SetValue("log", CreateElement("DmeFloatLog", flexName + "_flex_log", fileId))
+        control.AddAttribute("channel", AT_ELEMENT).SetValue(channel)
+        animationSet.controls.AddToTail(control)
+    shot.animationSets.AddToTail(animationSet)
+    return animationSet
+
+def clearDocument():
+    """
+    Removes every shot from the document.
+    """
+    sfmApp.shots = []
@@ -0,0 +1,164 @@
+# Bone Flex Drivers profiling for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Opt-in timing of named sections of work, along with counters of what each section did:
+#   profiler.addCounter("elements", lambda: datamodel.createElementCount)
+#   with profiler.section("generateOperators"):
+#       ...
+
+
+import json
+import timeit
+from collections import OrderedDict, deque
+
+class CountingDatamodel(object):
+    """
+    Wraps the module the engine creates elements with, counting CreateElement calls.
+    Every other attribute is read from the wrapped module.
+    """
+    def __init__(self, datamodel):
+        self.datamodel = datamodel
+        self.createElementCount = 0
+    def CreateElement(self, *args):
+        self.createElementCount += 1
+        return self.datamodel.CreateElement(*args)
+    def __getattr__(self, name):
+        return getattr(self.datamodel, name)
+
+class SectionStats(object):
+    """
+    Rolling stats of a named section: its last historySize wall times and counter deltas.
+    """
+    def __init__(self, name, counterNames, historySize):
+        self.name = name
+        self.calls = 0
+        self.seconds = deque(maxlen=historySize)
+        self.counts = OrderedDict([(counterName, deque(maxlen=historySize)) for counterName in counterNames])
+    def add(self, seconds, counts):
+        self.calls += 1
+        self.seconds.append(seconds)
+        for counterName, count in counts.items():
+            if counterName not in self.counts:
+                self.counts[counterName] = deque(maxlen=self.seconds.maxlen)
+            self.counts[counterName].append(count)
+    def toDict(self):
+        """
+        Returns the section's call count, last, mean and max times in milliseconds, and last and mean counts.
+        """
+        times = [seconds * 1000.0 for seconds in self.seconds]
+        counts = OrderedDict()
+        for counterName, values in self.counts.items():
+            if values:
+                counts[counterName] = {"last": values[-1], "mean": float(sum(values)) / len(values)}
+        return OrderedDict([
+            ("name", self.name),
+            ("calls", self.calls),
+            ("lastMs", times[-1] if times else 0.0),
+            ("meanMs", sum(times) / len(times) if times else 0.0),
+            ("maxMs", max(times) if times else 0.0),
+            ("counts", counts),
+        ])
+
+class NullSection(object):
+    """
+    The section returned while profiling is disabled, which does nothing.
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        return False
+
+nullSection = NullSection()
+
+class Section(object):
+    """
+    Times a block of work and records it, with the change of every counter, when it exits.
+    Sections can be nested, each records its own inclusive time.
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.counts = None
+    def __enter__(self):
+        self.profiler.depth += 1
+        self.counts = self.profiler.readCounters()
+        self.start = timeit.default_timer()
+        return self
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        seconds = timeit.default_timer() - self.start
+        counts = self.profiler.readCounters()
+        for counterName in counts:
+            counts[counterName] -= self.counts.get(counterName, 0)
+        self.profiler.depth -= 1
+        self.profiler.record(self.name, seconds, counts)
+        return False
+
+class Profiler(object):
+    """
+    Records the wall time and counter changes of named sections while enabled, keeping rolling stats per name.
+    Listeners are called with the profiler whenever an outermost section finishes.
+    """
+    def __init__(self, historySize=50):
+        self.enabled = False
+        self.historySize = historySize
+        self.counters = OrderedDict() # name -> function returning the counter's running total
+        self.sections = OrderedDict() # name -> SectionStats
+        self.listeners = []
+        self.depth = 0
+    def addCounter(self, name, function):
+        self.counters[name] = function
+    def readCounters(self):
+        return OrderedDict([(name, function()) for name, function in self.counters.items()])
+    def section(self, name):
+        """
+        Returns a context manager timing a block of work under the given name, which does nothing while disabled.
+        """
+        if not self.enabled:
+            return nullSection
+        return Section(self, name)
+    def record(self, name, seconds, counts):
+        sectionStats = self.sections.get(name)
+        if sectionStats is None:
+            sectionStats = SectionStats(name, self.counters.keys(), self.historySize)
+            self.sections[name] = sectionStats
+        sectionStats.add(seconds, counts)
+        if self.depth == 0:
+            for listener in self.listeners:
+                listener(self)
+    def reset(self):
+        self.sections = OrderedDict()
+    def toDict(self):
+        """
+        Returns the rolling stats of every section, in the order they were first recorded.
+        """
+        return OrderedDict([
+            ("historySize", self.historySize),
+            ("counters", list(self.counters.keys())),
+            ("sections", [sectionStats.toDict() for sectionStats in self.sections.values()]),
+        ])
+    def save(self, fileName, extra=None):
+        """
+        Writes the rolling stats of every section to a JSON file, along with any extra top-level entries.
+        """
+        data = self.toDict()
+        if extra:
+            data.update(extra)
+        with open(fileName, 'w') as f:
+            json.dump(data, f, indent=4)
+
+def profiled(name):
+    """
+    Decorates a method of an object with a profiler attribute so each call is timed under the given name.
+    Every argument is passed on unchanged, so Qt signals with arguments the method does not take,
+    such as clicked(bool), must be connected through a lambda.
+    """
+    def decorator(function):
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.section(name):
+                return function(self, *args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
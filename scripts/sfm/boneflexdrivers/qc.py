@@ -0,0 +1,170 @@
+# Bone Flex Drivers QC import for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Reads $boneflexdriver commands from QC files, following $include, as exported JSON entries:
+#   $boneflexdriver "bone" tz "flex" 0 1
+#   $boneflexdriver "bone" {
+#       tx "flex_a" -1 1
+#       ty "flex_b" 0 2
+#   }
+
+
+import io
+import os
+import re
+
+# quoted strings, comments, braces and bare words, in one pass over the text
+tokenPattern = re.compile(r'"([^"\n]*)"?|//[^\n]*|/\*.*?(?:\*/|\Z)|([{}])|((?:[^\s{}"/]|/(?![/*]))+)', re.S)
+
+# QC bone components and the bone axis they drive
+componentAxes = {"tx": "X", "ty": "Y", "tz": "Z"}
+
+def tokenize(text):
+    """
+    Splits QC text into (token, quoted, position) tuples, skipping comments.
+    """
+    tokens = []
+    for match in tokenPattern.finditer(text):
+        quotedToken, brace, word = match.groups()
+        if quotedToken is not None:
+            tokens.append((quotedToken, True, match.start()))
+        elif brace is not None:
+            tokens.append((brace, False, match.start()))
+        elif word is not None:
+            tokens.append((word, False, match.start()))
+    return tokens
+
+def getLineNumber(text, position):
+    return text.count("\n", 0, position) + 1
+
+class QcParser(object):
+    """
+    Collects the $boneflexdriver commands and $modelname of a QC file and the files it includes.
+    """
+    def __init__(self):
+        self.entries = []
+        self.errors = []
+        self.modelName = None
+        self.rootDirectory = None
+        self.visitedFiles = set()
+    def parseFile(self, fileName):
+        """
+        Parses a QC file, unless it was already parsed through another $include.
+        """
+        fileName = os.path.normcase(os.path.abspath(fileName))
+        if self.rootDirectory is None:
+            self.rootDirectory = os.path.dirname(fileName)
+        if fileName in self.visitedFiles:
+            return
+        self.visitedFiles.add(fileName)
+        try:
+            with io.open(fileName, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except (IOError, OSError) as e:
+            self.errors.append("%s: %s" % (fileName, str(e)))
+            return
+        self.parseText(text, fileName)
+    def parseText(self, text, fileName):
+        """
+        Parses QC text, resolving $include paths relative to fileName's folder, then to the first QC file's folder.
+        """
+        tokens = tokenize(text)
+        i = 0
+        tokenCount = len(tokens)
+        while i < tokenCount:
+            token, quoted, position = tokens[i]
+            i += 1
+            if quoted or not token.startswith("$"):
+                continue
+            command = token.lower()
+            if command == "$include" and i < tokenCount:
+                includeName = tokens[i][0]
+                i += 1
+                includeFileName = os.path.join(os.path.dirname(fileName), includeName)
+                if not os.path.exists(includeFileName) and self.rootDirectory is not None:
+                    includeFileName = os.path.join(self.rootDirectory, includeName)
+                self.parseFile(includeFileName)
+            elif command == "$modelname" and i < tokenCount:
+                modelName = tokens[i][0].replace("\\", "/")
+                i += 1
+                if not modelName.lower().startswith("models/"):
+                    modelName = "models/" + modelName
+                self.modelName = modelName
+            elif command == "$boneflexdriver":
+                i = self.parseBoneFlexDriver(tokens, i, text, fileName, position)
+    def parseBoneFlexDriver(self, tokens, i, text, fileName, position):
+        """
+        Parses the arguments of a $boneflexdriver command starting at token i, and returns the index after them.
+        """
+        if i >= len(tokens):
+            self.addError(text, fileName, position, "$boneflexdriver is missing its bone name")
+            return i
+        boneName = tokens[i][0]
+        i += 1
+        if i < len(tokens) and tokens[i][0] == "{" and not tokens[i][1]:
+            i += 1
+            while i < len(tokens) and (tokens[i][1] or tokens[i][0] != "}"):
+                i = self.parseComponent(tokens, i, boneName, text, fileName)
+            return i + 1
+        return self.parseComponent(tokens, i, boneName, text, fileName)
+    def parseComponent(self, tokens, i, boneName, text, fileName):
+        """
+        Parses a "<component> <flex controller> <min> <max>" group into an exported JSON entry,
+        and returns the index after it.
+        """
+        group = []
+        position = tokens[i][2] if i < len(tokens) else len(text)
+        while i < len(tokens) and len(group) < 4:
+            if not tokens[i][1] and (tokens[i][0] in ("{", "}") or tokens[i][0].startswith("$")):
+                break # the group is cut short by a brace or the next command
+            group.append(tokens[i][0])
+            i += 1
+        if len(group) < 4:
+            self.addError(text, fileName, position, "$boneflexdriver of bone '%s' expects a component, flex controller, min and max" % boneName)
+            if not group:
+                i += 1 # skip the token the group stopped at so parsing always moves forward
+            return i
+        component, flexName, minimum, maximum = group
+        axis = componentAxes.get(component.lower())
+        if axis is None:
+            self.addError(text, fileName, position, "Unsupported component '%s' of bone '%s', expected tx, ty or tz" % (component, boneName))
+            return i
+        try:
+            minBoneRange = float(minimum)
+            maxBoneRange = float(maximum)
+        except ValueError:
+            self.addError(text, fileName, position, "Invalid range '%s %s' of flex controller '%s'" % (minimum, maximum, flexName))
+            return i
+        self.entries.append({
+            "name": flexName,
+            "active": True,
+            "flexName": flexName,
+            "boneName": boneName,
+            "minFlexRange": 0.0,
+            "maxFlexRange": 1.0,
+            "usePosition": True,
+            "boneAxis": axis,
+            "minBoneRange": minBoneRange,
+            "maxBoneRange": maxBoneRange,
+            "clamp": True,
+            "boneDefaultPosition": 0.0,
+        })
+        return i
+    def addError(self, text, fileName, position, message):
+        self.errors.append("%s(%d): %s" % (os.path.basename(fileName), getLineNumber(text, position), message))
+
+def isQcFile(fileName):
+    """
+    Returns True if a file name has a QC extension.
+    """
+    return os.path.splitext(fileName)[1].lower() in (".qc", ".qci")
+
+def parseQcFile(fileName):
+    """
+    Reads the $boneflexdriver commands of a QC file and the files it includes.
+    Returns the model path from $modelname (or None), the exported JSON entries, and a list of error messages.
+    """
+    parser = QcParser()
+    parser.parseFile(fileName)
+    return parser.modelName, parser.entries, parser.errors
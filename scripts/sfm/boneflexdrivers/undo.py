@@ -0,0 +1,85 @@
+# Bone Flex Drivers undo transactions for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Groups the datamodel edits of one logical operation into a single undo entry:
+#   with undoTransactions.transaction("Edit Bone Flex Driver", ("minBoneRange", uniqueId)):
+#       element.minBoneRange.SetValue(value)
+
+
+class Transaction(object):
+    """
+    A context manager joining the transaction in progress, or starting and finishing an undo entry when outermost.
+    An exception leaving the outermost transaction aborts its undo entry, and undo is always restored.
+    """
+    def __init__(self, transactions, description, coalesceKey, undoable):
+        self.transactions = transactions
+        self.description = description
+        self.coalesceKey = coalesceKey
+        self.undoable = undoable
+    def __enter__(self):
+        self.transactions.begin(self.description, self.coalesceKey, self.undoable)
+        return self
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.transactions.end(exceptionType is not None)
+        return False
+
+class UndoTransactions(object):
+    """
+    Nestable undo transactions over a datamodel with SFM's g_pDataModel undo calls.
+    Only the outermost transaction starts an undo entry, nested ones are part of it.
+    Consecutive transactions with the same coalesce key share an undo chain, so SFM merges them into one entry,
+    such as every step of a spin box drag followed by the regeneration it causes.
+    Transactions that are not undoable disable undo instead, keeping bulk edits fast.
+    """
+    def __init__(self, datamodel):
+        self.datamodel = datamodel
+        self.depth = 0
+        self.recording = False # whether the outermost transaction started an undo entry
+        self.undoWasEnabled = True
+        self.transactionKey = None # coalesce key of the outermost transaction in progress
+        self.coalesceKey = None # key of the last transaction with one, whose chain the next one with the same key joins
+        self.chainId = 0
+        self.nextChainId = 1
+    def transaction(self, description, coalesceKey=None, undoable=True):
+        """
+        Returns a context manager grouping the edits made within it into a single undo entry with the given description.
+        """
+        return Transaction(self, description, coalesceKey, undoable)
+    def getChainId(self, coalesceKey):
+        """
+        Returns the undo chain of a coalesce key, which is the last chain if the key is the last one used, or a new chain.
+        Transactions without a key are never chained, and end the last chain.
+        """
+        if coalesceKey is None:
+            self.coalesceKey = None
+            return 0
+        if coalesceKey != self.coalesceKey:
+            self.coalesceKey = coalesceKey
+            self.chainId = self.nextChainId
+            self.nextChainId += 1
+        return self.chainId
+    def begin(self, description, coalesceKey=None, undoable=True):
+        self.depth += 1
+        if self.depth > 1:
+            return # part of the outermost transaction
+        self.transactionKey = coalesceKey
+        self.undoWasEnabled = self.datamodel.IsUndoEnabled()
+        self.recording = undoable and self.undoWasEnabled
+        if self.recording:
+            self.datamodel.StartUndo(description, description, self.getChainId(coalesceKey))
+        elif self.undoWasEnabled:
+            self.datamodel.SetUndoEnabled(False)
+    def end(self, failed=False):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        self.transactionKey = None
+        if self.recording:
+            self.recording = False
+            if failed:
+                self.datamodel.AbortUndoableOperation()
+            else:
+                self.datamodel.FinishUndo()
+        elif self.undoWasEnabled:
+            self.datamodel.SetUndoEnabled(True)
@@ -25,13 +25,22 @@
 # SOFTWARE.
 
 
+import os
+import sys
+import inspect
+import timeit
 import sfm
 import sfmApp
-import json
 import vs
 from vs import g_pDataModel as dm
 from PySide import QtGui, QtCore, shiboken
 
+# the boneflexdrivers package lives in scripts/sfm, next to the mainmenu folder
+boneFlexDriversScriptsPath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+if boneFlexDriversScriptsPath not in sys.path:
+    sys.path.append(boneFlexDriversScriptsPath)
+from boneflexdrivers import engine, bake, library, qc, profiling, undo
+
 try:
     sfm
 except NameError:
@@ -39,6 +48,152 @@ except NameError:
 
 boneFlexDriversWindow = None
 boneFlexDriversVersion = "1.1.0"
+boneFlexDriversCommitDelay = 300 # milliseconds to wait for further spin box and text edits before regenerating
+boneFlexDriversBakeFrameRate = 24.0 # frames per second to bake at when the document's frame rate is unavailable
+boneFlexDriversValueRefreshInterval = 100 # milliseconds between reads of the visible rows' flex values
+boneFlexDriversValueRefreshBudget = 0.05 # most of the time spent reading flex values, slowing the refresh down when exceeded
+boneFlexDriversUndoableImports = True # record Import and Import All as an undo entry, turn off to keep very large imports fast
+boneFlexDriversOptimizedGraph = True # only connect the components each expression reads, and share unpack stages between bone flex drivers
+
+class BoneFlexDriversTableModel(QtCore.QAbstractTableModel):
+    """
+    Table of the bone flex drivers of an animation set, read from their elements without any per-row widgets.
+    The active column is a checkbox through the check state role, toggling it emits activeToggled.
+    """
+    NAME, FLEX, BONE, VALUE, ACTIVE, UNIQUE_ID = range(6)
+    headers = ["Name", "Flex", "Bone", "Value", "Active", "Unique Id"]
+    activeToggled = QtCore.Signal(bool, str)
+    def __init__(self, parent=None):
+        super(BoneFlexDriversTableModel, self).__init__(parent)
+        self.boneFlexDriverRows = [] # [uniqueId, element, name, flexName, boneName, value, active] per row
+        self.rowsByUniqueId = {}
+    def readRow(self, row):
+        """
+        Reads the displayed properties of a row's bone flex driver from its element.
+        """
+        element = row[1]
+        row[2] = element.name.GetValue()
+        row[3] = element.flexName.GetValue()
+        row[4] = element.boneName.GetValue()
+        row[6] = element.active.GetValue()
+    def setBoneFlexDrivers(self, elements):
+        """
+        Replaces the rows with the given bone flex driver elements.
+        """
+        self.beginResetModel()
+        self.boneFlexDriverRows = []
+        self.rowsByUniqueId = {}
+        for element in elements:
+            row = [element.GetId().__str__(), element, "", "", "", None, False]
+            self.readRow(row)
+            self.rowsByUniqueId[row[0]] = len(self.boneFlexDriverRows)
+            self.boneFlexDriverRows.append(row)
+        self.endResetModel()
+    def clear(self):
+        self.setBoneFlexDrivers([])
+    def findRow(self, uniqueId):
+        """
+        Returns the row of the bone flex driver with the given unique id, or -1.
+        """
+        return self.rowsByUniqueId.get(uniqueId, -1)
+    def getUniqueId(self, row):
+        return self.boneFlexDriverRows[row][0]
+    def getFlexName(self, row):
+        return self.boneFlexDriverRows[row][3]
+    def refreshBoneFlexDriver(self, uniqueId):
+        """
+        Re-reads a single bone flex driver's element and repaints only its row.
+        """
+        row = self.findRow(uniqueId)
+        if row < 0:
+            return
+        self.readRow(self.boneFlexDriverRows[row])
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+    def setValues(self, rows, values):
+        """
+        Sets the flex values shown for the given rows, repainting the value column once if any of them changed.
+        """
+        firstRow = None
+        lastRow = None
+        for row, value in zip(rows, values):
+            if self.boneFlexDriverRows[row][5] == value:
+                continue
+            self.boneFlexDriverRows[row][5] = value
+            if firstRow is None or row < firstRow:
+                firstRow = row
+            if lastRow is None or row > lastRow:
+                lastRow = row
+        if firstRow is not None:
+            self.dataChanged.emit(self.index(firstRow, self.VALUE), self.index(lastRow, self.VALUE))
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.boneFlexDriverRows)
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headers[section]
+        return None
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if index.column() == self.ACTIVE:
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        return flags
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.boneFlexDriverRows[index.row()]
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == self.VALUE:
+                return "" if row[5] is None else "%.3f" % row[5]
+            if column == self.UNIQUE_ID:
+                return row[0]
+            if column in (self.NAME, self.FLEX, self.BONE):
+                return row[column + 2]
+        elif role == QtCore.Qt.CheckStateRole and column == self.ACTIVE:
+            return QtCore.Qt.Checked if row[6] else QtCore.Qt.Unchecked
+        elif role == QtCore.Qt.UserRole:
+            # sort key
+            if column == self.VALUE:
+                return -1e30 if row[5] is None else row[5]
+            if column == self.ACTIVE:
+                return 1 if row[6] else 0
+            if column == self.UNIQUE_ID:
+                return row[0]
+            return row[column + 2].lower()
+        return None
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or index.column() != self.ACTIVE or role != QtCore.Qt.CheckStateRole:
+            return False
+        # the window writes the element, then calls refreshBoneFlexDriver()
+        self.activeToggled.emit(value == QtCore.Qt.Checked, self.boneFlexDriverRows[index.row()][0])
+        return True
+
+class BoneFlexDriversFilterModel(QtGui.QSortFilterProxyModel):
+    """
+    Sorts the bone flex drivers table and filters it by name, flex or bone.
+    """
+    def __init__(self, parent=None):
+        super(BoneFlexDriversFilterModel, self).__init__(parent)
+        self.filterText = ""
+        self.setSortRole(QtCore.Qt.UserRole)
+    def setFilterText(self, text):
+        self.filterText = text.strip().lower()
+        self.invalidateFilter()
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        if not self.filterText:
+            return True
+        model = self.sourceModel()
+        for column in (model.NAME, model.FLEX, model.BONE):
+            if self.filterText in model.boneFlexDriverRows[sourceRow][column + 2].lower():
+                return True
+        return False
 
 class BoneFlexDriversWindow(QtGui.QWidget):
     def __init__(self):
@@ -52,6 +207,34 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.currentShot = ""
         self.currentAnimationSet = ""
         self.currentBoneFlexDriverUniqueId = "00000000-0000-0000-0000-000000000000"
+        self.populatingDetails = False # set while the details panel is filled, so its handlers don't edit the bone flex driver
+        self.boneFlexDriverRegistry = None
+        self.generator = engine.OperatorGenerator(boneFlexDriversOptimizedGraph)
+        self.nameListModels = {}
+        self.dirtyBoneFlexDrivers = set()
+        self.dirtyBoneFlexDriverExpressions = set()
+        self.dirtyBoneFlexDriverInputs = set()
+        self.commitDelay = boneFlexDriversCommitDelay
+        self.coalescedEdits = 0
+        self.pendingCommitKey = None # coalesce key of the edits waiting on the commit timer
+        self.commitTimer = QtCore.QTimer(self)
+        self.commitTimer.setSingleShot(True)
+        self.commitTimer.timeout.connect(self.flushPendingCommits)
+        self.valueRefreshInterval = boneFlexDriversValueRefreshInterval
+        self.valueRefreshTimer = QtCore.QTimer(self)
+        self.valueRefreshTimer.setSingleShot(True)
+        self.valueRefreshTimer.timeout.connect(self.refreshVisibleValues)
+        self.valueRefreshAnimationSets = {} # shot unique id -> (name, element) of the animation set whose values are shown
+        # each edit and the regeneration it causes is one undo entry, repeated edits of the same field are merged
+        self.undo = undo.UndoTransactions(dm)
+        # handlers are only timed once profiling is turned on in the diagnostics panel
+        self.profiler = profiling.Profiler()
+        self.countingDatamodel = profiling.CountingDatamodel(engine.getDatamodel())
+        self.profiler.addCounter("elementsCreated", lambda: self.countingDatamodel.createElementCount)
+        # elements the engine walks in its scans and lookups, which is not every attribute read SFM serves
+        self.profiler.addCounter("elementsVisited", lambda: engine.stats["reads"])
+        self.profiler.addCounter("operators", lambda: engine.stats["operators"])
+        self.profiler.listeners.append(self.profileRecorded)
 
         # Layout
         self.layout = QtGui.QVBoxLayout()
@@ -81,7 +264,17 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.refreshButton.setToolTip("Regenerate the bone flex driver operators and refresh the list of shots, animation sets, and bone flex drivers")
         self.controlPanel.addStretch(1)
         self.controlPanel.addWidget(self.refreshButton, 0, QtCore.Qt.AlignRight)
-        self.refreshButton.clicked.connect(self.refreshBoneFlexDrivers)
+        self.rebuildAllButton = QtGui.QPushButton("Rebuild All")
+        self.rebuildAllButton.setToolTip("Regenerate the operators of every bone flex driver in every shot. Edits only rebuild the bone flex driver that changed.")
+        self.controlPanel.addWidget(self.rebuildAllButton, 0, QtCore.Qt.AlignRight)
+        self.optimizedGraphCheckbox = QtGui.QCheckBox("Optimized Graph")
+        self.optimizedGraphCheckbox.setToolTip("Only connect the bone components each bone flex driver reads (translate drivers skip the unused axes) and share one transform and unpack stage between bone flex drivers reading the same bone, reducing the operators SFM evaluates every frame")
+        self.optimizedGraphCheckbox.setChecked(self.generator.optimizedGraph)
+        self.optimizedGraphCheckbox.stateChanged.connect(self.optimizedGraphChanged)
+        self.controlPanel.addWidget(self.optimizedGraphCheckbox, 0, QtCore.Qt.AlignRight)
+        # profiled handlers are passed every argument of a signal, so the checked argument of clicked(bool) is dropped by a lambda
+        self.refreshButton.clicked.connect(lambda: self.refreshBoneFlexDrivers())
+        self.rebuildAllButton.clicked.connect(lambda: self.rebuildAllOperators())
         self.shotDropdown.currentIndexChanged.connect(self.shotChanged)
         self.animationSetDropdown.currentIndexChanged.connect(self.animationSetChanged)
 
@@ -110,15 +303,29 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         # Bone Flex Driver -> Animation Set -> Flex & Bone
 
         # Top layout: Table of bone flex drivers
-        self.boneFlexDriversTable = QtGui.QTableWidget()
+        self.boneFlexDriversFilterEdit = QtGui.QLineEdit()
+        self.boneFlexDriversFilterEdit.setPlaceholderText("Filter by name, flex or bone")
+        self.boneFlexDriversFilterEdit.setToolTip("Only show bone flex drivers whose name, flex or bone contains this text")
+        self.topLayout.addWidget(self.boneFlexDriversFilterEdit)
+        self.boneFlexDriversModel = BoneFlexDriversTableModel(self)
+        self.boneFlexDriversModel.activeToggled.connect(self.onBoneFlexDriverActiveChanged)
+        self.boneFlexDriversFilterModel = BoneFlexDriversFilterModel(self)
+        self.boneFlexDriversFilterModel.setSourceModel(self.boneFlexDriversModel)
+        self.boneFlexDriversFilterEdit.textChanged.connect(self.boneFlexDriversFilterModel.setFilterText)
+        # the value refresh stops while the table is empty, and starts again once it has rows
+        self.boneFlexDriversFilterModel.modelReset.connect(self.visibleRowsChanged)
+        self.boneFlexDriversFilterModel.rowsInserted.connect(self.visibleRowsChanged)
+        self.boneFlexDriversFilterModel.layoutChanged.connect(self.visibleRowsChanged)
+        self.boneFlexDriversTable = QtGui.QTableView()
+        self.boneFlexDriversTable.setModel(self.boneFlexDriversFilterModel)
         self.boneFlexDriversTable.setSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
         self.boneFlexDriversTable.setContentsMargins(0, 0, 0, 0)
         self.boneFlexDriversTable.setEnabled(False)
-        self.boneFlexDriversTable.setColumnCount(6)
-        self.boneFlexDriversTable.setHorizontalHeaderLabels(["Name", "Flex", "Bone", "Value", "Active", "Unique Id"]) # active is a checkbox
         self.boneFlexDriversTable.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
         self.boneFlexDriversTable.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
-        self.boneFlexDriversTable.itemSelectionChanged.connect(self.boneFlexDriverSelectionChanged)
+        self.boneFlexDriversTable.setSortingEnabled(True)
+        self.boneFlexDriversTable.sortByColumn(-1, QtCore.Qt.AscendingOrder) # keep the shot's order until a header is clicked
+        self.boneFlexDriversTable.selectionModel().selectionChanged.connect(self.boneFlexDriverSelectionChanged)
         self.boneFlexDriversTable.horizontalHeader().setResizeMode(0, QtGui.QHeaderView.Stretch)
         self.boneFlexDriversTable.horizontalHeader().setResizeMode(1, QtGui.QHeaderView.Stretch)
         self.boneFlexDriversTable.horizontalHeader().setResizeMode(2, QtGui.QHeaderView.Stretch)
@@ -126,7 +333,6 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.boneFlexDriversTable.horizontalHeader().setResizeMode(4, QtGui.QHeaderView.ResizeToContents)
         self.boneFlexDriversTable.horizontalHeader().setResizeMode(5, QtGui.QHeaderView.ResizeToContents)
         # Hide the Unique Id column
-        self.boneFlexDriversTable.setColumnHidden(3, True) # value is unused
         self.boneFlexDriversTable.setColumnHidden(5, True)
         self.topLayout.addWidget(self.boneFlexDriversTable)
 
@@ -144,6 +350,16 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.saveBoneFlexDriversButton.setToolTip("Save bone flex drivers to a JSON file")
         self.saveBoneFlexDriversButton.clicked.connect(self.saveBoneFlexDrivers)
         self.boneFlexDriversButtonsLayout.addWidget(self.saveBoneFlexDriversButton)
+        self.loadSessionBoneFlexDriversButton = QtGui.QPushButton("Import All")
+        self.loadSessionBoneFlexDriversButton.setEnabled(False)
+        self.loadSessionBoneFlexDriversButton.setToolTip("Load bone flex drivers from a JSON file and add them to every animation set in every shot using the same model. Files saved with Export add their bone flex drivers to every animation set using this animation set's model.")
+        self.loadSessionBoneFlexDriversButton.clicked.connect(self.loadSessionBoneFlexDrivers)
+        self.boneFlexDriversButtonsLayout.addWidget(self.loadSessionBoneFlexDriversButton)
+        self.saveSessionBoneFlexDriversButton = QtGui.QPushButton("Export All")
+        self.saveSessionBoneFlexDriversButton.setEnabled(False)
+        self.saveSessionBoneFlexDriversButton.setToolTip("Save the bone flex drivers of every shot and animation set to a JSON file, grouped by model")
+        self.saveSessionBoneFlexDriversButton.clicked.connect(self.saveSessionBoneFlexDrivers)
+        self.boneFlexDriversButtonsLayout.addWidget(self.saveSessionBoneFlexDriversButton)
         self.addBoneFlexDriverButton = QtGui.QPushButton("Add")
         self.addBoneFlexDriverButton.setEnabled(False)
         self.addBoneFlexDriverButton.setToolTip("Add a new bone flex driver")
@@ -152,9 +368,19 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.removeBoneFlexDriverButton = QtGui.QPushButton("Remove")
         self.removeBoneFlexDriverButton.setEnabled(False)
         self.removeBoneFlexDriverButton.setToolTip("Remove the selected bone flex driver")
-        self.removeBoneFlexDriverButton.clicked.connect(self.removeBoneFlexDriver)
+        self.removeBoneFlexDriverButton.clicked.connect(lambda: self.removeBoneFlexDriver())
         self.boneFlexDriversButtonsLayout.addWidget(self.removeBoneFlexDriverButton)
         self.boneFlexDriversButtonsLayout.addStretch()
+        self.bakeBoneFlexDriversButton = QtGui.QPushButton("Bake")
+        self.bakeBoneFlexDriversButton.setEnabled(False)
+        self.bakeBoneFlexDriversButton.setToolTip("Bake the flex values of this animation set's active bone flex drivers into keys on their flex controls over the shot, removing their operators")
+        self.bakeBoneFlexDriversButton.clicked.connect(lambda: self.bakeBoneFlexDrivers())
+        self.boneFlexDriversButtonsLayout.addWidget(self.bakeBoneFlexDriversButton)
+        self.unbakeBoneFlexDriversButton = QtGui.QPushButton("Unbake")
+        self.unbakeBoneFlexDriversButton.setEnabled(False)
+        self.unbakeBoneFlexDriversButton.setToolTip("Restore the flex control keys of this animation set's baked bone flex drivers and regenerate their operators")
+        self.unbakeBoneFlexDriversButton.clicked.connect(lambda: self.unbakeBoneFlexDrivers())
+        self.boneFlexDriversButtonsLayout.addWidget(self.unbakeBoneFlexDriversButton)
 
         # Bottom layout: Deactivated until a bone flex driver is selected
         # Show controls for the selected bone flex driver:
@@ -178,6 +404,7 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.boneFlexDriverNameEdit = QtGui.QLineEdit()
         self.boneFlexDriverNameEdit.setToolTip("Name of the bone flex driver")
         self.boneFlexDriverNameEdit.textChanged.connect(self.boneFlexDriverNameChanged)
+        self.boneFlexDriverNameEdit.editingFinished.connect(self.flushPendingCommits)
         self.boneFlexDriverDetailsLayout.addRow("Name:", self.boneFlexDriverNameEdit)
         self.boneFlexDriverActiveCheckbox = QtGui.QCheckBox()
         self.boneFlexDriverActiveCheckbox.setToolTip("Whether this bone flex driver is active. When active, animation for the chosen flex will be disabled in order to be controlled by this bone flex driver.")
@@ -192,12 +419,14 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.minFlexRangeSpin.setRange(-1.0, 1.0)
         self.minFlexRangeSpin.setSingleStep(0.01)
         self.minFlexRangeSpin.valueChanged.connect(self.minFlexRangeChanged)
+        self.minFlexRangeSpin.editingFinished.connect(self.flushPendingCommits)
         self.boneFlexDriverDetailsLayout.addRow("Min Flex Range:", self.minFlexRangeSpin)
         self.maxFlexRangeSpin = QtGui.QDoubleSpinBox()
         self.maxFlexRangeSpin.setToolTip("Maximum flex value")
         self.maxFlexRangeSpin.setRange(-1.0, 1.0)
         self.maxFlexRangeSpin.setSingleStep(0.01)
         self.maxFlexRangeSpin.valueChanged.connect(self.maxFlexRangeChanged)
+        self.maxFlexRangeSpin.editingFinished.connect(self.flushPendingCommits)
         self.boneFlexDriverDetailsLayout.addRow("Max Flex Range:", self.maxFlexRangeSpin)
         self.boneEdit = QtGui.QComboBox()
         self.boneEdit.setToolTip("Select the bone to influence the flex value.")
@@ -219,6 +448,7 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.boneDefaultPositionSpin.setRange(-2147483648.0, 2147483647.0)
         self.boneDefaultPositionSpin.setSingleStep(1.0)
         self.boneDefaultPositionSpin.valueChanged.connect(self.boneDefaultPositionChanged)
+        self.boneDefaultPositionSpin.editingFinished.connect(self.flushPendingCommits)
         self.boneDefaultPositionSpin.setEnabled(False)
         self.boneFlexDriverDetailsLayout.addRow("Bone Default Position:", self.boneDefaultPositionSpin)
         self.minBoneRangeSpin = QtGui.QDoubleSpinBox()
@@ -226,12 +456,14 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         self.minBoneRangeSpin.setRange(-360.0, 360.0)
         self.minBoneRangeSpin.setSingleStep(1.0)
         self.minBoneRangeSpin.valueChanged.connect(self.minBoneRangeChanged)
+        self.minBoneRangeSpin.editingFinished.connect(self.flushPendingCommits)
         self.boneFlexDriverDetailsLayout.addRow("Min Bone Range:", self.minBoneRangeSpin)
         self.maxBoneRangeSpin = QtGui.QDoubleSpinBox()
         self.maxBoneRangeSpin.setToolTip("The maximum rotation on the chosen axis for this bone for the flex value to reach 1.")
         self.maxBoneRangeSpin.setRange(-360.0, 360.0)
         self.maxBoneRangeSpin.setSingleStep(1.0)
         self.maxBoneRangeSpin.valueChanged.connect(self.maxBoneRangeChanged)
+        self.maxBoneRangeSpin.editingFinished.connect(self.flushPendingCommits)
         self.boneFlexDriverDetailsLayout.addRow("Max Bone Range:", self.maxBoneRangeSpin)
         self.clampCheckbox = QtGui.QCheckBox()
         self.clampCheckbox.setToolTip("Keeps the flex value within its min/max range, even if the bone value goes beyond its limits. Prevents extreme or unwanted flex movement.")
@@ -240,10 +472,56 @@ class BoneFlexDriversWindow(QtGui.QWidget):
 
         # Status bar
         self.statusBar = QtGui.QLabel()
-        self.statusBar.setText("SFM Bone Flex Drivers by KiwifruitDev v%s" % boneFlexDriversVersion)
+        self.setStatus("")
         self.layout.addWidget(self.statusBar)
 
+        # Diagnostics panel, collapsed below the status bar
+        self.diagnosticsToggle = QtGui.QToolButton()
+        self.diagnosticsToggle.setText("Diagnostics")
+        self.diagnosticsToggle.setToolTip("Show the time and work of each handler while profiling is on")
+        self.diagnosticsToggle.setToolButtonStyle(QtCore.Qt.ToolButtonTextBesideIcon)
+        self.diagnosticsToggle.setArrowType(QtCore.Qt.RightArrow)
+        self.diagnosticsToggle.setAutoRaise(True)
+        self.diagnosticsToggle.setCheckable(True)
+        self.diagnosticsToggle.toggled.connect(self.diagnosticsToggled)
+        self.layout.addWidget(self.diagnosticsToggle)
+        self.diagnosticsPanel = QtGui.QWidget()
+        self.diagnosticsPanel.setVisible(False)
+        self.diagnosticsLayout = QtGui.QVBoxLayout()
+        self.diagnosticsLayout.setContentsMargins(0, 0, 0, 0)
+        self.diagnosticsPanel.setLayout(self.diagnosticsLayout)
+        self.diagnosticsButtonsLayout = QtGui.QHBoxLayout()
+        self.diagnosticsButtonsLayout.setContentsMargins(0, 0, 0, 0)
+        self.diagnosticsLayout.addLayout(self.diagnosticsButtonsLayout)
+        self.profilingCheckbox = QtGui.QCheckBox("Profile Handlers")
+        self.profilingCheckbox.setToolTip("Record the wall time, elements created, elements visited and operators generated of every handler, keeping the last %d calls of each" % self.profiler.historySize)
+        self.profilingCheckbox.stateChanged.connect(self.profilingChanged)
+        self.diagnosticsButtonsLayout.addWidget(self.profilingCheckbox)
+        self.diagnosticsButtonsLayout.addStretch()
+        self.resetDiagnosticsButton = QtGui.QPushButton("Reset")
+        self.resetDiagnosticsButton.setToolTip("Clear the recorded stats")
+        self.resetDiagnosticsButton.clicked.connect(self.resetDiagnostics)
+        self.diagnosticsButtonsLayout.addWidget(self.resetDiagnosticsButton)
+        self.saveDiagnosticsButton = QtGui.QPushButton("Save JSON")
+        self.saveDiagnosticsButton.setToolTip("Save the recorded stats to a JSON file")
+        self.saveDiagnosticsButton.clicked.connect(self.saveDiagnostics)
+        self.diagnosticsButtonsLayout.addWidget(self.saveDiagnosticsButton)
+        self.diagnosticsTable = QtGui.QTableWidget(0, 8)
+        self.diagnosticsTable.setHorizontalHeaderLabels(["Section", "Calls", "Last (ms)", "Mean (ms)", "Max (ms)", "Elements Created", "Elements Visited", "Operators"])
+        self.diagnosticsTable.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.diagnosticsTable.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.diagnosticsTable.verticalHeader().setVisible(False)
+        self.diagnosticsTable.horizontalHeader().setResizeMode(0, QtGui.QHeaderView.Stretch)
+        for column in range(1, 8):
+            self.diagnosticsTable.horizontalHeader().setResizeMode(column, QtGui.QHeaderView.ResizeToContents)
+        self.diagnosticsLayout.addWidget(self.diagnosticsTable)
+        self.layout.addWidget(self.diagnosticsPanel)
+
         self.refreshBoneFlexDrivers()
+        self.startValueRefresh()
+        # SFM's undo and redo can change the bone flex drivers while another window has focus
+        QtGui.QApplication.instance().focusChanged.connect(self.applicationFocusChanged)
+    @profiling.profiled("boneMovementChanged")
     def boneMovementChanged(self, index):
         if self.currentBoneFlexDriverUniqueId == "00000000-0000-0000-0000-000000000000":
             return
@@ -271,230 +549,461 @@ class BoneFlexDriversWindow(QtGui.QWidget):
                 self.maxBoneRangeSpin.setValue(16.0)
             # enable boneDefaultPositionSpin
             self.boneDefaultPositionSpin.setEnabled(True)
+        if self.populatingDetails:
+            return
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        # Found the bone flex driver, update movement type
-                        if not hasattr(boneFlexDrivers[i], "usePosition"):
-                            boneFlexDrivers[i].AddAttribute("usePosition", vs.AT_BOOL).SetValue(False)
-                        boneFlexDrivers[i].usePosition.SetValue(index == 1)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Movement", ("usePosition", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if (hasattr(boneFlexDriver, "usePosition") and boneFlexDriver.usePosition.GetValue()) == (index == 1):
+                    return # no change
+                # Found the bone flex driver, update movement type
+                if not hasattr(boneFlexDriver, "usePosition"):
+                    boneFlexDriver.AddAttribute("usePosition", vs.AT_BOOL).SetValue(False)
+                boneFlexDriver.usePosition.SetValue(index == 1)
+            self.markBoneFlexDriverDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
+    @profiling.profiled("boneDefaultPositionChanged")
     def boneDefaultPositionChanged(self, value):
-        if self.currentBoneFlexDriverUniqueId == "00000000-0000-0000-0000-000000000000":
+        if self.populatingDetails or self.currentBoneFlexDriverUniqueId == "00000000-0000-0000-0000-000000000000":
             return
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        # Found the bone flex driver, update default position
-                        if not hasattr(boneFlexDrivers[i], "boneDefaultPosition"):
-                            boneFlexDrivers[i].AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(0.0)
-                        boneFlexDrivers[i].boneDefaultPosition.SetValue(value)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
-    def generateOperators(self):
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Default Position", ("boneDefaultPosition", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "boneDefaultPosition") and boneFlexDriver.boneDefaultPosition.GetValue() == value:
+                    return # no change
+                # Found the bone flex driver, update default position
+                if not hasattr(boneFlexDriver, "boneDefaultPosition"):
+                    boneFlexDriver.AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(0.0)
+                boneFlexDriver.boneDefaultPosition.SetValue(value)
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
+    @profiling.profiled("generateOperators")
+    def generateOperators(self, skipUnchanged=False):
         """
         Regenerates SFM operators for all bone flex drivers in all shots.
-        Handles undo context safely.
+        Only operators generated for bone flex drivers are removed, operators of rig scripts and other tools are kept.
+        With skipUnchanged, bone flex drivers whose operators are still in their shot and match their fingerprint are kept.
+        The regeneration is a single undo entry, or part of the transaction it is called within.
+        """
+        self.commitTimer.stop()
+        self.coalescedEdits = 0
+        self.pendingCommitKey = None
+        self.dirtyBoneFlexDrivers = set()
+        self.dirtyBoneFlexDriverExpressions = set()
+        self.dirtyBoneFlexDriverInputs = set()
+        with self.undo.transaction("Rebuild Bone Flex Driver Operators"):
+            shots = sfmApp.GetShots()
+            for shot in shots:
+                # operators emitted per shot
+                with self.profiler.section("generateShot " + shot.GetName()):
+                    if skipUnchanged:
+                        removedCount = self.generator.refreshShot(shot)[0]
+                    else:
+                        removedCount = self.generator.generateShot(shot)
+                    if removedCount > 0:
+                        self.invalidateBoneFlexDriverRegistry()
+    def buildBoneFlexDriverRegistry(self):
+        """
+        Indexes every shot by name and every bone flex driver by its shot and unique id,
+        so handlers can look them up without scanning every shot and bone flex driver.
         """
-        dm.SetUndoEnabled(False)
+        self.boneFlexDriverRegistry = {}
         shots = sfmApp.GetShots()
         for shot in shots:
-            for i in range(shot.operators.count()):
-                shot.operators.remove(0)
+            shotName = shot.GetName()
+            if shotName in self.boneFlexDriverRegistry:
+                continue # the first shot with a given name is the one shown in the dropdown
+            registeredBoneFlexDrivers = {}
             boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-            if boneFlexDrivers is None:
-                continue
-            for i in range(boneFlexDrivers.count()):
-                if not boneFlexDrivers[i].active.GetValue():
-                    continue
-                generatedOperators = getattr(boneFlexDrivers[i], "generatedOperators", None)
-                if generatedOperators is None:
+            if boneFlexDrivers is not None:
+                for i in range(boneFlexDrivers.count()):
+                    registeredBoneFlexDrivers[boneFlexDrivers[i].GetId().__str__()] = boneFlexDrivers[i]
+            self.boneFlexDriverRegistry[shotName] = (shot, registeredBoneFlexDrivers, self.countBoneFlexDrivers(shot))
+    def countBoneFlexDrivers(self, shot):
+        """
+        Returns the number of bone flex drivers in a shot's boneFlexDrivers array.
+        """
+        boneFlexDrivers = engine.getBoneFlexDrivers(shot)
+        return boneFlexDrivers.count() if boneFlexDrivers is not None else 0
+    def invalidateBoneFlexDriverRegistry(self):
+        """
+        Discards the registry so it is rebuilt on the next lookup, after bone flex drivers are added or removed,
+        or after SFM's undo and redo may have added or removed them.
+        """
+        self.boneFlexDriverRegistry = None
+        self.valueRefreshAnimationSets = {}
+    def getRegisteredShot(self, shotName):
+        """
+        Returns the shot with the given name, or None.
+        """
+        if self.boneFlexDriverRegistry is None:
+            self.buildBoneFlexDriverRegistry()
+        registeredShot = self.boneFlexDriverRegistry.get(shotName)
+        if registeredShot is None:
+            return None
+        return registeredShot[0]
+    def getRegisteredBoneFlexDriver(self, shotName, uniqueId):
+        """
+        Returns the bone flex driver with the given unique id in the named shot, or None.
+        The registry is rebuilt if the shot's bone flex drivers were added or removed outside this window, such as by undo.
+        """
+        if self.boneFlexDriverRegistry is None:
+            self.buildBoneFlexDriverRegistry()
+        registeredShot = self.boneFlexDriverRegistry.get(shotName)
+        if registeredShot is None:
+            return None
+        if registeredShot[2] != self.countBoneFlexDrivers(registeredShot[0]):
+            self.buildBoneFlexDriverRegistry()
+            registeredShot = self.boneFlexDriverRegistry.get(shotName)
+            if registeredShot is None:
+                return None
+        return registeredShot[1].get(uniqueId)
+    def getNameListModels(self, animationSet):
+        """
+        Returns the cached flex and bone list models of an animation set, shared by the details panel and the Add dialog,
+        along with dictionaries of each name's row. They are rebuilt when the animation set's index is rebuilt.
+        """
+        uniqueId = animationSet.GetId().__str__()
+        animationSetIndex = self.generator.getAnimationSetIndex(animationSet)
+        nameListModels = self.nameListModels.get(uniqueId)
+        if nameListModels is None or nameListModels[0] is not animationSetIndex:
+            flexModel = QtGui.QStringListModel(animationSetIndex.flexNames, self)
+            boneModel = QtGui.QStringListModel(animationSetIndex.boneNames, self)
+            flexRows = dict((flexName, row) for row, flexName in enumerate(animationSetIndex.flexNames))
+            boneRows = dict((boneName, row) for row, boneName in enumerate(animationSetIndex.boneNames))
+            nameListModels = (animationSetIndex, flexModel, boneModel, flexRows, boneRows)
+            self.nameListModels[uniqueId] = nameListModels
+        return nameListModels[1:]
+    def removeBoneFlexDriverElement(self, shot, boneFlexDriver):
+        """
+        Removes a bone flex driver and its operators from its shot.
+        """
+        self.generator.removeBoneFlexDriver(shot, boneFlexDriver)
+        self.invalidateBoneFlexDriverRegistry()
+    def markBoneFlexDriverDirty(self, shotName, uniqueId):
+        """
+        Flags a single bone flex driver as needing its operators rebuilt by regenerateDirtyOperators().
+        """
+        self.dirtyBoneFlexDrivers.add((shotName, uniqueId))
+    def markBoneFlexDriverExpressionDirty(self, shotName, uniqueId):
+        """
+        Flags a bone flex driver whose parameters changed but whose operator chain can be kept,
+        so regenerateDirtyOperators() only rewrites its eval expression.
+        """
+        self.dirtyBoneFlexDriverExpressions.add((shotName, uniqueId))
+    def markBoneFlexDriverInputDirty(self, shotName, uniqueId):
+        """
+        Flags a bone flex driver whose bone changed, so regenerateDirtyOperators() only re-targets its input reference.
+        """
+        self.dirtyBoneFlexDriverInputs.add((shotName, uniqueId))
+    @profiling.profiled("regenerateDirtyOperators")
+    def regenerateDirtyOperators(self):
+        """
+        Rebuilds the operator chains of dirty bone flex drivers only, within their own shots.
+        Operators of every other bone flex driver and shot are left untouched.
+        Parameter-only changes are written to the existing eval operator instead of rebuilding the chain.
+        """
+        if not self.dirtyBoneFlexDrivers and not self.dirtyBoneFlexDriverExpressions and not self.dirtyBoneFlexDriverInputs:
+            return
+        dirtyBoneFlexDrivers = self.dirtyBoneFlexDrivers
+        dirtyBoneFlexDriverExpressions = self.dirtyBoneFlexDriverExpressions
+        dirtyBoneFlexDriverInputs = self.dirtyBoneFlexDriverInputs
+        self.dirtyBoneFlexDrivers = set()
+        self.dirtyBoneFlexDriverExpressions = set()
+        self.dirtyBoneFlexDriverInputs = set()
+        # SFM's undo and redo may have changed the shots since the last commit, never reuse their elements
+        self.invalidateBoneFlexDriverRegistry()
+        self.generator.invalidateSharedOperatorIndexes()
+        # deferred regeneration joins the undo chain of the edits that caused it, which the last undo entry may no longer be
+        commitKey = self.pendingCommitKey
+        self.pendingCommitKey = None
+        with self.undo.transaction("Edit Bone Flex Driver", commitKey):
+            rebuiltShots = {}
+            for key in dirtyBoneFlexDrivers | dirtyBoneFlexDriverExpressions | dirtyBoneFlexDriverInputs:
+                shot = self.getRegisteredShot(key[0])
+                boneFlexDriver = self.getRegisteredBoneFlexDriver(key[0], key[1])
+                if shot is None or boneFlexDriver is None:
                     continue
-                # Clear existing operators
-                while generatedOperators.count() > 0:
-                    generatedOperators.remove(0)
-                # Create new operators based on the bone flex driver properties
-                prefix = boneFlexDrivers[i].GetName() + "_" + boneFlexDrivers[i].animationSet.GetName() + "_" + boneFlexDrivers[i].boneName.GetValue() + "_" + boneFlexDrivers[i].flexName.GetValue() + "_"
-                transform = vs.CreateElement("DmeConnectionOperator", (prefix + "transform").encode('utf-8'), shot.GetFileId())
-                transform = generatedOperators[generatedOperators.AddToTail(transform)]
-                transformInput = vs.CreateElement("DmeAttributeReference", (prefix + "transform_input").encode('utf-8'), shot.GetFileId())
-                transform.SetValue("input", transformInput)
-                invalidAnimationSet = False
-                if not hasattr(boneFlexDrivers[i], "usePosition"):
-                    boneFlexDrivers[i].AddAttribute("usePosition", vs.AT_BOOL).SetValue(False)
-                for j in range(boneFlexDrivers[i].animationSet.controls.count()):
-                    if getattr(boneFlexDrivers[i].animationSet, "gameModel", None) is None:
-                        # remove this bone flex driver, as its animation set is invalid
-                        boneFlexDrivers.remove(i)
-                        invalidAnimationSet = True
-                        break
-                    controlName = boneFlexDrivers[i].animationSet.controls[j].GetName().replace(" (disabled)", "")
-                    if controlName == boneFlexDrivers[i].flexName.GetValue() or controlName == (boneFlexDrivers[i].flexName.GetValue().replace("left_", "")) or controlName == (boneFlexDrivers[i].flexName.GetValue().replace("right_", "")):
-                        newValue = "flexWeight"
-                        if boneFlexDrivers[i].active.GetValue():
-                            boneFlexDrivers[i].animationSet.controls[j].SetName(controlName + " (disabled)")
-                            newValue = "disabled"
-                        else:
-                            boneFlexDrivers[i].animationSet.controls[j].SetName(controlName)
-                        if not hasattr(boneFlexDrivers[i].animationSet.controls[j], "channel"):
-                            if boneFlexDrivers[i].flexName.GetValue().startswith("left_"):
-                                boneFlexDrivers[i].animationSet.controls[j].leftvaluechannel.toAttribute.SetValue(newValue)
-                            elif boneFlexDrivers[i].flexName.GetValue().startswith("right_"):
-                                boneFlexDrivers[i].animationSet.controls[j].rightvaluechannel.toAttribute.SetValue(newValue)
-                        else:
-                            boneFlexDrivers[i].animationSet.controls[j].channel.toAttribute.SetValue(newValue)
-                    if controlName == boneFlexDrivers[i].boneName.GetValue():
-                        # position or rotation?
-                        if boneFlexDrivers[i].usePosition.GetValue():
-                            transformInput.SetValue("element", boneFlexDrivers[i].animationSet.controls[j].positionChannel.toElement)
-                        else:
-                            transformInput.SetValue("element", boneFlexDrivers[i].animationSet.controls[j].orientationChannel.toElement)
-                        break
-                if invalidAnimationSet:
-                    continue # skip the rest of this loop iteration
-                if boneFlexDrivers[i].usePosition.GetValue():
-                    transformInput.attribute.SetValue("position")
-                else:
-                    transformInput.attribute.SetValue("orientation")
-                transformOutput = vs.CreateElement("DmeAttributeReference", (prefix + "transform_output").encode('utf-8'), shot.GetFileId())
-                transform.outputs.AddToTail(transformOutput)
-                unpackOperator = "DmeUnpackQuaternionOperator"
-                if boneFlexDrivers[i].usePosition.GetValue():
-                    unpackOperator = "DmeUnpackVector3Operator"
-                unpack = vs.CreateElement(unpackOperator, (prefix + "unpack").encode('utf-8'), shot.GetFileId())
-                unpack = generatedOperators[generatedOperators.AddToTail(unpack)]
-                transformOutput.SetValue("element", unpack)
-                if boneFlexDrivers[i].usePosition.GetValue():
-                    transformOutput.attribute.SetValue("vector")
-                else:
-                    transformOutput.attribute.SetValue("quaternion")
-                eval = vs.CreateElement("DmeExpressionOperator", (prefix + "eval").encode('utf-8'), shot.GetFileId())
-                eval = generatedOperators[generatedOperators.AddToTail(eval)]
-                eval.AddAttribute("x", vs.AT_FLOAT)
-                eval.AddAttribute("y", vs.AT_FLOAT)
-                eval.AddAttribute("z", vs.AT_FLOAT)
-                # if rotate is selected, use quaternion to euler conversion
-                isX = "rtod(atan2(2*(w*x + y*z), 1 - 2*(x*x + y*y)))"
-                isY = "rtod(asin(2*(w*y - z*x)))"
-                isZ = "rtod(atan2(2*(w*z + x*y), 1 - 2*(y*y + z*z)))"
-                if boneFlexDrivers[i].usePosition.GetValue():
-                    if not hasattr(boneFlexDrivers[i], "boneDefaultPosition"):
-                        boneFlexDrivers[i].AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(0.0)
-                    # if translate is selected, use self.boneDefaultPositionSpin value as a base and the min/max bone ranges as offsets
-                    isX = "(x - %f)" % boneFlexDrivers[i].boneDefaultPosition.GetValue()
-                    isY = "(y - %f)" % boneFlexDrivers[i].boneDefaultPosition.GetValue()
-                    isZ = "(z - %f)" % boneFlexDrivers[i].boneDefaultPosition.GetValue()
-                else:
-                    # create w attribute for quaternion
-                    eval.AddAttribute("w", vs.AT_FLOAT)
-                    wName = prefix + "w"
-                    w = vs.CreateElement("DmeConnectionOperator", (wName).encode('utf-8'), shot.GetFileId())
-                    w = generatedOperators[generatedOperators.AddToTail(w)]
-                    wInput = vs.CreateElement("DmeAttributeReference", (prefix + "w_input").encode('utf-8'), shot.GetFileId())
-                    w.SetValue("input", wInput)
-                    wInput.SetValue("element", unpack)
-                    wInput.attribute.SetValue("w")
-                    wOutput = vs.CreateElement("DmeAttributeReference", (prefix + "w_output").encode('utf-8'), shot.GetFileId())
-                    w.outputs.AddToTail(wOutput)
-                    wOutput.SetValue("element", eval)
-                    wOutput.attribute.SetValue("w")
-                axisExpr = {"X": isX, "Y": isY, "Z": isZ}.get(boneFlexDrivers[i].boneAxis.GetValue().upper(), isX)
-                axisExpr = "ramp(%s, %f, %f)" % (axisExpr, boneFlexDrivers[i].minBoneRange.GetValue(), boneFlexDrivers[i].maxBoneRange.GetValue())
-                if boneFlexDrivers[i].clamp.GetValue():
-                    axisExpr = "clamp(%s, 0, 1)" % axisExpr
-                # Map flex range from minFlexRange to maxFlexRange
-                axisExpr = "lerp(%s, %f, %f)" % (axisExpr, boneFlexDrivers[i].minFlexRange.GetValue(), boneFlexDrivers[i].maxFlexRange.GetValue())
-                eval.expr.SetValue(axisExpr)
-                x = vs.CreateElement("DmeConnectionOperator", (prefix + "x").encode('utf-8'), shot.GetFileId())
-                x = generatedOperators[generatedOperators.AddToTail(x)]
-                xInput = vs.CreateElement("DmeAttributeReference", (prefix + "x_input").encode('utf-8'), shot.GetFileId())
-                x.SetValue("input", xInput)
-                xInput.SetValue("element", unpack)
-                xInput.attribute.SetValue("x")
-                xOutput = vs.CreateElement("DmeAttributeReference", (prefix + "x_output").encode('utf-8'), shot.GetFileId())
-                x.outputs.AddToTail(xOutput)
-                xOutput.SetValue("element", eval)
-                xOutput.attribute.SetValue("x")
-                y = vs.CreateElement("DmeConnectionOperator", (prefix + "y").encode('utf-8'), shot.GetFileId())
-                y = generatedOperators[generatedOperators.AddToTail(y)]
-                yInput = vs.CreateElement("DmeAttributeReference", (prefix + "y_input").encode('utf-8'), shot.GetFileId())
-                y.SetValue("input", yInput)
-                yInput.SetValue("element", unpack)
-                yInput.attribute.SetValue("y")
-                yOutput = vs.CreateElement("DmeAttributeReference", (prefix + "y_output").encode('utf-8'), shot.GetFileId())
-                y.outputs.AddToTail(yOutput)
-                yOutput.SetValue("element", eval)
-                yOutput.attribute.SetValue("y")
-                z = vs.CreateElement("DmeConnectionOperator", (prefix + "z").encode('utf-8'), shot.GetFileId())
-                z = generatedOperators[generatedOperators.AddToTail(z)]
-                zInput = vs.CreateElement("DmeAttributeReference", (prefix + "z_input").encode('utf-8'), shot.GetFileId())
-                z.SetValue("input", zInput)
-                zInput.SetValue("element", unpack)
-                zInput.attribute.SetValue("z")
-                zOutput = vs.CreateElement("DmeAttributeReference", (prefix + "z_output").encode('utf-8'), shot.GetFileId())
-                z.outputs.AddToTail(zOutput)
-                zOutput.SetValue("element", eval)
-                zOutput.attribute.SetValue("z")
-                generatedOperators.AddToTail(z)
-                result = vs.CreateElement("DmeConnectionOperator", (prefix + "result").encode('utf-8'), shot.GetFileId())
-                result = generatedOperators[generatedOperators.AddToTail(result)]
-                resultInput = vs.CreateElement("DmeAttributeReference", (prefix + "result_input").encode('utf-8'), shot.GetFileId())
-                result.SetValue("input", resultInput)
-                resultInput.SetValue("element", eval)
-                resultInput.attribute.SetValue("result")
-                resultOutput = vs.CreateElement("DmeAttributeReference", (prefix + "result_output").encode('utf-8'), shot.GetFileId())
-                result.outputs.AddToTail(resultOutput)
-                for j in range(boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers.count()):
-                    if boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers[j].GetName() == boneFlexDrivers[i].flexName.GetValue():
-                        resultOutput.SetValue("element", boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers[j])
-                        break
-                resultOutput.attribute.SetValue("flexWeight")
-                for j in range(generatedOperators.count()):
-                    shot.operators.AddToTail(generatedOperators[j])
-        dm.SetUndoEnabled(True)
+                if key not in dirtyBoneFlexDrivers:
+                    if not engine.hasLiveOperators(boneFlexDriver):
+                        continue # inactive and baked bone flex drivers have no live operators to edit
+                    updated = True
+                    if key in dirtyBoneFlexDriverInputs:
+                        updated = self.generator.retargetBoneFlexDriverInput(shot, boneFlexDriver)
+                        if updated:
+                            rebuiltShots[key[0]] = shot # the previous bone's shared stage may be unused now
+                    if updated and key in dirtyBoneFlexDriverExpressions:
+                        updated = self.generator.updateBoneFlexDriverExpression(boneFlexDriver)
+                    if updated:
+                        continue
+                    # no operator chain to edit in place, fall back to a rebuild
+                if not self.generator.regenerateBoneFlexDriver(shot, boneFlexDriver):
+                    self.invalidateBoneFlexDriverRegistry()
+                rebuiltShots[key[0]] = shot
+            for shot in rebuiltShots.values():
+                # the rebuilt and retargeted bone flex drivers may have been the last readers of a shared stage
+                self.generator.pruneSharedOperators(shot)
+    def countGeneratedOperators(self):
+        """
+        Counts the live operators and attribute references generated for bone flex drivers in every shot,
+        along with the operators the full (unoptimized) graph would have generated for them.
+        Returns a tuple of (bone flex drivers, operators, attribute references, full graph operators).
+        """
+        totals = [0, 0, 0, 0]
+        shots = sfmApp.GetShots()
+        for shot in shots:
+            counts = self.generator.countShotOperators(shot)
+            for i in range(len(totals)):
+                totals[i] += counts[i]
+        return tuple(totals)
+    def getOperatorCountReport(self):
+        """
+        Describes the generated operator count for the status bar.
+        """
+        boneFlexDriverCount, operatorCount, referenceCount, fullOperatorCount = self.countGeneratedOperators()
+        report = "%d operator(s) and %d attribute reference(s) for %d active bone flex driver(s)" % (operatorCount, referenceCount, boneFlexDriverCount)
+        if self.generator.optimizedGraph:
+            report += ", %d fewer than the full graph" % (fullOperatorCount - operatorCount)
+        return report
+    @profiling.profiled("optimizedGraphChanged")
+    def optimizedGraphChanged(self, state):
+        """
+        Switches between the optimized graph, with shared transform and unpack stages, and the full operator graph,
+        then rebuilds every bone flex driver.
+        """
+        self.generator.optimizedGraph = state == QtCore.Qt.Checked
+        self.rebuildAllOperators()
+    @profiling.profiled("rebuildAllOperators")
+    def rebuildAllOperators(self):
+        """
+        Explicitly regenerates the operators of every bone flex driver in every shot.
+        """
+        self.generateOperators()
+        self.setStatus("Rebuilt all bone flex driver operators: " + self.getOperatorCountReport())
+    def setStatus(self, message):
+        """
+        Shows a message in the status bar after the script's name and version.
+        """
+        statusText = "SFM Bone Flex Drivers by KiwifruitDev v%s" % boneFlexDriversVersion
+        if message:
+            statusText += " - " + message
+        self.statusBar.setText(statusText)
+    def diagnosticsToggled(self, checked):
+        """
+        Expands or collapses the diagnostics panel.
+        """
+        self.diagnosticsToggle.setArrowType(QtCore.Qt.DownArrow if checked else QtCore.Qt.RightArrow)
+        self.diagnosticsPanel.setVisible(checked)
+        if checked:
+            self.refreshDiagnostics()
+    def profilingChanged(self, state):
+        """
+        Turns profiling of the window's handlers on or off.
+        Elements created are counted by handing the engine a counting wrapper of the datamodel while profiling.
+        """
+        enabled = state == QtCore.Qt.Checked
+        self.profiler.enabled = enabled
+        engine.setDatamodel(self.countingDatamodel if enabled else self.countingDatamodel.datamodel)
+    def profileRecorded(self, profiler):
+        """
+        Updates the diagnostics panel after a handler was profiled, if it is expanded.
+        """
+        if self.diagnosticsPanel.isVisible():
+            self.refreshDiagnostics()
+    def refreshDiagnostics(self):
+        """
+        Shows the rolling stats of every profiled section, with the mean counts per call.
+        """
+        sections = [sectionStats.toDict() for sectionStats in self.profiler.sections.values()]
+        self.diagnosticsTable.setRowCount(len(sections))
+        for row, section in enumerate(sections):
+            cells = [section["name"], "%d" % section["calls"], "%.2f" % section["lastMs"], "%.2f" % section["meanMs"], "%.2f" % section["maxMs"]]
+            for counterName in ("elementsCreated", "elementsVisited", "operators"):
+                counts = section["counts"].get(counterName)
+                cells.append("%.1f" % counts["mean"] if counts is not None else "")
+            for column, cell in enumerate(cells):
+                item = self.diagnosticsTable.item(row, column)
+                if item is None:
+                    item = QtGui.QTableWidgetItem()
+                    self.diagnosticsTable.setItem(row, column, item)
+                item.setText(cell)
+    def resetDiagnostics(self):
+        self.profiler.reset()
+        self.refreshDiagnostics()
+    def saveDiagnostics(self):
+        """
+        Saves the rolling stats of every profiled section to a JSON file, along with the expression cache's stats.
+        """
+        options = QtGui.QFileDialog.Options()
+        options |= QtGui.QFileDialog.DontUseNativeDialog
+        fileName, _ = QtGui.QFileDialog.getSaveFileName(self, "Save Diagnostics", "", "JSON Files (*.json);;All Files (*)", options=options)
+        if fileName:
+            try:
+                # Append .json extension if not present
+                if not fileName.lower().endswith('.json'):
+                    fileName += '.json'
+                self.profiler.save(fileName, {"version": boneFlexDriversVersion, "optimizedGraph": self.generator.optimizedGraph, "expressionCache": engine.expressionCache.getStats()})
+                self.setStatus("Saved diagnostics of %d section(s)" % len(self.profiler.sections))
+            except Exception as e:
+                QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to save diagnostics: %s" % str(e))
+    def scheduleCommit(self):
+        """
+        Defers regeneration of dirty bone flex drivers until edits stop for commitDelay milliseconds,
+        coalescing consecutive spin box and text edits into a single regeneration.
+        """
+        self.recordCommitKey()
+        self.coalescedEdits += 1
+        if self.commitDelay <= 0:
+            self.flushPendingCommits()
+            return
+        self.commitTimer.start(self.commitDelay)
+        self.setStatus("%d edit(s) pending" % self.coalescedEdits)
+    def commitNow(self):
+        """
+        Regenerates dirty bone flex drivers right away, along with any edits still waiting on the commit timer.
+        """
+        self.recordCommitKey()
+        self.coalescedEdits += 1
+        self.flushPendingCommits()
+    def recordCommitKey(self):
+        """
+        Remembers the coalesce key of the edit scheduling a commit, so the commit joins that edit's undo chain.
+        Pending edits with different keys share no chain, and their commit gets an undo entry of its own.
+        """
+        if self.coalescedEdits == 0:
+            self.pendingCommitKey = self.undo.transactionKey
+        elif self.pendingCommitKey != self.undo.transactionKey:
+            self.pendingCommitKey = None
+    def flushPendingCommits(self):
+        """
+        Immediately regenerates any bone flex drivers with edits waiting on the commit timer.
+        """
+        self.commitTimer.stop()
+        if self.coalescedEdits == 0:
+            return
+        coalescedEdits = self.coalescedEdits
+        self.coalescedEdits = 0
+        self.regenerateDirtyOperators()
+        self.setStatus("Committed %d edit(s) in one regeneration" % coalescedEdits)
+    def startValueRefresh(self, interval=None):
+        """
+        Schedules the next refresh of the table's flex values, unless the window is hidden or the table has no rows.
+        """
+        if not self.isVisible() or self.boneFlexDriversFilterModel.rowCount() == 0:
+            self.valueRefreshTimer.stop()
+            return
+        if interval is None:
+            if self.valueRefreshTimer.isActive():
+                return
+            interval = self.valueRefreshInterval
+        self.valueRefreshTimer.start(interval)
+    def visibleRowsChanged(self, *args):
+        self.startValueRefresh()
+    def showEvent(self, event):
+        super(BoneFlexDriversWindow, self).showEvent(event)
+        self.startValueRefresh()
+    def hideEvent(self, event):
+        self.valueRefreshTimer.stop()
+        super(BoneFlexDriversWindow, self).hideEvent(event)
+    def getValueRefreshAnimationSet(self, shot):
+        """
+        Returns the shot's animation set shown in the table, cached per shot so each refresh does not scan the shot.
+        """
+        uniqueId = shot.GetId().__str__()
+        cachedAnimationSet = self.valueRefreshAnimationSets.get(uniqueId)
+        if cachedAnimationSet is None or cachedAnimationSet[0] != self.currentAnimationSet:
+            cachedAnimationSet = (self.currentAnimationSet, engine.findAnimationSet(shot, self.currentAnimationSet))
+            self.valueRefreshAnimationSets[uniqueId] = cachedAnimationSet
+        return cachedAnimationSet[1]
+    @profiling.profiled("refreshVisibleValues")
+    def refreshVisibleValues(self):
+        """
+        Shows the current flex value of the bone flex drivers in the table's visible rows at the playhead.
+        The flex weights of the visible rows are read in one pass, each with a single GetValue() as SFM has no batched read,
+        and the refresh is slowed down whenever reading takes more than its budget of the time, so it never competes with playback.
+        The refresh stops while the window is hidden or the table is empty.
+        """
+        interval = self.valueRefreshInterval
+        table = self.boneFlexDriversTable
+        if self.isVisible() and table.isEnabled() and self.boneFlexDriversFilterModel.rowCount() > 0 and not self.currentlyRefreshing:
+            start = timeit.default_timer()
+            firstRow = table.rowAt(0)
+            if firstRow < 0:
+                firstRow = 0
+            lastRow = table.rowAt(table.viewport().height() - 1)
+            if lastRow < 0:
+                lastRow = self.boneFlexDriversFilterModel.rowCount() - 1
+            shot = self.getRegisteredShot(self.shotDropdown.currentText())
+            animationSet = self.getValueRefreshAnimationSet(shot) if shot is not None else None
+            if animationSet is not None:
+                rows = [self.boneFlexDriversFilterModel.mapToSource(self.boneFlexDriversFilterModel.index(row, 0)).row() for row in range(firstRow, lastRow + 1)]
+                flexNames = [self.boneFlexDriversModel.getFlexName(row) for row in rows]
+                flexWeights = self.generator.getAnimationSetIndex(animationSet).getFlexWeights(flexNames)
+                # only changed values are repainted
+                self.boneFlexDriversModel.setValues(rows, flexWeights)
+            elapsed = (timeit.default_timer() - start) * 1000.0
+            interval = max(interval, int(elapsed / boneFlexDriversValueRefreshBudget))
+        self.startValueRefresh(interval)
 
+    def containsWidget(self, widget):
+        """
+        Returns True if a widget is this window or one of its descendants, including popups and dialogs it owns.
+        """
+        while widget is not None:
+            if widget is self:
+                return True
+            widget = widget.parentWidget()
+        return False
+    def applicationFocusChanged(self, old, new):
+        """
+        Reloads the table when focus moves into the window from another window.
+        """
+        if not self.containsWidget(new) or self.containsWidget(old):
+            return
+        self.reloadBoneFlexDrivers()
+    @profiling.profiled("reloadBoneFlexDrivers")
+    def reloadBoneFlexDrivers(self):
+        """
+        Discards every cached element and index and re-reads the current animation set's bone flex drivers,
+        as SFM's undo and redo may have changed them, without regenerating any operators.
+        """
+        if self.currentlyRefreshing:
+            return
+        self.flushPendingCommits()
+        self.invalidateBoneFlexDriverRegistry()
+        self.generator.clearCaches()
+        self.flexesInUse = []
+        self.animationSetChanged(self.animationSetDropdown.currentIndex())
+    @profiling.profiled("refreshBoneFlexDrivers")
     def refreshBoneFlexDrivers(self):
         if self.currentlyRefreshing == True:
             return
         self.currentlyRefreshing = True
         self.flexesInUse = []
+        self.invalidateBoneFlexDriverRegistry()
         hasDocument = sfmApp.HasDocument()
         self.shotDropdown.clear()
         self.animationSetDropdown.clear()
-        self.boneFlexDriversTable.setRowCount(0)
+        self.boneFlexDriversModel.clear()
         self.shotDropdown.setEnabled(hasDocument)
+        self.saveSessionBoneFlexDriversButton.setEnabled(hasDocument)
         self.animationSetDropdown.setEnabled(False)
         self.boneFlexDriversTable.setEnabled(False)
         # Populate shot dropdown
         if hasDocument:
+            with self.profiler.section("buildBoneFlexDriverRegistry"):
+                self.buildBoneFlexDriverRegistry()
             shots = sfmApp.GetShots()
             for shot in shots:
                 self.shotDropdown.addItem(shot.GetName())
                 if shot.GetName() == self.currentShot:
                     self.shotDropdown.setCurrentIndex(self.shotDropdown.count() - 1)
-        self.generateOperators()
+        # unchanged bone flex drivers keep their operators, "Rebuild All" regenerates every one
+        self.generateOperators(True)
         self.currentlyRefreshing = False
+    @profiling.profiled("shotChanged")
     def shotChanged(self, index):
         self.animationSetDropdown.clear()
         if index < 0:
@@ -504,27 +1013,29 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         # populate animation set dropdown based on selected shot
         shotName = self.shotDropdown.itemText(index)
         self.currentShot = shotName
-        shots = sfmApp.GetShots()
         currentAnimationSet = self.currentAnimationSet
-        for shot in shots:
-            if shot.GetName() == shotName:
-                animationSets = shot.animationSets
-                for i in range(animationSets.count()):
-                    # must have gameModel attribute
-                    if getattr(animationSets[i], "gameModel", None) is None:
-                        continue
-                    self.animationSetDropdown.addItem(animationSets[i].GetName())
-                    self.currentAnimationSet = currentAnimationSet
-                    if animationSets[i].GetName() == currentAnimationSet:
-                        self.animationSetDropdown.setCurrentIndex(self.animationSetDropdown.count() - 1)
-                break
+        shot = self.getRegisteredShot(shotName)
+        if shot is not None:
+            animationSets = shot.animationSets
+            for i in range(animationSets.count()):
+                # must have gameModel attribute
+                if getattr(animationSets[i], "gameModel", None) is None:
+                    continue
+                self.animationSetDropdown.addItem(animationSets[i].GetName())
+                self.currentAnimationSet = currentAnimationSet
+                if animationSets[i].GetName() == currentAnimationSet:
+                    self.animationSetDropdown.setCurrentIndex(self.animationSetDropdown.count() - 1)
+    @profiling.profiled("animationSetChanged")
     def animationSetChanged(self, index):
-        self.boneFlexDriversTable.setRowCount(0)
+        self.boneFlexDriversModel.clear()
         self.boneFlexDriversTable.setEnabled(False)
         self.loadBoneFlexDriversButton.setEnabled(False)
+        self.loadSessionBoneFlexDriversButton.setEnabled(False)
         self.saveBoneFlexDriversButton.setEnabled(False)
         self.addBoneFlexDriverButton.setEnabled(False)
         self.removeBoneFlexDriverButton.setEnabled(False)
+        self.bakeBoneFlexDriversButton.setEnabled(False)
+        self.unbakeBoneFlexDriversButton.setEnabled(False)
         self.boneFlexDriverDetailsGroup.setEnabled(False)
         if index < 0:
             return
@@ -533,123 +1044,84 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         shotName = self.shotDropdown.currentText()
         animSetName = self.animationSetDropdown.itemText(index)
         self.currentAnimationSet = animSetName
-        shots = sfmApp.GetShots()
         addedBoneFlexDriver = False
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                # if boneFlexDrivers is None, create it
-                if boneFlexDrivers is None:
-                    boneFlexDrivers = shot.AddAttribute("boneFlexDrivers", vs.AT_ELEMENT_ARRAY)
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].animationSet.GetName() == animSetName:
-                        # Get bone flex driver properties
-                        active = boneFlexDrivers[i].active.GetValue()
-                        flexName = boneFlexDrivers[i].flexName.GetValue()
-                        boneName = boneFlexDrivers[i].boneName.GetValue()
-                        self.flexesInUse.append(flexName)
-                        # Populate the table with this bone flex driver
-                        rowPosition = self.boneFlexDriversTable.rowCount()
-                        self.boneFlexDriversTable.insertRow(rowPosition)
-                        nameItem = QtGui.QTableWidgetItem(boneFlexDrivers[i].name.GetValue())
-                        nameItem.setFlags(nameItem.flags() ^ QtCore.Qt.ItemIsEditable)
-                        self.boneFlexDriversTable.setItem(rowPosition, 0, nameItem)
-                        flexItem = QtGui.QTableWidgetItem(flexName)
-                        flexItem.setFlags(flexItem.flags() ^ QtCore.Qt.ItemIsEditable)
-                        self.boneFlexDriversTable.setItem(rowPosition, 1, flexItem)
-                        boneItem = QtGui.QTableWidgetItem(boneName)
-                        boneItem.setFlags(boneItem.flags() ^ QtCore.Qt.ItemIsEditable)
-                        self.boneFlexDriversTable.setItem(rowPosition, 2, boneItem)
-                        valueItem = QtGui.QTableWidgetItem("0.0")
-                        valueItem.setFlags(valueItem.flags() ^ QtCore.Qt.ItemIsEditable)
-                        self.boneFlexDriversTable.setItem(rowPosition, 3, valueItem)
-                        uniqueId = boneFlexDrivers[i].GetId().__str__()
-                        activeCheckBox = QtGui.QCheckBox()
-                        activeCheckBox.setChecked(active)
-                        activeCheckBox.toggled.connect(lambda checked, uniqueId=uniqueId: self.onBoneFlexDriverActiveChanged(checked, uniqueId))
-                        self.boneFlexDriversTable.setCellWidget(rowPosition, 4, activeCheckBox)
-                        uniqueIdItem = QtGui.QTableWidgetItem(uniqueId)
-                        uniqueIdItem.setFlags(uniqueIdItem.flags() ^ QtCore.Qt.ItemIsEditable)
-                        self.boneFlexDriversTable.setItem(rowPosition, 5, uniqueIdItem)
-                        addedBoneFlexDriver = True
-                        if self.currentBoneFlexDriverUniqueId == uniqueId:
-                            self.boneFlexDriversTable.selectRow(rowPosition)
-                break
+        shot = self.getRegisteredShot(shotName)
+        if shot is not None:
+            # if boneFlexDrivers is None, create it, which is not an edit worth undoing
+            with self.undo.transaction("Create Bone Flex Drivers", undoable=False):
+                boneFlexDrivers = engine.getBoneFlexDrivers(shot, True)
+            elements = []
+            for i in range(boneFlexDrivers.count()):
+                if boneFlexDrivers[i].animationSet.GetName() == animSetName:
+                    self.flexesInUse.append(boneFlexDrivers[i].flexName.GetValue())
+                    elements.append(boneFlexDrivers[i])
+            with self.profiler.section("populateTable"):
+                self.boneFlexDriversModel.setBoneFlexDrivers(elements)
+            addedBoneFlexDriver = len(elements) > 0
+            self.selectBoneFlexDriverRow(self.currentBoneFlexDriverUniqueId)
         self.boneFlexDriversTable.setEnabled(True)
         self.loadBoneFlexDriversButton.setEnabled(True)
+        self.loadSessionBoneFlexDriversButton.setEnabled(True)
         self.addBoneFlexDriverButton.setEnabled(True)
         if addedBoneFlexDriver:
             self.saveBoneFlexDriversButton.setEnabled(True)
-        dm.SetUndoEnabled(True)
-    def boneFlexDriverSelectionChanged(self):
+            self.bakeBoneFlexDriversButton.setEnabled(True)
+            self.unbakeBoneFlexDriversButton.setEnabled(True)
+    def selectBoneFlexDriverRow(self, uniqueId):
+        """
+        Selects the table row of the bone flex driver with the given unique id, if it is shown.
+        """
+        row = self.boneFlexDriversModel.findRow(uniqueId)
+        if row < 0:
+            return
+        index = self.boneFlexDriversFilterModel.mapFromSource(self.boneFlexDriversModel.index(row, 0))
+        if index.isValid():
+            self.boneFlexDriversTable.selectRow(index.row())
+    @profiling.profiled("boneFlexDriverSelectionChanged")
+    def boneFlexDriverSelectionChanged(self, selected=None, deselected=None):
         # get selection
-        selectedItems = self.boneFlexDriversTable.selectedItems()
-        if not selectedItems:
+        selectedRows = self.boneFlexDriversTable.selectionModel().selectedRows()
+        if not selectedRows:
             self.boneFlexDriverDetailsGroup.setEnabled(False)
             self.removeBoneFlexDriverButton.setEnabled(False)
             return
         self.boneFlexDriverDetailsGroup.setEnabled(True)
         self.removeBoneFlexDriverButton.setEnabled(True)
-        selectedRow = selectedItems[0].row()
-        uniqueIdItem = self.boneFlexDriversTable.item(selectedRow, 5)
-        self.currentBoneFlexDriverUniqueId = uniqueIdItem.text()
+        selectedRow = self.boneFlexDriversFilterModel.mapToSource(selectedRows[0]).row()
+        self.currentBoneFlexDriverUniqueId = self.boneFlexDriversModel.getUniqueId(selectedRow)
         # Populate the details panel with the selected bone flex driver's properties
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        # Found the bone flex driver, populate details
-                        self.boneFlexDriverNameEdit.setText(boneFlexDrivers[i].name.GetValue())
-                        self.boneFlexDriverActiveCheckbox.setChecked(boneFlexDrivers[i].active.GetValue())
-                        # Populate flex dropdown
-                        matchingFlex = boneFlexDrivers[i].flexName.GetValue()
-                        self.flexEdit.clear()
-                        flexes = []
-                        storeFlexesInUse = self.flexesInUse[:]
-                        self.flexesInUse =  []
-                        if boneFlexDrivers[i].animationSet:
-                            for j in range(boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers.count()):
-                                if boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers[j] is None:
-                                    continue
-                                flexName = boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers[j].GetName()
-                                self.flexEdit.addItem(flexName)
-                                flexes.append(flexName.replace("left_", "").replace("right_", ""))
-                                if boneFlexDrivers[i].animationSet.gameModel.globalFlexControllers[j].GetName() == matchingFlex:
-                                    self.flexEdit.setCurrentIndex(self.flexEdit.count() - 1)
-                        self.flexesInUse = storeFlexesInUse + [matchingFlex] # workaround to prevent conflict errors when setting up properties
-                        self.minFlexRangeSpin.setValue(boneFlexDrivers[i].minFlexRange.GetValue() if hasattr(boneFlexDrivers[i], "minFlexRange") else 0.0)
-                        self.maxFlexRangeSpin.setValue(boneFlexDrivers[i].maxFlexRange.GetValue() if hasattr(boneFlexDrivers[i], "maxFlexRange") else 1.0)
-                        # Populate bone dropdown
-                        matchingBone = boneFlexDrivers[i].boneName.GetValue()
-                        self.boneEdit.clear()
-                        if boneFlexDrivers[i].animationSet:
-                            for j in range(boneFlexDrivers[i].animationSet.controls.count()):
-                                if boneFlexDrivers[i].animationSet.controls[j] is None:
-                                    continue
-                                controlName = boneFlexDrivers[i].animationSet.controls[j].GetName().replace(" (disabled)", "")
-                                if " - " in controlName:
-                                    # a rig script created this control, skip it
-                                    continue
-                                # the name cannot be the same as a flex
-                                if controlName not in flexes:
-                                    self.boneEdit.addItem(controlName)
-                                    if controlName == matchingBone:
-                                        self.boneEdit.setCurrentIndex(self.boneEdit.count() - 1)
-                        self.boneMovementChoice.setCurrentIndex(1 if (hasattr(boneFlexDrivers[i], "usePosition") and boneFlexDrivers[i].usePosition.GetValue()) else 0)
-                        axis = boneFlexDrivers[i].boneAxis.GetValue().upper() if hasattr(boneFlexDrivers[i], "boneAxis") else "X"
-                        axisIndex = {"X": 0, "Y": 1, "Z": 2}.get(axis, 0)
-                        self.boneAxisEdit.setCurrentIndex(axisIndex)
-                        self.minBoneRangeSpin.setValue(boneFlexDrivers[i].minBoneRange.GetValue() if hasattr(boneFlexDrivers[i], "minBoneRange") else 0.0)
-                        self.maxBoneRangeSpin.setValue(boneFlexDrivers[i].maxBoneRange.GetValue() if hasattr(boneFlexDrivers[i], "maxBoneRange") else 90.0)
-                        self.clampCheckbox.setChecked(boneFlexDrivers[i].clamp.GetValue() if hasattr(boneFlexDrivers[i], "clamp") else True)
-                        break
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        if boneFlexDriver is not None:
+            # Found the bone flex driver, populate details without editing it from the widgets' handlers
+            self.populatingDetails = True
+            try:
+                self.boneFlexDriverNameEdit.setText(boneFlexDriver.name.GetValue())
+                self.boneFlexDriverActiveCheckbox.setChecked(boneFlexDriver.active.GetValue())
+                # Populate flex and bone dropdowns from the animation set's cached lists
+                flexModel, boneModel, flexRows, boneRows = self.getNameListModels(boneFlexDriver.animationSet)
+                self.flexEdit.blockSignals(True)
+                if self.flexEdit.model() is not flexModel:
+                    self.flexEdit.setModel(flexModel)
+                self.flexEdit.setCurrentIndex(flexRows.get(boneFlexDriver.flexName.GetValue(), -1))
+                self.flexEdit.blockSignals(False)
+                self.minFlexRangeSpin.setValue(boneFlexDriver.minFlexRange.GetValue() if hasattr(boneFlexDriver, "minFlexRange") else 0.0)
+                self.maxFlexRangeSpin.setValue(boneFlexDriver.maxFlexRange.GetValue() if hasattr(boneFlexDriver, "maxFlexRange") else 1.0)
+                self.boneEdit.blockSignals(True)
+                if self.boneEdit.model() is not boneModel:
+                    self.boneEdit.setModel(boneModel)
+                self.boneEdit.setCurrentIndex(boneRows.get(boneFlexDriver.boneName.GetValue(), -1))
+                self.boneEdit.blockSignals(False)
+                self.boneMovementChoice.setCurrentIndex(1 if (hasattr(boneFlexDriver, "usePosition") and boneFlexDriver.usePosition.GetValue()) else 0)
+                self.boneDefaultPositionSpin.setValue(boneFlexDriver.boneDefaultPosition.GetValue() if hasattr(boneFlexDriver, "boneDefaultPosition") else 0.0)
+                axis = boneFlexDriver.boneAxis.GetValue().upper() if hasattr(boneFlexDriver, "boneAxis") else "X"
+                axisIndex = {"X": 0, "Y": 1, "Z": 2}.get(axis, 0)
+                self.boneAxisEdit.setCurrentIndex(axisIndex)
+                self.minBoneRangeSpin.setValue(boneFlexDriver.minBoneRange.GetValue() if hasattr(boneFlexDriver, "minBoneRange") else 0.0)
+                self.maxBoneRangeSpin.setValue(boneFlexDriver.maxBoneRange.GetValue() if hasattr(boneFlexDriver, "maxBoneRange") else 90.0)
+                self.clampCheckbox.setChecked(boneFlexDriver.clamp.GetValue() if hasattr(boneFlexDriver, "clamp") else True)
+            finally:
+                self.populatingDetails = False
     def loadBoneFlexDrivers(self):
         """
         Loads bone flex drivers from a JSON file and adds them to the current animation set.
@@ -660,109 +1132,178 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         animSetName = self.animationSetDropdown.currentText()
         options = QtGui.QFileDialog.Options()
         options |= QtGui.QFileDialog.DontUseNativeDialog
-        fileName, _ = QtGui.QFileDialog.getOpenFileName(self, "Load Bone Flex Drivers", "", "JSON Files (*.json);;All Files (*)", options=options)
+        fileName, _ = QtGui.QFileDialog.getOpenFileName(self, "Load Bone Flex Drivers", "", "JSON Files (*.json *.jsonl);;QC Files (*.qc *.qci);;All Files (*)", options=options)
         if fileName:
-            dm.SetUndoEnabled(False)
+            results = None
+            with self.profiler.section("loadBoneFlexDrivers"):
+                try:
+                    with self.undo.transaction("Import Bone Flex Drivers", undoable=boneFlexDriversUndoableImports):
+                        shot = self.getRegisteredShot(shotName)
+                        animationSet = engine.findAnimationSet(shot, animSetName) if shot is not None else None
+                        modelName = (engine.getModelName(animationSet) if animationSet is not None else None) or ""
+                        qcErrors = []
+                        if qc.isQcFile(fileName):
+                            # $boneflexdriver commands apply to this animation set whatever the QC's $modelname is
+                            _, boneFlexDriversToLoad, qcErrors = qc.parseQcFile(fileName)
+                        elif library.isLibraryFile(fileName):
+                            # only the section of this animation set's model is read
+                            boneFlexDriversToLoad = library.loadLibraryModel(fileName, modelName)
+                        else:
+                            boneFlexDriversToLoad = engine.loadBoneFlexDriversFile(fileName)
+                            if engine.isSessionData(boneFlexDriversToLoad):
+                                boneFlexDriversToLoad = dict([(engine.normalizeModelName(key), value) for key, value in boneFlexDriversToLoad.get("models", {}).items()]).get(modelName, [])
+                        # validate every entry before anything is created
+                        boneFlexDrivers, results = engine.validateBoneFlexDrivers(boneFlexDriversToLoad, self.flexesInUse)
+                        results = [engine.ImportResult(-1, "", "", "", False, error) for error in qcErrors] + results
+                        # without the target animation set's model, nothing can be imported
+                        if engine.skipMissingImportTarget(results, animationSet, animSetName, shotName) and boneFlexDrivers:
+                            elements = engine.addBoneFlexDrivers(shot, animationSet, boneFlexDrivers)
+                            # a single regeneration, of the imported bone flex drivers only
+                            self.generator.generateBoneFlexDrivers(shot, elements)
+                except Exception as e:
+                    QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to load bone flex drivers: %s" % str(e))
+            self.invalidateBoneFlexDriverRegistry()
+            self.animationSetChanged(self.animationSetDropdown.currentIndex())
+            if results is not None:
+                importedCount = len([result for result in results if result.imported])
+                self.setStatus("Imported %d of %d bone flex driver(s)" % (importedCount, len(results)))
+                self.showImportSummary(results)
+    def showImportSummary(self, results):
+        """
+        Shows one table of every imported and skipped entry of a bulk import, with the reason entries were skipped.
+        """
+        dialog = QtGui.QDialog(self)
+        dialog.setWindowTitle("Bone Flex Drivers: Import Summary")
+        dialogLayout = QtGui.QVBoxLayout()
+        dialog.setLayout(dialogLayout)
+        importedCount = len([result for result in results if result.imported])
+        dialogLayout.addWidget(QtGui.QLabel("Imported %d bone flex driver(s), skipped %d." % (importedCount, len(results) - importedCount)))
+        headers = ["Entry", "Name", "Flex", "Bone", "Result"]
+        showTargets = len([result for result in results if result.shotName]) > 0
+        if showTargets:
+            headers = ["Shot", "Animation Set"] + headers
+        summaryTable = QtGui.QTableWidget(len(results), len(headers))
+        summaryTable.setHorizontalHeaderLabels(headers)
+        summaryTable.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        summaryTable.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        summaryTable.verticalHeader().setVisible(False)
+        for row, result in enumerate(results):
+            cells = [str(result.entry + 1) if result.entry >= 0 else "", result.name, result.flexName, result.boneName, "Imported" if result.imported else "Skipped: " + result.reason]
+            if showTargets:
+                cells = [result.shotName, result.animSetName] + cells
+            for column, cell in enumerate(cells):
+                summaryTable.setItem(row, column, QtGui.QTableWidgetItem(cell))
+        summaryTable.horizontalHeader().setResizeMode(len(headers) - 1, QtGui.QHeaderView.Stretch)
+        summaryTable.resizeColumnsToContents()
+        dialogLayout.addWidget(summaryTable)
+        buttonBox = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Ok)
+        buttonBox.accepted.connect(dialog.accept)
+        dialogLayout.addWidget(buttonBox)
+        dialog.resize(640, 360)
+        dialog.exec_()
+    def loadSessionBoneFlexDrivers(self):
+        """
+        Loads bone flex drivers from a JSON file and adds them to every animation set in every shot using the same model,
+        with a single regeneration at the end. Session files apply each model's bone flex drivers to that model,
+        while files of a single animation set apply to every animation set using the current animation set's model.
+        """
+        options = QtGui.QFileDialog.Options()
+        options |= QtGui.QFileDialog.DontUseNativeDialog
+        fileName, _ = QtGui.QFileDialog.getOpenFileName(self, "Load Bone Flex Drivers Into Every Animation Set", "", "JSON Files (*.json *.jsonl);;QC Files (*.qc *.qci);;All Files (*)", options=options)
+        if not fileName:
+            return
+        results = None
+        with self.profiler.section("loadSessionBoneFlexDrivers"):
             try:
-                with open(fileName, 'r') as f:
-                    boneFlexDriversToLoad = json.load(f)
-                if not isinstance(boneFlexDriversToLoad, list):
-                    QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Invalid bone flex drivers file format. Expected a list of bone flex drivers.")
-                    dm.SetUndoEnabled(True)
-                    return
-                shots = sfmApp.GetShots()
-                for shot in shots:
-                    if shot.GetName() == shotName:
-                        boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                        if boneFlexDrivers is None:
-                            boneFlexDrivers = shot.AddAttribute("boneFlexDrivers", vs.AT_ELEMENT_ARRAY)
-                        for boneFlexDriverData in boneFlexDriversToLoad:
-                            if not isinstance(boneFlexDriverData, dict):
-                                QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Malformed bone flex driver entry: %s" % str(boneFlexDriverData))
-                                continue
-                            name = boneFlexDriverData.get("name", "").strip()
-                            flexName = boneFlexDriverData.get("flexName", "").strip()
-                            boneName = boneFlexDriverData.get("boneName", "").strip()
-                            if not name or not flexName or not boneName:
-                                QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Missing required fields in bone flex driver: %s" % str(boneFlexDriverData))
-                                continue
-                            if flexName in self.flexesInUse:
-                                QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Could not import Bone Flex Driver '%s'\nFlex '%s' is already in use by another bone flex driver" % (name, flexName))
-                                continue
-                            newBoneFlexDriver = vs.CreateElement("DmElement", name.encode('utf-8'), shot.GetFileId())
-                            newBoneFlexDriver = boneFlexDrivers[boneFlexDrivers.AddToTail(newBoneFlexDriver)]
-                            newBoneFlexDriver.AddAttribute("active", vs.AT_BOOL).SetValue(boneFlexDriverData.get("active", False))
-                            newBoneFlexDriver.AddAttribute("flexName", vs.AT_STRING).SetValue(flexName.encode('utf-8'))
-                            newBoneFlexDriver.AddAttribute("boneName", vs.AT_STRING).SetValue(boneName.encode('utf-8'))
-                            newBoneFlexDriver.AddAttribute("minFlexRange", vs.AT_FLOAT).SetValue(boneFlexDriverData.get("minFlexRange", 0.0))
-                            newBoneFlexDriver.AddAttribute("maxFlexRange", vs.AT_FLOAT).SetValue(boneFlexDriverData.get("maxFlexRange", 1.0))
-                            newBoneFlexDriver.AddAttribute("usePosition", vs.AT_BOOL).SetValue(boneFlexDriverData.get("usePosition", True))
-                            newBoneFlexDriver.AddAttribute("boneAxis", vs.AT_STRING).SetValue(boneFlexDriverData.get("boneAxis", "X").upper().encode('utf-8'))
-                            newBoneFlexDriver.AddAttribute("minBoneRange", vs.AT_FLOAT).SetValue(boneFlexDriverData.get("minBoneRange", 0.0))
-                            newBoneFlexDriver.AddAttribute("maxBoneRange", vs.AT_FLOAT).SetValue(boneFlexDriverData.get("maxBoneRange", 90.0))
-                            newBoneFlexDriver.AddAttribute("clamp", vs.AT_BOOL).SetValue(boneFlexDriverData.get("clamp", True))
-                            newBoneFlexDriver.AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(boneFlexDriverData.get("boneDefaultPosition", 0.0))
-                            newBoneFlexDriver.AddAttribute("generatedOperators", vs.AT_ELEMENT_ARRAY)
-                            animationSetAttribute = newBoneFlexDriver.AddAttribute("animationSet", vs.AT_ELEMENT)
-                            for i in range(shot.animationSets.count()):
-                                if shot.animationSets[i].GetName() == animSetName:
-                                    animationSetAttribute.SetValue(shot.animationSets[i])
-                                    break
-                            self.flexesInUse.append(flexName)
+                with self.undo.transaction("Import Bone Flex Drivers Into Every Animation Set", undoable=boneFlexDriversUndoableImports):
+                    shots = list(sfmApp.GetShots())
+                    qcErrors = []
+                    if qc.isQcFile(fileName):
+                        qcModelName, boneFlexDriversToLoad, qcErrors = qc.parseQcFile(fileName)
+                        # the QC's $modelname picks the animation sets, falling back to the current animation set's model
+                        if not qcModelName:
+                            shot = self.getRegisteredShot(self.shotDropdown.currentText())
+                            animationSet = engine.findAnimationSet(shot, self.animationSetDropdown.currentText()) if shot is not None else None
+                            qcModelName = engine.getModelName(animationSet) if animationSet is not None else None
+                            if not qcModelName:
+                                raise ValueError("The QC file has no $modelname and the current animation set has no model to match other animation sets with")
+                        boneFlexDriversByModel = {qcModelName: boneFlexDriversToLoad}
+                    elif library.isLibraryFile(fileName):
+                        # only the sections of models used in the session are read
+                        boneFlexDriversByModel = library.loadLibrary(fileName, engine.getSessionModelNames(shots))
+                    else:
+                        boneFlexDriversToLoad = engine.loadBoneFlexDriversFile(fileName)
+                        if engine.isSessionData(boneFlexDriversToLoad):
+                            boneFlexDriversByModel = boneFlexDriversToLoad.get("models")
+                        else:
+                            shot = self.getRegisteredShot(self.shotDropdown.currentText())
+                            animationSet = engine.findAnimationSet(shot, self.animationSetDropdown.currentText()) if shot is not None else None
+                            modelName = engine.getModelName(animationSet) if animationSet is not None else None
+                            if not modelName:
+                                raise ValueError("The current animation set has no model to match other animation sets with")
+                            boneFlexDriversByModel = {modelName: boneFlexDriversToLoad}
+                    importedShots, results = engine.importSession(shots, boneFlexDriversByModel)
+                    results = [engine.ImportResult(-1, "", "", "", False, error) for error in qcErrors] + results
+                    # a single regeneration at the end, of the imported bone flex drivers only
+                    for shot, elements in importedShots:
+                        self.generator.generateBoneFlexDrivers(shot, elements)
             except Exception as e:
                 QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to load bone flex drivers: %s" % str(e))
-            dm.SetUndoEnabled(True)
-            self.refreshBoneFlexDrivers()
-            self.animationSetChanged(self.animationSetDropdown.currentIndex())
+        self.invalidateBoneFlexDriverRegistry()
+        self.animationSetChanged(self.animationSetDropdown.currentIndex())
+        if results is not None:
+            importedCount = len([result for result in results if result.imported])
+            self.setStatus("Imported %d of %d bone flex driver(s) into every matching animation set" % (importedCount, len(results)))
+            self.showImportSummary(results)
+    def saveSessionBoneFlexDrivers(self):
+        """
+        Saves the bone flex drivers of every shot and animation set to a JSON file, keyed by model path.
+        """
+        with self.profiler.section("exportSession"):
+            sessionData = engine.exportSession(sfmApp.GetShots())
+        if not sessionData["models"]:
+            QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "No bone flex drivers to save")
+            return
+        options = QtGui.QFileDialog.Options()
+        options |= QtGui.QFileDialog.DontUseNativeDialog
+        fileName, _ = QtGui.QFileDialog.getSaveFileName(self, "Save Every Bone Flex Driver", "", "Bone Flex Drivers Libraries (*.jsonl);;All Files (*)", options=options)
+        if fileName:
+            try:
+                # Append .jsonl extension if not present
+                if not fileName.lower().endswith('.jsonl'):
+                    fileName += '.jsonl'
+                with self.profiler.section("saveLibrary"):
+                    library.saveLibrary(fileName, sessionData["models"])
+                QtGui.QMessageBox.information(self, "Bone Flex Drivers: Success", "Bone flex drivers of %d model(s) saved successfully" % len(sessionData["models"]))
+            except Exception as e:
+                QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to save bone flex drivers: %s" % str(e))
     def saveBoneFlexDrivers(self):
         # Save the current animation set's bone flex drivers to a JSON file
         shotName = self.shotDropdown.currentText()
         animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "No bone flex drivers to save")
-                    dm.SetUndoEnabled(True)
-                    return
-                boneFlexDriversToSave = []
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].animationSet.GetName() == animSetName:
-                        boneFlexDriverData = {
-                            "name": boneFlexDrivers[i].name.GetValue(),
-                            "active": boneFlexDrivers[i].active.GetValue(),
-                            "flexName": boneFlexDrivers[i].flexName.GetValue(),
-                            "boneName": boneFlexDrivers[i].boneName.GetValue(),
-                            "minFlexRange": boneFlexDrivers[i].minFlexRange.GetValue() if hasattr(boneFlexDrivers[i], "minFlexRange") else 0.0,
-                            "maxFlexRange": boneFlexDrivers[i].maxFlexRange.GetValue() if hasattr(boneFlexDrivers[i], "maxFlexRange") else 1.0,
-                            "usePosition": boneFlexDrivers[i].usePosition.GetValue() if hasattr(boneFlexDrivers[i], "usePosition") else False,
-                            "boneAxis": boneFlexDrivers[i].boneAxis.GetValue() if hasattr(boneFlexDrivers[i], "boneAxis") else "X",
-                            "minBoneRange": boneFlexDrivers[i].minBoneRange.GetValue() if hasattr(boneFlexDrivers[i], "minBoneRange") else 0.0,
-                            "maxBoneRange": boneFlexDrivers[i].maxBoneRange.GetValue() if hasattr(boneFlexDrivers[i], "maxBoneRange") else 90.0,
-                            "clamp": boneFlexDrivers[i].clamp.GetValue() if hasattr(boneFlexDrivers[i], "clamp") else True,
-                            "boneDefaultPosition": boneFlexDrivers[i].boneDefaultPosition.GetValue() if hasattr(boneFlexDrivers[i], "boneDefaultPosition") else 0.0,
-                        }
-                        boneFlexDriversToSave.append(boneFlexDriverData)
-                if not boneFlexDriversToSave:
-                    QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "No bone flex drivers to save for the selected animation set")
-                    dm.SetUndoEnabled(True)
-                    return
-                options = QtGui.QFileDialog.Options()
-                options |= QtGui.QFileDialog.DontUseNativeDialog
-                fileName, _ = QtGui.QFileDialog.getSaveFileName(self, "Save Bone Flex Drivers", "", "JSON Files (*.json);;All Files (*)", options=options)
-                if fileName:
-                    try:
-                        # Append .json extension if not present
-                        if not fileName.lower().endswith('.json'):
-                            fileName += '.json'
-                        with open(fileName, 'w') as f:
-                            json.dump(boneFlexDriversToSave, f, indent=4)
-                        QtGui.QMessageBox.information(self, "Bone Flex Drivers: Success", "Bone flex drivers saved successfully")
-                    except Exception as e:
-                        QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to save bone flex drivers: %s" % str(e))
-        dm.SetUndoEnabled(True)
+        shot = self.getRegisteredShot(shotName)
+        if shot is not None:
+            if engine.getBoneFlexDrivers(shot) is None:
+                QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "No bone flex drivers to save")
+                return
+            with self.profiler.section("exportBoneFlexDrivers"):
+                boneFlexDriversToSave = engine.exportBoneFlexDrivers(shot, animSetName)
+            if not boneFlexDriversToSave:
+                QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "No bone flex drivers to save for the selected animation set")
+                return
+            options = QtGui.QFileDialog.Options()
+            options |= QtGui.QFileDialog.DontUseNativeDialog
+            fileName, _ = QtGui.QFileDialog.getSaveFileName(self, "Save Bone Flex Drivers", "", "JSON Files (*.json);;All Files (*)", options=options)
+            if fileName:
+                try:
+                    # Append .json extension if not present
+                    if not fileName.lower().endswith('.json'):
+                        fileName += '.json'
+                    with self.profiler.section("saveBoneFlexDriversFile"):
+                        engine.saveBoneFlexDriversFile(fileName, boneFlexDriversToSave)
+                    QtGui.QMessageBox.information(self, "Bone Flex Drivers: Success", "Bone flex drivers saved successfully")
+                except Exception as e:
+                    QtGui.QMessageBox.critical(self, "Bone Flex Drivers: Error", "Failed to save bone flex drivers: %s" % str(e))
     def addBoneFlexDriver(self):
         # Dialog box to set name and select flex/bone
         dialog = QtGui.QDialog(self)
@@ -770,7 +1311,7 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         dialogLayout = QtGui.QFormLayout()
         dialog.setLayout(dialogLayout)
         nameEdit = QtGui.QLineEdit()
-        nameEdit.setText("boneFlexDriver%d" % (self.boneFlexDriversTable.rowCount() + 1))
+        nameEdit.setText("boneFlexDriver%d" % (self.boneFlexDriversModel.rowCount() + 1))
         dialogLayout.addRow("Name:", nameEdit)
         flexEdit = QtGui.QComboBox()
         dialogLayout.addRow("Flex:", flexEdit)
@@ -783,31 +1324,13 @@ class BoneFlexDriversWindow(QtGui.QWidget):
         # Populate flex and bone dropdowns based on current animation set
         shotName = self.shotDropdown.currentText()
         animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        for shot in shots:
-            if shot.GetName() == shotName:
-                for i in range(shot.animationSets.count()):
-                    if shot.animationSets[i].GetName() == animSetName:
-                        flexes = []
-                        for j in range(shot.animationSets[i].gameModel.globalFlexControllers.count()):
-                            if shot.animationSets[i].gameModel.globalFlexControllers[j] is None:
-                                continue
-                            flexName = shot.animationSets[i].gameModel.globalFlexControllers[j].GetName()
-                            flexEdit.addItem(flexName)
-                            flexes.append(flexName)
-                            flexes.append(flexName.replace("left_", "").replace("right_", "").replace("multi_", ""))
-                        for j in range(shot.animationSets[i].controls.count()):
-                            if shot.animationSets[i].controls[j] is None:
-                                continue
-                            controlName = shot.animationSets[i].controls[j].GetName().replace(" (disabled)", "")
-                            if " - " in controlName:
-                                # a rig script created this control, skip it
-                                continue
-                            # the name cannot be the same as a flex
-                            if controlName not in flexes:
-                                boneEdit.addItem(controlName)
-                        break
-                break
+        shot = self.getRegisteredShot(shotName)
+        if shot is not None:
+            animationSet = engine.findAnimationSet(shot, animSetName)
+            if animationSet is not None:
+                flexModel, boneModel, _, _ = self.getNameListModels(animationSet)
+                flexEdit.setModel(flexModel)
+                boneEdit.setModel(boneModel)
         if dialog.exec_() == QtGui.QDialog.Accepted:
             name = nameEdit.text().strip()
             flexName = flexEdit.currentText()
@@ -825,363 +1348,278 @@ class BoneFlexDriversWindow(QtGui.QWidget):
                 QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Bone must be selected")
                 return
             # Add the bone flex driver to the shot's boneFlexDrivers array
-            dm.SetUndoEnabled(False)
-            for shot in shots:
-                if shot.GetName() == shotName:
-                    boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                    if boneFlexDrivers is None:
-                        boneFlexDrivers = shot.AddAttribute("boneFlexDrivers", vs.AT_ELEMENT_ARRAY)
-                    newBoneFlexDriver = vs.CreateElement("DmElement", name.encode('utf-8'), shot.GetFileId())
-                    newBoneFlexDriver.AddAttribute("active", vs.AT_BOOL).SetValue(True)
-                    newBoneFlexDriver.AddAttribute("flexName", vs.AT_STRING).SetValue(flexName.encode('utf-8'))
-                    newBoneFlexDriver.AddAttribute("boneName", vs.AT_STRING).SetValue(boneName.encode('utf-8'))
-                    newBoneFlexDriver.AddAttribute("minFlexRange", vs.AT_FLOAT).SetValue(0.0)
-                    newBoneFlexDriver.AddAttribute("maxFlexRange", vs.AT_FLOAT).SetValue(1.0)
-                    newBoneFlexDriver.AddAttribute("usePosition", vs.AT_BOOL).SetValue(False)
-                    newBoneFlexDriver.AddAttribute("boneAxis", vs.AT_STRING).SetValue("X".encode('utf-8'))
-                    newBoneFlexDriver.AddAttribute("minBoneRange", vs.AT_FLOAT).SetValue(0.0)
-                    newBoneFlexDriver.AddAttribute("maxBoneRange", vs.AT_FLOAT).SetValue(90.0)
-                    newBoneFlexDriver.AddAttribute("clamp", vs.AT_BOOL).SetValue(True)
-                    newBoneFlexDriver.AddAttribute("boneDefaultPosition", vs.AT_FLOAT).SetValue(0.0)
-                    newBoneFlexDriver.AddAttribute("generatedOperators", vs.AT_ELEMENT_ARRAY)
-                    for i in range(shot.animationSets.count()):
-                        if shot.animationSets[i].GetName() == animSetName:
-                            newBoneFlexDriver.AddAttribute("animationSet", vs.AT_ELEMENT).SetValue(shot.animationSets[i])
-                            break
-                    boneFlexDrivers.AddToTail(newBoneFlexDriver)
-            self.refreshBoneFlexDrivers()
-            dm.SetUndoEnabled(True)
+            with self.undo.transaction("Add Bone Flex Driver"):
+                shot = self.getRegisteredShot(shotName)
+                if shot is not None:
+                    engine.addBoneFlexDriver(shot, engine.findAnimationSet(shot, animSetName), engine.BoneFlexDriver(name, flexName, boneName))
+                self.invalidateBoneFlexDriverRegistry()
+                self.refreshBoneFlexDrivers()
+    def getBakeFrameRate(self):
+        """
+        Returns the document's frame rate, or boneFlexDriversBakeFrameRate if it is unavailable.
+        """
+        try:
+            return float(sfmApp.GetFramesPerSecond())
+        except Exception:
+            return boneFlexDriversBakeFrameRate
+    @profiling.profiled("bakeBoneFlexDrivers")
+    def bakeBoneFlexDrivers(self):
+        """
+        Bakes the active bone flex drivers of the current animation set into their flex controls' channels.
+        """
+        shotName = self.shotDropdown.currentText()
+        animSetName = self.animationSetDropdown.currentText()
+        shot = self.getRegisteredShot(shotName)
+        if shot is None:
+            return
+        boneFlexDrivers = engine.getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            return
+        frameRate = self.getBakeFrameRate()
+        bakedCount = 0
+        with self.undo.transaction("Bake Bone Flex Drivers"):
+            for i in range(boneFlexDrivers.count()):
+                if boneFlexDrivers[i].animationSet.GetName() != animSetName or not engine.hasLiveOperators(boneFlexDrivers[i]):
+                    continue
+                error = bake.bakeBoneFlexDriver(shot, boneFlexDrivers[i], self.generator, frameRate)
+                if error is not None:
+                    QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", error)
+                    continue
+                bakedCount += 1
+            self.generator.pruneSharedOperators(shot)
+        self.setStatus("Baked %d bone flex driver(s) at %g frames per second" % (bakedCount, frameRate))
+    @profiling.profiled("unbakeBoneFlexDrivers")
+    def unbakeBoneFlexDrivers(self):
+        """
+        Restores the flex control keys of the current animation set's baked bone flex drivers and their operators.
+        """
+        shotName = self.shotDropdown.currentText()
+        animSetName = self.animationSetDropdown.currentText()
+        shot = self.getRegisteredShot(shotName)
+        if shot is None:
+            return
+        boneFlexDrivers = engine.getBoneFlexDrivers(shot)
+        if boneFlexDrivers is None:
+            return
+        bakedElements = []
+        for i in range(boneFlexDrivers.count()):
+            if boneFlexDrivers[i].animationSet.GetName() == animSetName and engine.isBaked(boneFlexDrivers[i]):
+                bakedElements.append(boneFlexDrivers[i])
+        with self.undo.transaction("Unbake Bone Flex Drivers"):
+            for element in bakedElements:
+                bake.unbakeBoneFlexDriver(shot, element, self.generator)
+        self.invalidateBoneFlexDriverRegistry() # unbaked bone flex drivers with an invalid animation set are removed
+        self.setStatus("Unbaked %d bone flex driver(s)" % len(bakedElements))
+    @profiling.profiled("removeBoneFlexDriver")
     def removeBoneFlexDriver(self):
         if not self.currentBoneFlexDriverUniqueId:
             return
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        # Found the bone flex driver, remove it
-                        for j in range(boneFlexDrivers[i].animationSet.controls.count()):
-                            if boneFlexDrivers[i].animationSet.controls[j] is None:
-                                continue
-                            controlName = boneFlexDrivers[i].animationSet.controls[j].GetName().replace(" (disabled)", "")
-                            if controlName == boneFlexDrivers[i].flexName.GetValue() or controlName == boneFlexDrivers[i].flexName.GetValue().replace("left_", "").replace("right_", ""):
-                                boneFlexDrivers[i].animationSet.controls[j].SetName(controlName)
-                                # if channel attribute doesn't exist, find "left"/"right" + "valuechannel"
-                                if not hasattr(boneFlexDrivers[i].animationSet.controls[j], "channel"):
-                                    if boneFlexDrivers[i].flexName.GetValue().startswith("left_"):
-                                        boneFlexDrivers[i].animationSet.controls[j].leftvaluechannel.toAttribute.SetValue("flexWeight")
-                                    elif boneFlexDrivers[i].flexName.GetValue().startswith("right_"):
-                                        boneFlexDrivers[i].animationSet.controls[j].rightvaluechannel.toAttribute.SetValue("flexWeight")
-                                else:
-                                    boneFlexDrivers[i].animationSet.controls[j].channel.toAttribute.SetValue("flexWeight")
-                                break
-                        boneFlexDrivers.remove(i)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.currentBoneFlexDriverUniqueId = "00000000-0000-0000-0000-000000000000"
-        self.refreshBoneFlexDrivers()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Remove Bone Flex Driver"):
+            if boneFlexDriver is not None:
+                # Found the bone flex driver, remove it
+                self.removeBoneFlexDriverElement(self.getRegisteredShot(shotName), boneFlexDriver)
+            self.currentBoneFlexDriverUniqueId = "00000000-0000-0000-0000-000000000000"
+            self.refreshBoneFlexDrivers()
+    @profiling.profiled("boneFlexDriverNameChanged")
     def boneFlexDriverNameChanged(self, text):
+        if self.populatingDetails:
+            return
         # Update the name in the table and the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if boneFlexDrivers[i].name.GetValue() == text:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its name
-                        boneFlexDrivers[i].SetName(text.encode('utf-8'))
-                        # Update the name in the table
-                        for row in range(self.boneFlexDriversTable.rowCount()):
-                            uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                            if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                                nameItem = self.boneFlexDriversTable.item(row, 0)
-                                nameItem.setText(text)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Rename Bone Flex Driver", ("name", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.name.GetValue() == text:
+                    return # no change
+                # Found the bone flex driver, update its name
+                boneFlexDriver.SetName(text.encode('utf-8'))
+                # Update the name in the table
+                self.boneFlexDriversModel.refreshBoneFlexDriver(self.currentBoneFlexDriverUniqueId)
+            self.markBoneFlexDriverDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
+    @profiling.profiled("boneFlexDriverActiveChanged")
     def boneFlexDriverActiveChanged(self, state):
+        if self.populatingDetails:
+            return
         # Update the active checkbox in the table and the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        dm.SetUndoEnabled(False)
-                        boneFlexDrivers[i].active.SetValue(state)
-                        dm.SetUndoEnabled(True)
-                        # Update the checkbox in the table
-                        for row in range(self.boneFlexDriversTable.rowCount()):
-                            uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                            if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                                activeCheckBox = self.boneFlexDriversTable.cellWidget(row, 4)
-                                activeCheckBox.setChecked(state)
-                        break
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Toggle Bone Flex Driver"):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.active.GetValue() == bool(state):
+                    return # no change
+                boneFlexDriver.active.SetValue(bool(state))
+                if not state:
+                    # no operators drive the flex anymore, so its flex control animates it again
+                    self.generator.getAnimationSetIndex(boneFlexDriver.animationSet).setFlexControlDriven(boneFlexDriver.flexName.GetValue(), False)
+                # Update the checkbox in the table
+                self.boneFlexDriversModel.refreshBoneFlexDriver(self.currentBoneFlexDriverUniqueId)
+            self.markBoneFlexDriverDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
+    @profiling.profiled("flexChanged")
     def flexChanged(self, index):
-        if index < 0:
+        if self.populatingDetails or index < 0:
             return
         # Update the flex name in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
         flexName = self.flexEdit.itemText(index)
-        if flexName in self.flexesInUse and flexName != self.boneFlexDriversTable.item(self.boneFlexDriversTable.currentRow(), 1).text():
+        currentRow = self.boneFlexDriversModel.findRow(self.currentBoneFlexDriverUniqueId)
+        currentFlexName = self.boneFlexDriversModel.getFlexName(currentRow) if currentRow >= 0 else ""
+        if flexName in self.flexesInUse and flexName != currentFlexName:
             QtGui.QMessageBox.warning(self, "Bone Flex Drivers: Error", "Flex '%s' is already in use by another bone flex driver" % flexName)
             # revert to previous selection
-            for row in range(self.boneFlexDriversTable.rowCount()):
-                uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                    flexItem = self.boneFlexDriversTable.item(row, 1)
-                    currentFlexName = flexItem.text()
-                    for i in range(self.flexEdit.count()):
-                        if self.flexEdit.itemText(i) == currentFlexName:
-                            self.flexEdit.setCurrentIndex(i)
-                            break
+            for i in range(self.flexEdit.count()):
+                if self.flexEdit.itemText(i) == currentFlexName:
+                    self.flexEdit.setCurrentIndex(i)
                     break
             return
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if boneFlexDrivers[i].flexName.GetValue() == flexName:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its flex name
-                        # Reset channel attribute on the flex control if it exists
-                        for j in range(boneFlexDrivers[i].animationSet.controls.count()):
-                            if boneFlexDrivers[i].animationSet.controls[j] is None:
-                                continue
-                            controlName = boneFlexDrivers[i].animationSet.controls[j].GetName().replace(" (disabled)", "")
-                            if controlName == boneFlexDrivers[i].flexName.GetValue() or controlName == boneFlexDrivers[i].flexName.GetValue().replace("left_", "").replace("right_", ""):
-                                boneFlexDrivers[i].animationSet.controls[j].SetName(controlName)
-                                # if channel attribute doesn't exist, find "left"/"right" + "valuechannel"
-                                if not hasattr(boneFlexDrivers[i].animationSet.controls[j], "channel"):
-                                    if boneFlexDrivers[i].flexName.GetValue().startswith("left_"):
-                                        boneFlexDrivers[i].animationSet.controls[j].leftvaluechannel.toAttribute.SetValue("flexWeight")
-                                    elif boneFlexDrivers[i].flexName.GetValue().startswith("right_"):
-                                        boneFlexDrivers[i].animationSet.controls[j].rightvaluechannel.toAttribute.SetValue("flexWeight")
-                                else:
-                                    boneFlexDrivers[i].animationSet.controls[j].channel.toAttribute.SetValue("flexWeight")
-                                break
-                        boneFlexDrivers[i].flexName.SetValue(flexName.encode('utf-8'))
-                        # Update the flex name in the table
-                        for row in range(self.boneFlexDriversTable.rowCount()):
-                            uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                            if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                                flexItem = self.boneFlexDriversTable.item(row, 1)
-                                flexItem.setText(flexName)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.refreshBoneFlexDrivers()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Flex"):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.flexName.GetValue() == flexName:
+                    return # no change
+                # Found the bone flex driver, update its flex name
+                # Reset channel attribute on the flex control if it exists
+                previousFlexName = boneFlexDriver.flexName.GetValue()
+                self.generator.getAnimationSetIndex(boneFlexDriver.animationSet).setFlexControlDriven(previousFlexName, False)
+                boneFlexDriver.flexName.SetValue(flexName.encode('utf-8'))
+                if previousFlexName in self.flexesInUse:
+                    self.flexesInUse.remove(previousFlexName)
+                self.flexesInUse.append(boneFlexDriver.flexName.GetValue())
+                # Update the flex name in the table
+                self.boneFlexDriversModel.refreshBoneFlexDriver(self.currentBoneFlexDriverUniqueId)
+            # the new flex needs its own operator chain, which drives its control once rebuilt
+            self.markBoneFlexDriverDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
+        #self.refreshBoneFlexDrivers()
+    @profiling.profiled("minFlexRangeChanged")
     def minFlexRangeChanged(self, value):
+        if self.populatingDetails:
+            return
         # Update the min flex range in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if hasattr(boneFlexDrivers[i], "minFlexRange") and boneFlexDrivers[i].minFlexRange.GetValue() == value:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its min flex range
-                        if not hasattr(boneFlexDrivers[i], "minFlexRange"):
-                            boneFlexDrivers[i].AddAttribute("minFlexRange", vs.AT_FLOAT)
-                        boneFlexDrivers[i].minFlexRange.SetValue(value)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Flex Range", ("minFlexRange", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "minFlexRange") and boneFlexDriver.minFlexRange.GetValue() == value:
+                    return # no change
+                # Found the bone flex driver, update its min flex range
+                if not hasattr(boneFlexDriver, "minFlexRange"):
+                    boneFlexDriver.AddAttribute("minFlexRange", vs.AT_FLOAT)
+                boneFlexDriver.minFlexRange.SetValue(value)
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("maxFlexRangeChanged")
     def maxFlexRangeChanged(self, value):
+        if self.populatingDetails:
+            return
         # Update the max flex range in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if hasattr(boneFlexDrivers[i], "maxFlexRange") and boneFlexDrivers[i].maxFlexRange.GetValue() == value:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its max flex range
-                        if not hasattr(boneFlexDrivers[i], "maxFlexRange"):
-                            boneFlexDrivers[i].AddAttribute("maxFlexRange", vs.AT_FLOAT)
-                        boneFlexDrivers[i].maxFlexRange.SetValue(value)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Flex Range", ("maxFlexRange", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "maxFlexRange") and boneFlexDriver.maxFlexRange.GetValue() == value:
+                    return # no change
+                # Found the bone flex driver, update its max flex range
+                if not hasattr(boneFlexDriver, "maxFlexRange"):
+                    boneFlexDriver.AddAttribute("maxFlexRange", vs.AT_FLOAT)
+                boneFlexDriver.maxFlexRange.SetValue(value)
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("boneChanged")
     def boneChanged(self, index):
-        if index < 0:
+        if self.populatingDetails or index < 0:
             return
         # Update the bone name in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
         boneName = self.boneEdit.itemText(index)
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if boneFlexDrivers[i].boneName.GetValue() == boneName:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its bone name
-                        boneFlexDrivers[i].boneName.SetValue(boneName.encode('utf-8'))
-                        # Update the bone name in the table
-                        for row in range(self.boneFlexDriversTable.rowCount()):
-                            uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                            if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                                boneItem = self.boneFlexDriversTable.item(row, 2)
-                                boneItem.setText(boneName)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Bone"):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.boneName.GetValue() == boneName:
+                    return # no change
+                # Found the bone flex driver, update its bone name
+                boneFlexDriver.boneName.SetValue(boneName.encode('utf-8'))
+                # Update the bone name in the table
+                self.boneFlexDriversModel.refreshBoneFlexDriver(self.currentBoneFlexDriverUniqueId)
+            self.markBoneFlexDriverInputDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("boneAxisChanged")
     def boneAxisChanged(self, index):
-        if index < 0:
+        if self.populatingDetails or index < 0:
             return
         # Update the bone axis in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
         boneAxis = self.boneAxisEdit.itemText(index)
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if boneFlexDrivers[i].boneAxis.GetValue() == boneAxis:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its bone axis
-                        boneFlexDrivers[i].boneAxis.SetValue(boneAxis.encode('utf-8'))
-                        # Update the bone axis in the table
-                        for row in range(self.boneFlexDriversTable.rowCount()):
-                            uniqueIdItem = self.boneFlexDriversTable.item(row, 5)
-                            if uniqueIdItem.text() == self.currentBoneFlexDriverUniqueId:
-                                boneAxisItem = self.boneFlexDriversTable.item(row, 3)
-                                boneAxisItem.setText(boneAxis)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Axis"):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.boneAxis.GetValue() == boneAxis:
+                    return # no change
+                # Found the bone flex driver, update its bone axis
+                boneFlexDriver.boneAxis.SetValue(boneAxis.encode('utf-8'))
+            self.markBoneFlexDriverDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("minBoneRangeChanged")
     def minBoneRangeChanged(self, value):
+        if self.populatingDetails:
+            return
         # Update the min bone range in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if hasattr(boneFlexDrivers[i], "minBoneRange") and boneFlexDrivers[i].minBoneRange.GetValue() == value:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its min bone range
-                        if not hasattr(boneFlexDrivers[i], "minBoneRange"):
-                            boneFlexDrivers[i].AddAttribute("minBoneRange", vs.AT_FLOAT)
-                        boneFlexDrivers[i].minBoneRange.SetValue(value)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Bone Range", ("minBoneRange", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "minBoneRange") and boneFlexDriver.minBoneRange.GetValue() == value:
+                    return # no change
+                # Found the bone flex driver, update its min bone range
+                if not hasattr(boneFlexDriver, "minBoneRange"):
+                    boneFlexDriver.AddAttribute("minBoneRange", vs.AT_FLOAT)
+                boneFlexDriver.minBoneRange.SetValue(value)
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("maxBoneRangeChanged")
     def maxBoneRangeChanged(self, value):
+        if self.populatingDetails:
+            return
         # Update the max bone range in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        if hasattr(boneFlexDrivers[i], "maxBoneRange") and boneFlexDrivers[i].maxBoneRange.GetValue() == value:
-                            dm.SetUndoEnabled(True)
-                            return # no change
-                        # Found the bone flex driver, update its max bone range
-                        if not hasattr(boneFlexDrivers[i], "maxBoneRange"):
-                            boneFlexDrivers[i].AddAttribute("maxBoneRange", vs.AT_FLOAT)
-                        boneFlexDrivers[i].maxBoneRange.SetValue(value)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Bone Range", ("maxBoneRange", shotName, self.currentBoneFlexDriverUniqueId)):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "maxBoneRange") and boneFlexDriver.maxBoneRange.GetValue() == value:
+                    return # no change
+                # Found the bone flex driver, update its max bone range
+                if not hasattr(boneFlexDriver, "maxBoneRange"):
+                    boneFlexDriver.AddAttribute("maxBoneRange", vs.AT_FLOAT)
+                boneFlexDriver.maxBoneRange.SetValue(value)
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.scheduleCommit()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("clampChanged")
     def clampChanged(self, state):
+        if self.populatingDetails:
+            return
         # Update the clamp checkbox in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == self.currentBoneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        boneFlexDrivers[i].clamp.SetValue(state)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, self.currentBoneFlexDriverUniqueId)
+        with self.undo.transaction("Edit Bone Flex Driver Clamp"):
+            if boneFlexDriver is not None:
+                if hasattr(boneFlexDriver, "clamp") and boneFlexDriver.clamp.GetValue() == bool(state):
+                    return # no change
+                if not hasattr(boneFlexDriver, "clamp"):
+                    boneFlexDriver.AddAttribute("clamp", vs.AT_BOOL)
+                boneFlexDriver.clamp.SetValue(bool(state))
+            self.markBoneFlexDriverExpressionDirty(shotName, self.currentBoneFlexDriverUniqueId)
+            self.commitNow()
         #self.refreshBoneFlexDrivers()
+    @profiling.profiled("onBoneFlexDriverActiveChanged")
     def onBoneFlexDriverActiveChanged(self, checked, boneFlexDriverUniqueId):
         if self.currentBoneFlexDriverUniqueId == boneFlexDriverUniqueId:
             # Update the checkbox in the details panel if it matches the current bone flex driver
@@ -1189,21 +1627,18 @@ class BoneFlexDriversWindow(QtGui.QWidget):
             return # already handled in boneFlexDriverActiveChanged
         # Update the active state in the bone flex driver object
         shotName = self.shotDropdown.currentText()
-        animSetName = self.animationSetDropdown.currentText()
-        shots = sfmApp.GetShots()
-        dm.SetUndoEnabled(False)
-        for shot in shots:
-            if shot.GetName() == shotName:
-                boneFlexDrivers = getattr(shot, "boneFlexDrivers", None)
-                if boneFlexDrivers is None:
-                    break
-                for i in range(boneFlexDrivers.count()):
-                    if boneFlexDrivers[i].GetId().__str__() == boneFlexDriverUniqueId and boneFlexDrivers[i].animationSet.name.GetValue() == animSetName:
-                        boneFlexDrivers[i].active.SetValue(checked)
-                        break
-                break
-        dm.SetUndoEnabled(True)
-        self.generateOperators()
+        boneFlexDriver = self.getRegisteredBoneFlexDriver(shotName, boneFlexDriverUniqueId)
+        with self.undo.transaction("Toggle Bone Flex Driver"):
+            if boneFlexDriver is not None:
+                if boneFlexDriver.active.GetValue() == checked:
+                    return # no change
+                boneFlexDriver.active.SetValue(checked)
+                if not checked:
+                    # no operators drive the flex anymore, so its flex control animates it again
+                    self.generator.getAnimationSetIndex(boneFlexDriver.animationSet).setFlexControlDriven(boneFlexDriver.flexName.GetValue(), False)
+            self.boneFlexDriversModel.refreshBoneFlexDriver(boneFlexDriverUniqueId)
+            self.markBoneFlexDriverDirty(shotName, boneFlexDriverUniqueId)
+            self.commitNow()
 
 def createBoneFlexDriversWindow():
     try:
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Bone Flex Drivers test sessions for Source Filmmaker (SFM)
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Builds keyvalues2 session files laid out like SFM's, for testing the DMX reader, writer and command line.
+
+
+from boneflexdrivers import engine, localdm, dmx, benchmark
+
+engine.setDatamodel(localdm)
+
+def createSessionRoot(driverCount=4, withBoneFlexDrivers=True):
+    """
+    Creates a session root whose active clip holds a benchmark shot with two animation sets of driverCount bone flex drivers,
+    a foreign operator, and attributes the engine never reads, such as colors and escaped strings.
+    Without bone flex drivers, the animation sets keep their flexes for bone flex drivers to be imported to.
+    Returns the root and the shot.
+    """
+    localdm.clearDocument()
+    shot = benchmark.createSession(2, 8, driverCount)
+    if not withBoneFlexDrivers:
+        shot.RemoveAttribute("boneFlexDrivers")
+    root = localdm.CreateElement("DmElement", "session", 0)
+    movie = localdm.CreateElement("DmeFilmClip", "session", 0)
+    subClipTrackGroup = localdm.CreateElement("DmeTrackGroup", "subClipTrackGroup", 0)
+    track = localdm.CreateElement("DmeTrack", "Film", 0)
+    track.AddAttribute("children", localdm.AT_ELEMENT_ARRAY).AddToTail(shot)
+    subClipTrackGroup.AddAttribute("tracks", localdm.AT_ELEMENT_ARRAY).AddToTail(track)
+    movie.SetValue("subClipTrackGroup", subClipTrackGroup)
+    root.SetValue("activeClip", movie)
+    root.SetValue("settings", dmx.RawValue("color", "255 0 0 255"))
+    root.SetValue("comment", u"quote \" back\\slash\r\nnew line\ttab é")
+    shot.AddAttribute("times", localdm.AT_TIME_ARRAY).SetValue([localdm.DmeTime_t(0.5), localdm.DmeTime_t(1.0)])
+    foreignOperator = localdm.CreateElement("DmeExpressionOperator", "rig_foreign", 0)
+    foreignOperator.expr.SetValue("value * 2")
+    shot.operators.AddToTail(foreignOperator)
+    engine.OperatorGenerator().generateShot(shot)
+    return root, shot
+
+def writeSession(fileName, driverCount=4, withBoneFlexDrivers=True):
+    """
+    Writes a session from createSessionRoot() to a keyvalues2 file, returning its shot.
+    """
+    root, shot = createSessionRoot(driverCount, withBoneFlexDrivers)
+    dmx.writeDmx(fileName, dmx.DmxDocument(root))
+    return shot
@@ -0,0 +1,49 @@
+# Bone Flex Drivers bake tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Bakes and unbakes bone flex drivers of shots from the local datamodel:
+#   python -m unittest discover -s tests -t .
+
+
+import unittest
+
+from boneflexdrivers import engine, localdm, bake, benchmark
+
+engine.setDatamodel(localdm)
+
+class BakeTest(unittest.TestCase):
+    def setUp(self):
+        localdm.clearDocument()
+        self.shot = benchmark.createSession(1, 2, 1)
+        self.generator = engine.OperatorGenerator()
+        self.generator.generateShot(self.shot)
+        self.element = engine.getBoneFlexDrivers(self.shot)[0]
+        self.flexChannel = self.generator.getAnimationSetIndex(self.element.animationSet).getFlexChannel("flex0")
+    def testShotTimeRange(self):
+        timeFrame = self.shot.timeFrame
+        self.assertEqual(bake.getShotTimeRange(self.shot), (0.0, 10.0))
+        # a shot placed at 5 seconds in the movie, trimmed to start 2 seconds into its media and played at half speed
+        timeFrame.start.SetValue(localdm.DmeTime_t(5.0))
+        timeFrame.duration.SetValue(localdm.DmeTime_t(4.0))
+        timeFrame.offset.SetValue(localdm.DmeTime_t(2.0))
+        timeFrame.scale.SetValue(0.5)
+        self.assertEqual(bake.getShotTimeRange(self.shot), (2.0, 4.0))
+    def testRebakeAndUnbake(self):
+        boneControl = self.generator.getAnimationSetIndex(self.element.animationSet).controls.get("bone0")
+        boneControl.orientationChannel.log.SetKey(localdm.DmeTime_t(0.0), localdm.Quaternion(0.0, 0.0, 0.0, 1.0))
+        self.flexChannel.log.SetKey(localdm.DmeTime_t(0.0), 0.25)
+        self.assertIsNone(bake.bakeBoneFlexDriver(self.shot, self.element, self.generator, 24))
+        self.assertTrue(engine.isBaked(self.element))
+        self.assertEqual(self.flexChannel.log.GetKeyCount(), 10 * 24 + 1)
+        self.assertIsNone(bake.unbakeBoneFlexDriver(self.shot, self.element, self.generator))
+        self.assertFalse(self.element.HasAttribute("bakeBackupLog"))
+        self.assertEqual(self.flexChannel.log.GetKeyCount(), 1)
+        self.assertEqual(self.flexChannel.log.GetKeyValue(0), 0.25)
+        # baking again reuses the attributes left by the first bake
+        self.assertIsNone(bake.bakeBoneFlexDriver(self.shot, self.element, self.generator, 24))
+        self.assertTrue(engine.isBaked(self.element))
+        self.assertEqual(self.element.bakeBackupLog.GetKeyCount(), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# Bone Flex Drivers command line tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Runs the command line on session files, like it is run from a shell:
+#   python -m unittest discover -s tests -t .
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from boneflexdrivers import engine, localdm, dmx, library, cli
+from tests import sessions
+
+class OutputCapture(object):
+    """
+    Collects what the command line prints, in place of sys.stdout.
+    """
+    def __init__(self):
+        self.lines = []
+    def write(self, text):
+        self.lines.append(text)
+    def flush(self):
+        pass
+
+def countOperators(fileName):
+    """
+    Reads a session, returning the number of bone flex drivers, their operators and the shot's operators of each shot.
+    """
+    generator = engine.OperatorGenerator()
+    counts = []
+    for shot in dmx.getShots(dmx.readDmx(fileName).root):
+        boneFlexDriverCount, operatorCount = generator.countShotOperators(shot)[:2]
+        counts.append((boneFlexDriverCount, operatorCount, shot.operators.count()))
+    return counts
+
+class CommandLineTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.libraryFileName = os.path.join(self.folder, "drivers.jsonl")
+        shot = sessions.writeSession(os.path.join(self.folder, "source.dmx"))
+        library.saveLibrary(self.libraryFileName, engine.exportSession([shot])["models"])
+        self.fileName = os.path.join(self.folder, "session.dmx")
+        sessions.writeSession(self.fileName, withBoneFlexDrivers=False)
+        self.outputFolder = os.path.join(self.folder, "out")
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    def runCommandLine(self, argv):
+        """
+        Runs the command line in this process, returning its exit code and output.
+        """
+        output = OutputCapture()
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            exitCode = cli.main(argv)
+        finally:
+            sys.stdout = stdout
+        return exitCode, "".join(output.lines)
+    def testLibraryAndRegenerate(self):
+        exitCode, output = self.runCommandLine(["--library", self.libraryFileName, "--regenerate", "--output-dir", self.outputFolder, "--jobs", "1", self.fileName])
+        self.assertEqual(exitCode, 0, output)
+        outputFileName = os.path.join(self.outputFolder, "session.dmx")
+        counts = countOperators(outputFileName)
+        # every bone flex driver of both animation sets is imported and generated, next to the foreign operator
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(counts[0][0], 8)
+        self.assertTrue(counts[0][1] > 0)
+        self.assertEqual(counts[0][2], counts[0][1] + 1)
+        self.assertEqual(countOperators(self.fileName), [(0, 0, 1)])
+        # running the same command again skips the bone flex drivers that are already there, and regenerates the same graph
+        exitCode, output = self.runCommandLine(["--library", self.libraryFileName, "--regenerate", "--in-place", "--jobs", "1", outputFileName])
+        self.assertEqual(exitCode, 0, output)
+        self.assertEqual(countOperators(outputFileName), counts)
+        self.assertFalse(os.path.exists(outputFileName + ".tmp"))
+    def testMissingFileFails(self):
+        exitCode, output = self.runCommandLine(["--regenerate", "--output-dir", self.outputFolder, "--jobs", "1", os.path.join(self.folder, "missing.dmx")])
+        self.assertEqual(exitCode, 1)
+        self.assertIn("error", output)
+
+if __name__ == "__main__":
+    unittest.main()
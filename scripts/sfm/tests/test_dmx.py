@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Bone Flex Drivers DMX tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Checks that sessions written lazily read back the same as sessions written whole:
+#   python -m unittest discover -s tests -t .
+
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from boneflexdrivers import engine, localdm, dmx
+from tests import sessions
+
+def mutate(document):
+    """
+    Makes the kinds of changes the command line makes to a session, along with ones it never makes:
+    renames, escaped strings, removed and retargeted bone flex drivers with regenerated operators,
+    a new element referenced twice sharing an inline element, and a dropped inline element.
+    """
+    root = document.root
+    shot = dmx.getShots(root)[0]
+    shot.SetName("renamed")
+    root.comment.SetValue(u"carriage\rreturn \"quoted\" é")
+    boneFlexDrivers = list(engine.getBoneFlexDrivers(shot))
+    engine.removeBoneFlexDriverElement(shot, boneFlexDrivers[0])
+    boneFlexDrivers[1].boneName.SetValue("bone7")
+    engine.OperatorGenerator().generateShot(shot)
+    holder = localdm.CreateElement("DmElement", "holder", 0)
+    holder.SetValue("clip", root.activeClip)
+    holders = root.AddAttribute("holders", localdm.AT_ELEMENT_ARRAY)
+    holders.AddToTail(holder)
+    holders.AddToTail(holder)
+    shot.SetValue("timeFrame", None)
+
+def formatAttribute(element, name, ordinals, stack):
+    """
+    Returns the text of an attribute for dumpGraph(), with elements written as their ordinals.
+    """
+    attributeType = element.GetAttributeType(name)
+    value = dmx.getAttributeValue(element, name)
+    if attributeType == localdm.AT_ELEMENT:
+        return getOrdinal(value, ordinals, stack)
+    if attributeType == localdm.AT_ELEMENT_ARRAY:
+        return [getOrdinal(item, ordinals, stack) for item in value]
+    if isinstance(value, dmx.RawValue):
+        return (value.typeName, value.text)
+    if isinstance(value, list):
+        return [dmx.formatValue(attributeType, item) for item in value]
+    return dmx.formatValue(attributeType, value)
+
+def getOrdinal(element, ordinals, stack):
+    if element is None:
+        return None
+    uniqueId = element.GetId().__str__()
+    if uniqueId not in ordinals:
+        ordinals[uniqueId] = len(ordinals)
+        stack.append(element)
+    return ordinals[uniqueId]
+
+def dumpGraph(root):
+    """
+    Returns every element reachable from the root with its attributes, numbering elements in the order they are found,
+    so graphs with different unique ids for new elements compare equal.
+    """
+    ordinals = {}
+    stack = []
+    getOrdinal(root, ordinals, stack)
+    rows = []
+    while stack:
+        element = stack.pop(0)
+        attributes = [(name, formatAttribute(element, name, ordinals, stack)) for name in element.GetAttributeNames()]
+        rows.append((ordinals[element.GetId().__str__()], element.GetType(), sorted(attributes, key=lambda attribute: attribute[0])))
+    return rows
+
+def readText(fileName):
+    with io.open(fileName, "r", encoding="utf-8", newline="") as fileObject:
+        return fileObject.read()
+
+class EscapeTest(unittest.TestCase):
+    def testRoundTrip(self):
+        for text in (u"\\", u"\"", u"\n", u"\t", u"\r", u"\v", u"\b", u"\f", u"\a", u"a\r\nb \"c\" é"):
+            self.assertEqual(dmx.unescape(dmx.escape(text)), text)
+            self.assertNotIn(u"\r", dmx.escape(text))
+    def testUnescapableCharacter(self):
+        self.assertRaises(ValueError, dmx.escape, u"a\x01b")
+
+class LazyDmxTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.folder, "session.dmx")
+        sessions.writeSession(self.fileName)
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    def writeLazily(self, outputFileName, change=None):
+        document = dmx.readLazyDmx(self.fileName)
+        try:
+            if change is not None:
+                change(document)
+            dmx.writeLazyDmx(outputFileName, document)
+        finally:
+            document.close()
+    def testUnchangedWriteIsIdentical(self):
+        outputFileName = os.path.join(self.folder, "unchanged.dmx")
+        self.writeLazily(outputFileName)
+        self.assertEqual(readText(outputFileName), readText(self.fileName))
+    def testChangedWriteMatchesEagerWrite(self):
+        lazyFileName = os.path.join(self.folder, "lazy.dmx")
+        eagerFileName = os.path.join(self.folder, "eager.dmx")
+        self.writeLazily(lazyFileName, mutate)
+        document = dmx.readDmx(self.fileName)
+        mutate(document)
+        dmx.writeDmx(eagerFileName, document)
+        lazyDocument = dmx.readDmx(lazyFileName)
+        eagerDocument = dmx.readDmx(eagerFileName)
+        self.assertEqual(dumpGraph(lazyDocument.root), dumpGraph(eagerDocument.root))
+        # every element is written once, and only elements that are still referenced are written
+        uniqueIds = re.findall(r'"id" "elementid" "([^"]+)"', readText(lazyFileName))
+        self.assertEqual(len(uniqueIds), len(set(uniqueIds)))
+        self.assertEqual(sorted(uniqueIds), sorted(dmx.countReferences(lazyDocument.root)[1].keys()))
+        self.assertEqual(lazyDocument.root.comment.GetValue(), u"carriage\rreturn \"quoted\" é")
+        shot = dmx.getShots(lazyDocument.root)[0]
+        self.assertEqual(shot.GetName(), "renamed")
+        self.assertIsNone(shot.timeFrame)
+        self.assertIn("rig_foreign", [operator.GetName() for operator in shot.operators])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# Bone Flex Drivers engine tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Edits the operators of bone flex drivers in shots from the local datamodel:
+#   python -m unittest discover -s tests -t .
+
+
+import unittest
+
+from boneflexdrivers import engine, localdm, benchmark
+
+engine.setDatamodel(localdm)
+
+def getConnectionInputs(generator, element):
+    """
+    Returns the elements the connections of a bone flex driver's components read from.
+    """
+    boneFlexDriver = engine.BoneFlexDriver.fromElement(element)
+    return [generator.findGeneratedOperator(element, component).input.element for component in boneFlexDriver.getComponents(generator.optimizedGraph)]
+
+class RetargetTest(unittest.TestCase):
+    def setUp(self):
+        localdm.clearDocument()
+        self.shot = benchmark.createSession(1, 4, 1)
+        self.element = engine.getBoneFlexDrivers(self.shot)[0]
+    def retarget(self, generator):
+        generator.generateShot(self.shot)
+        self.element.boneName.SetValue("bone3")
+        self.assertTrue(generator.retargetBoneFlexDriverInput(self.shot, self.element))
+        generator.pruneSharedOperators(self.shot)
+    def testOptimizedGraph(self):
+        generator = engine.OperatorGenerator(True)
+        self.retarget(generator)
+        unpack = generator.getSharedOperatorIndex(self.shot).get(generator.getSharedUnpackPrefix(self.element) + "unpack")
+        self.assertIsNotNone(unpack)
+        for connectionInput in getConnectionInputs(generator, self.element):
+            self.assertIs(connectionInput, unpack)
+        # the stage of the previous bone had no other readers, so only the new bone's transform and unpack are left
+        sharedOperators = self.shot.boneFlexDriverSharedOperators
+        self.assertEqual(sharedOperators.count(), 2)
+        for sharedOperator in sharedOperators:
+            self.assertIn("_bone3_", sharedOperator.GetName())
+        self.assertTrue(generator.hasCurrentOperators(self.element, generator.getOperatorIds(self.shot.operators)))
+    def testFullGraph(self):
+        generator = engine.OperatorGenerator(False)
+        self.retarget(generator)
+        boneControl = generator.getAnimationSetIndex(self.element.animationSet).controls.get("bone3")
+        self.assertIs(generator.findGeneratedOperator(self.element, "transform").input.element, boneControl.orientationChannel.toElement)
+
+class RemoveTest(unittest.TestCase):
+    def setUp(self):
+        localdm.clearDocument()
+        self.shot = benchmark.createSession(1, 4, 2)
+        self.element = engine.getBoneFlexDrivers(self.shot)[0]
+    def remove(self, generator):
+        generator.generateShot(self.shot)
+        removedIds = generator.getOperatorIds(self.element.generatedOperators)
+        generator.removeBoneFlexDriver(self.shot, self.element)
+        return removedIds
+    def assertNoOperatorsOf(self, generator, removedIds):
+        operatorIds = generator.getOperatorIds(self.shot.operators)
+        self.assertFalse(operatorIds & removedIds)
+        # only the operators of the remaining bone flex driver are left
+        self.assertEqual(operatorIds, generator.getOwnedOperatorIds(self.shot))
+        for operator in self.shot.operators:
+            self.assertNotIn("boneFlexDriver1_", operator.GetName())
+    def testRemoveThenRefresh(self):
+        for optimizedGraph in (True, False):
+            generator = engine.OperatorGenerator(optimizedGraph)
+            removedIds = self.remove(generator)
+            self.assertTrue(removedIds)
+            self.assertEqual(generator.refreshShot(self.shot), (0, 0))
+            self.assertNoOperatorsOf(generator, removedIds)
+            generator.generateShot(self.shot)
+            self.assertNoOperatorsOf(generator, removedIds)
+            self.setUp()
+    def testSharedStageIsPruned(self):
+        generator = engine.OperatorGenerator(True)
+        self.remove(generator)
+        for sharedOperator in self.shot.boneFlexDriverSharedOperators:
+            self.assertNotIn("_bone0_", sharedOperator.GetName())
+    def testFlexControlIsReconnected(self):
+        generator = engine.OperatorGenerator(True)
+        animationSetIndex = generator.getAnimationSetIndex(self.element.animationSet)
+        self.remove(generator)
+        self.assertEqual(animationSetIndex.getFlexChannel("flex0").toAttribute.GetValue(), "flexWeight")
+        self.assertEqual(animationSetIndex.getFlexChannel("flex1").toAttribute.GetValue(), "disabled")
+
+class ExpressionCacheTest(unittest.TestCase):
+    def createBoneFlexDriver(self, maxBoneRange):
+        return engine.BoneFlexDriver("boneFlexDriver", "flex", "bone", maxBoneRange=maxBoneRange)
+    def testHitsAndMisses(self):
+        cache = engine.ExpressionCache()
+        boneFlexDriver = self.createBoneFlexDriver(90.0)
+        self.assertEqual(cache.getExpression(boneFlexDriver), boneFlexDriver.buildExpression())
+        self.assertEqual(cache.getExpression(boneFlexDriver), boneFlexDriver.buildExpression())
+        # a bone flex driver with other names but the same parameters shares the entry
+        cache.getFunction(engine.BoneFlexDriver("other", "flex2", "bone2", maxBoneRange=90.0))
+        cache.getExpression(self.createBoneFlexDriver(45.0))
+        self.assertEqual(cache.getStats(), {"hits": 2, "misses": 2, "size": 2, "maxSize": 256})
+        cache.clear()
+        self.assertEqual(cache.getStats(), {"hits": 0, "misses": 0, "size": 0, "maxSize": 256})
+    def testLeastRecentlyUsedEviction(self):
+        cache = engine.ExpressionCache(2)
+        first = self.createBoneFlexDriver(10.0)
+        second = self.createBoneFlexDriver(20.0)
+        third = self.createBoneFlexDriver(30.0)
+        cache.getExpression(first)
+        cache.getExpression(second)
+        cache.getExpression(first) # the second is now the least recently used
+        cache.getExpression(third)
+        self.assertEqual(list(cache.entries.keys()), [first.getExpressionKey(), third.getExpressionKey()])
+        cache.getExpression(second)
+        self.assertEqual(cache.getStats(), {"hits": 1, "misses": 4, "size": 2, "maxSize": 2})
+    def testRefreshDoesNotUseTheCache(self):
+        localdm.clearDocument()
+        shot = benchmark.createSession(1, 4, 2)
+        generator = engine.OperatorGenerator()
+        generator.generateShot(shot)
+        stats = engine.expressionCache.getStats()
+        self.assertEqual(generator.refreshShot(shot), (0, 0))
+        self.assertEqual(engine.expressionCache.getStats(), stats)
+
+if __name__ == "__main__":
+    unittest.main()
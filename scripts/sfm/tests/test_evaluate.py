@@ -0,0 +1,87 @@
+# Bone Flex Drivers evaluator tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Checks that the evaluator computes what the DmeExpressionOperator computes from each bone flex driver's expression:
+#   python -m unittest discover -s tests -t .
+
+
+import itertools
+import math
+import unittest
+
+from boneflexdrivers import engine, evaluate
+
+# the expression operator's functions, one sample at a time
+referenceNamespace = {
+    "__builtins__": {},
+    "rtod": math.degrees,
+    "atan2": math.atan2,
+    "asin": math.asin,
+    "ramp": lambda value, minimum, maximum: (value - minimum) / (maximum - minimum),
+    "clamp": lambda value, minimum, maximum: min(max(value, minimum), maximum),
+    "lerp": lambda value, minimum, maximum: minimum + (maximum - minimum) * value,
+}
+
+def eulerToQuaternion(roll, pitch, yaw):
+    """
+    Returns the (x, y, z, w) quaternion of rotations in degrees about X, Y and Z.
+    """
+    cr, sr = math.cos(math.radians(roll) / 2), math.sin(math.radians(roll) / 2)
+    cp, sp = math.cos(math.radians(pitch) / 2), math.sin(math.radians(pitch) / 2)
+    cy, sy = math.cos(math.radians(yaw) / 2), math.sin(math.radians(yaw) / 2)
+    return (sr * cp * cy - cr * sp * sy, cr * sp * cy + sr * cp * sy, cr * cp * sy - sr * sp * cy, cr * cp * cy + sr * sp * sy)
+
+# samples on both sides of and within the bone ranges below, as many of each so every combination evaluates at once
+rotationSamples = [eulerToQuaternion(angle, angle * 0.5, -angle) for angle in (-60.0, -10.0, 0.0, 15.0, 30.0, 80.0)]
+translationSamples = [(value, value * 2.0 - 1.0, -value, 1.0) for value in (-3.0, -0.5, 0.0, 0.75, 1.5, 4.0)]
+
+# usePosition, boneAxis, (minBoneRange, maxBoneRange), (minFlexRange, maxFlexRange), clamp
+combinations = list(itertools.product(
+    (False, True),
+    ("X", "Y", "Z"),
+    ((0.0, 45.0), (45.0, 0.0), (-1.0, 2.0)), # forward, inverted, and a range samples fall outside of
+    ((0.0, 1.0), (1.0, 0.0), (0.25, 0.75)),
+    (True, False),
+))
+
+def evaluateReference(expression, samples):
+    return [eval(expression, referenceNamespace, {"x": x, "y": y, "z": z, "w": w}) for x, y, z, w in samples]
+
+def toList(values):
+    return [float(value) for value in values]
+
+class EvaluateTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = evaluate.numpy
+    def tearDown(self):
+        evaluate.numpy = self.numpy
+    def assertWeightsEqual(self, actual, expected, label):
+        self.assertEqual(len(actual), len(expected), label)
+        for actualWeight, expectedWeight in zip(actual, expected):
+            self.assertAlmostEqual(actualWeight, expectedWeight, 9, "%s: %r != %r" % (label, actual, expected))
+    def checkCombinations(self):
+        boneFlexDrivers = []
+        samplesPerDriver = []
+        for usePosition, boneAxis, boneRange, flexRange, clamp in combinations:
+            boneFlexDriver = engine.BoneFlexDriver("boneFlexDriver", "flex", "bone", True, flexRange[0], flexRange[1], usePosition, boneAxis, boneRange[0], boneRange[1], clamp, 0.25 if usePosition else 0.0)
+            samples = translationSamples if usePosition else rotationSamples
+            label = "usePosition=%s axis=%s bone=%s flex=%s clamp=%s" % (usePosition, boneAxis, boneRange, flexRange, clamp)
+            expected = evaluateReference(boneFlexDriver.buildExpression(), samples)
+            x, y, z, w = [list(component) for component in zip(*samples)]
+            self.assertWeightsEqual(toList(evaluate.evaluateComponents(boneFlexDriver, x, y, z, None if usePosition else w)), expected, label)
+            self.assertWeightsEqual(toList(evaluate.compileExpression(boneFlexDriver.buildExpression())(x, y, z, None if usePosition else w)), expected, label)
+            boneFlexDrivers.append(boneFlexDriver)
+            samplesPerDriver.append((x, y, z, w, expected, label))
+        # every combination at once, one row each
+        rows = evaluate.evaluateBoneFlexDrivers(boneFlexDrivers, [row[0] for row in samplesPerDriver], [row[1] for row in samplesPerDriver], [row[2] for row in samplesPerDriver], [row[3] for row in samplesPerDriver])
+        for weights, row in zip(rows, samplesPerDriver):
+            self.assertWeightsEqual(toList(weights), row[4], row[5])
+    def testMatchesExpression(self):
+        self.checkCombinations()
+    def testMatchesExpressionWithoutNumpy(self):
+        evaluate.numpy = None
+        self.checkCombinations()
+
+if __name__ == "__main__":
+    unittest.main()
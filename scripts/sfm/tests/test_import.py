@@ -0,0 +1,107 @@
+# Bone Flex Drivers import tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Validates and imports exported JSON entries into shots from the local datamodel:
+#   python -m unittest discover -s tests -t .
+
+
+import unittest
+
+from boneflexdrivers import engine, localdm, benchmark
+
+engine.setDatamodel(localdm)
+
+def createEntry(name, flexName, boneName="bone0"):
+    return {"name": name, "flexName": flexName, "boneName": boneName}
+
+def getOutcomes(results):
+    return [(result.entry, result.imported, result.reason) for result in results]
+
+class ValidateTest(unittest.TestCase):
+    def testDuplicateFlexes(self):
+        entries = [
+            createEntry("jaw", "jaw_open"),
+            createEntry("jaw again", "jaw_open"),
+            createEntry("brow", "brow_up"),
+            createEntry("smile", "smile"),
+            "not an entry",
+            {"name": "nameless flex", "boneName": "bone0"},
+        ]
+        boneFlexDrivers, results = engine.validateBoneFlexDrivers(entries, ["smile"])
+        self.assertEqual([boneFlexDriver.flexName for boneFlexDriver in boneFlexDrivers], ["jaw_open", "brow_up"])
+        self.assertEqual(getOutcomes(results)[:4], [
+            (0, True, ""),
+            (1, False, "Flex 'jaw_open' is already used by entry 1"),
+            (2, True, ""),
+            (3, False, "Flex 'smile' is already in use by another bone flex driver"),
+        ])
+        self.assertEqual([(result.entry, result.imported, result.name) for result in results[4:]], [(4, False, ""), (5, False, "nameless flex")])
+        self.assertTrue(results[4].reason.startswith("Malformed bone flex driver entry"))
+        self.assertTrue(results[5].reason.startswith("Missing required fields"))
+    def testNotAList(self):
+        self.assertRaises(ValueError, engine.validateBoneFlexDrivers, {"name": "jaw"}, [])
+
+class MissingImportTargetTest(unittest.TestCase):
+    def setUp(self):
+        localdm.clearDocument()
+        self.shot = benchmark.createSession(1, 2, 0)
+        self.entries = [createEntry("jaw", "jaw_open"), createEntry("jaw again", "jaw_open")]
+    def skip(self, animationSet, animSetName):
+        boneFlexDrivers, results = engine.validateBoneFlexDrivers(self.entries, [])
+        return engine.skipMissingImportTarget(results, animationSet, animSetName, "shot1"), results
+    def testAnimationSetFound(self):
+        canImport, results = self.skip(self.shot.animationSets[0], "model0")
+        self.assertTrue(canImport)
+        self.assertEqual([result.imported for result in results], [True, False])
+    def testMissingAnimationSet(self):
+        canImport, results = self.skip(None, "model9")
+        self.assertFalse(canImport)
+        # entries skipped for their own reason keep it
+        self.assertEqual(getOutcomes(results), [
+            (0, False, "Animation set 'model9' and its model could not be found in shot 'shot1'"),
+            (1, False, "Flex 'jaw_open' is already used by entry 1"),
+        ])
+    def testMissingModel(self):
+        animationSet = self.shot.animationSets[0]
+        animationSet.RemoveAttribute("gameModel")
+        canImport, results = self.skip(animationSet, "model0")
+        self.assertFalse(canImport)
+        self.assertEqual(getOutcomes(results)[0], (0, False, "Animation set 'model0' has no model"))
+
+class ImportSessionTest(unittest.TestCase):
+    def setUp(self):
+        localdm.clearDocument()
+        # two shots, each with animation sets of model0 and model1, whose first animation set drives flex0 already
+        self.shots = [benchmark.createSession(2, 2, 1, "shot1"), benchmark.createSession(2, 2, 1, "shot2")]
+        for shot in self.shots:
+            engine.removeBoneFlexDriverElement(shot, engine.getBoneFlexDrivers(shot)[1])
+    def testImportSession(self):
+        importedShots, results = engine.importSession(self.shots, {
+            "Models\\Benchmark\\Model0.mdl": [createEntry("flex0 again", "flex0"), createEntry("flex1", "flex1", "bone1")],
+            "models/benchmark/model1.mdl": [createEntry("flex0", "flex0")],
+            "models/missing.mdl": [createEntry("jaw", "jaw_open"), "not an entry"],
+        })
+        outcomes = [(result.shotName, result.animSetName, result.name, result.imported, result.reason) for result in results]
+        self.assertEqual(outcomes, [
+            ("shot1", "model0", "flex0 again", False, "Flex 'flex0' is already in use by another bone flex driver"),
+            ("shot1", "model0", "flex1", True, ""),
+            ("shot1", "model1", "flex0", True, ""),
+            ("shot2", "model0", "flex0 again", False, "Flex 'flex0' is already in use by another bone flex driver"),
+            ("shot2", "model0", "flex1", True, ""),
+            ("shot2", "model1", "flex0", True, ""),
+            ("", "", "jaw", False, "No animation set in the session uses model 'models/missing.mdl'"),
+            ("", "", "", False, "Malformed bone flex driver entry: not an entry"),
+        ])
+        self.assertEqual([(shot.GetName(), len(elements)) for shot, elements in importedShots], [("shot1", 2), ("shot2", 2)])
+        self.assertEqual(engine.getBoneFlexDrivers(self.shots[0]).count(), 3)
+        # importing again skips every entry, as each flex is in use now
+        importedShots, results = engine.importSession(self.shots, {"models/benchmark/model0.mdl": [createEntry("flex1", "flex1", "bone1")]})
+        self.assertEqual(importedShots, [])
+        self.assertEqual([result.imported for result in results], [False, False])
+    def testNotADictionary(self):
+        self.assertRaises(ValueError, engine.importSession, self.shots, [createEntry("jaw", "jaw_open")])
+        self.assertRaises(ValueError, engine.importSession, self.shots, {"models/hero.mdl": createEntry("jaw", "jaw_open")})
+
+if __name__ == "__main__":
+    unittest.main()
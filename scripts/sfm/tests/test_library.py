@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Bone Flex Drivers library tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Writes and reads libraries of many models' bone flex drivers:
+#   python -m unittest discover -s tests -t .
+
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from boneflexdrivers import library
+
+class CountingBytesIO(io.BytesIO):
+    """
+    Counts the bytes read from it.
+    """
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.bytesRead = 0
+    def readline(self, *args):
+        line = io.BytesIO.readline(self, *args)
+        self.bytesRead += len(line)
+        return line
+    def read(self, *args):
+        data = io.BytesIO.read(self, *args)
+        self.bytesRead += len(data)
+        return data
+
+def createEntries(prefix, count):
+    return [{"name": "%s%d" % (prefix, i), "flexName": u"flex_%s_%d_é" % (prefix, i), "boneName": "bone%d" % i} for i in range(count)]
+
+boneFlexDriversByModel = {
+    "models/hero.mdl": createEntries("hero", 3),
+    "Models\\Villain.MDL": createEntries("villain", 2),
+    "models/extra.mdl": createEntries("extra", 40),
+}
+
+class LibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.folder, "drivers.jsonl")
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    def writeLines(self, lines):
+        with io.open(self.fileName, "wb") as f:
+            for line in lines:
+                f.write(library.encodeLine(line) if not isinstance(line, bytes) else line)
+    def testRoundTrip(self):
+        library.saveLibrary(self.fileName, boneFlexDriversByModel)
+        self.assertTrue(library.isLibraryFile(self.fileName))
+        self.assertEqual(library.getLibraryModelNames(self.fileName), ["models/extra.mdl", "models/hero.mdl", "models/villain.mdl"])
+        self.assertEqual(library.loadLibrary(self.fileName), {
+            "models/hero.mdl": boneFlexDriversByModel["models/hero.mdl"],
+            "models/villain.mdl": boneFlexDriversByModel["Models\\Villain.MDL"],
+            "models/extra.mdl": boneFlexDriversByModel["models/extra.mdl"],
+        })
+        self.assertEqual(library.loadLibraryModel(self.fileName, "models\\HERO.mdl"), boneFlexDriversByModel["models/hero.mdl"])
+        self.assertEqual(library.loadLibraryModel(self.fileName, "models/missing.mdl"), [])
+    def testSingleModelIsReadByOffset(self):
+        fileObject = io.BytesIO()
+        library.writeLibrary(fileObject, boneFlexDriversByModel)
+        data = fileObject.getvalue()
+        fileObject = CountingBytesIO(data)
+        header = library.readLibraryHeader(fileObject)
+        self.assertEqual(list(library.iterLibraryModel(fileObject, header, "models/villain.mdl")), boneFlexDriversByModel["Models\\Villain.MDL"])
+        # only the header line, whose start is read twice to recognize it, and the villain's section are read,
+        # never the large extra section before it
+        sectionLength = sum([len(library.encodeLine(line)) for line in [{"model": "models/villain.mdl", "count": 2}] + boneFlexDriversByModel["Models\\Villain.MDL"]])
+        self.assertEqual(fileObject.bytesRead, len(library.libraryPrefix) + header["bodyOffset"] + sectionLength)
+        self.assertTrue(fileObject.bytesRead < len(data) / 4)
+    def testStaleIndexIsRebuilt(self):
+        # the hero section was edited by hand after the index was written: an entry was added and blank lines inserted
+        heroEntries = createEntries("hero", 3)
+        villainEntries = createEntries("villain", 2)
+        lines = [{"model": "models/hero.mdl", "count": 2}] + heroEntries + [b"\n", {"model": "models/villain.mdl", "count": 2}] + villainEntries[:1] + [b"\r\n"] + villainEntries[1:]
+        staleIndex = {"models/hero.mdl": {"offset": 0, "count": 2}, "models/villain.mdl": {"offset": sum([len(library.encodeLine(line)) for line in lines[:3]]), "count": 2}}
+        self.writeLines([{"format": library.libraryFormat, "version": 1, "index": staleIndex}] + lines)
+        self.assertEqual(library.loadLibraryModel(self.fileName, "models/villain.mdl"), villainEntries)
+        self.assertEqual(library.loadLibrary(self.fileName), {"models/hero.mdl": heroEntries, "models/villain.mdl": villainEntries})
+    def testUnreadableSection(self):
+        self.writeLines([{"format": library.libraryFormat, "version": 1, "index": {"models/hero.mdl": {"offset": 0, "count": 1}}}, {"name": "orphan"}])
+        self.assertRaises(ValueError, library.loadLibrary, self.fileName)
+    def testUnsupportedVersions(self):
+        for version in (2, 0, "1", None):
+            self.writeLines([{"format": library.libraryFormat, "version": version, "index": {}}])
+            self.assertRaises(ValueError, library.loadLibrary, self.fileName)
+    def testOtherFiles(self):
+        self.writeLines([[{"name": "boneFlexDriver1"}]])
+        self.assertFalse(library.isLibraryFile(self.fileName))
+        self.assertEqual(library.getLibraryModelNames(self.fileName), [])
+        self.assertRaises(ValueError, library.loadLibrary, self.fileName)
+
+if __name__ == "__main__":
+    unittest.main()
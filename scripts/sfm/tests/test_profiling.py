@@ -0,0 +1,37 @@
+# Bone Flex Drivers profiling tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Times decorated handlers like the window's:
+#   python -m unittest discover -s tests -t .
+
+
+import unittest
+
+from boneflexdrivers import profiling
+
+class Handlers(object):
+    def __init__(self):
+        self.profiler = profiling.Profiler()
+        self.calls = []
+    @profiling.profiled("changed")
+    def changed(self, value, extra=None, *args, **kwargs):
+        self.calls.append((value, extra, args, kwargs))
+        return value
+
+class ProfiledTest(unittest.TestCase):
+    def testArgumentsArePassedUnchanged(self):
+        handlers = Handlers()
+        self.assertEqual(handlers.changed(1, 2, 3, key=4), 1)
+        self.assertEqual(handlers.calls, [(1, 2, (3,), {"key": 4})])
+        self.assertEqual(handlers.changed.__name__, "changed")
+    def testCallsAreOnlyRecordedWhileEnabled(self):
+        handlers = Handlers()
+        handlers.changed(1)
+        self.assertEqual(len(handlers.profiler.sections), 0)
+        handlers.profiler.enabled = True
+        handlers.changed(1, extra=2)
+        self.assertEqual(handlers.profiler.sections["changed"].calls, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# Bone Flex Drivers QC import tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Reads $boneflexdriver commands from small QC files:
+#   python -m unittest discover -s tests -t .
+
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from boneflexdrivers import qc
+
+class TokenizeTest(unittest.TestCase):
+    def testTokens(self):
+        text = u'$modelname "my models/hero.mdl" // line comment\n/* block\ncomment */ $include sub/parts.qci {tx}'
+        self.assertEqual([(token, quoted) for token, quoted, position in qc.tokenize(text)], [
+            (u"$modelname", False),
+            (u"my models/hero.mdl", True),
+            (u"$include", False),
+            (u"sub/parts.qci", False),
+            (u"{", False),
+            (u"tx", False),
+            (u"}", False),
+        ])
+    def testUnterminatedComment(self):
+        self.assertEqual(qc.tokenize(u'$boneflexdriver /* never closed "bone" tx'), [(u"$boneflexdriver", False, 0)])
+
+class QcFileTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    def writeFile(self, name, text):
+        fileName = os.path.join(self.folder, name)
+        if not os.path.isdir(os.path.dirname(fileName)):
+            os.makedirs(os.path.dirname(fileName))
+        with io.open(fileName, "w", encoding="utf-8") as f:
+            f.write(text)
+        return fileName
+    def getDrivers(self, entries):
+        return [(entry["boneName"], entry["flexName"], entry["boneAxis"], entry["minBoneRange"], entry["maxBoneRange"]) for entry in entries]
+    def testSingleLineAndBlockForms(self):
+        fileName = self.writeFile("hero.qc", u'''$modelname "characters\\hero"
+$boneflexdriver "jaw" tz "jaw_open" 0 1.5 // open the jaw
+$boneflexdriver "brow bone" {
+    tx "brow_left" -1 1
+    ty brow_up 0 2
+}
+$body "body" "hero.smd"
+''')
+        modelName, entries, errors = qc.parseQcFile(fileName)
+        self.assertEqual(errors, [])
+        self.assertEqual(modelName, "models/characters/hero")
+        self.assertEqual(self.getDrivers(entries), [
+            ("jaw", "jaw_open", "Z", 0.0, 1.5),
+            ("brow bone", "brow_left", "X", -1.0, 1.0),
+            ("brow bone", "brow_up", "Y", 0.0, 2.0),
+        ])
+        self.assertTrue(entries[0]["usePosition"])
+    def testIncludes(self):
+        self.writeFile("sub/face.qci", u'$include "shared.qci"\n$boneflexdriver "jaw" tz "jaw_open" 0 1\n')
+        # not next to face.qci, so it is found in the folder of the first QC file
+        self.writeFile("shared.qci", u'$boneflexdriver "lip" ty "lip_up" 0 1\n$include "hero.qc"\n')
+        fileName = self.writeFile("hero.qc", u'$modelname "hero.mdl"\n$include "sub/face.qci"\n')
+        modelName, entries, errors = qc.parseQcFile(fileName)
+        self.assertEqual(errors, [])
+        self.assertEqual(modelName, "models/hero.mdl")
+        # the include cycle back to hero.qc is only read once
+        self.assertEqual(self.getDrivers(entries), [("lip", "lip_up", "Y", 0.0, 1.0), ("jaw", "jaw_open", "Z", 0.0, 1.0)])
+    def testErrors(self):
+        fileName = self.writeFile("broken.qc", u'''$include "missing.qci"
+$boneflexdriver "jaw" rx "jaw_open" 0 1
+$boneflexdriver "jaw" tz "jaw_open" zero 1
+$boneflexdriver "lip" { tx "lip_up" 0 }
+$boneflexdriver "chin" tz "chin_up" 0 1
+$boneflexdriver
+''')
+        modelName, entries, errors = qc.parseQcFile(fileName)
+        self.assertIsNone(modelName)
+        # parsing carries on after every error
+        self.assertEqual(self.getDrivers(entries), [("chin", "chin_up", "Z", 0.0, 1.0)])
+        self.assertEqual(len(errors), 5)
+        self.assertIn("missing.qci", errors[0])
+        self.assertEqual(errors[1:], [
+            "broken.qc(2): Unsupported component 'rx' of bone 'jaw', expected tx, ty or tz",
+            "broken.qc(3): Invalid range 'zero 1' of flex controller 'jaw_open'",
+            "broken.qc(4): $boneflexdriver of bone 'lip' expects a component, flex controller, min and max",
+            "broken.qc(6): $boneflexdriver is missing its bone name",
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
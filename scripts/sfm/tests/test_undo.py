@@ -0,0 +1,84 @@
+# Bone Flex Drivers undo tests
+# Written by KiwifruitDev
+# Licensed under the MIT License
+#
+# Checks the undo entries and undo state transactions leave on the datamodel:
+#   python -m unittest discover -s tests -t .
+
+
+import unittest
+
+from boneflexdrivers import localdm, undo
+
+class RecordingDataModel(localdm.DataModel):
+    """
+    A datamodel also recording its undo calls.
+    """
+    def __init__(self):
+        localdm.DataModel.__init__(self)
+        self.calls = []
+    def StartUndo(self, description, redoDescription, chainId=0):
+        localdm.DataModel.StartUndo(self, description, redoDescription, chainId)
+        self.calls.append(("StartUndo", description, chainId))
+    def FinishUndo(self):
+        localdm.DataModel.FinishUndo(self)
+        self.calls.append(("FinishUndo",))
+    def AbortUndoableOperation(self):
+        localdm.DataModel.AbortUndoableOperation(self)
+        self.calls.append(("AbortUndoableOperation",))
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.datamodel = RecordingDataModel()
+        self.undo = undo.UndoTransactions(self.datamodel)
+    def testNestedTransactionsAreOneEntry(self):
+        with self.undo.transaction("Outer"):
+            with self.undo.transaction("Inner", ("key",)):
+                self.assertEqual(self.undo.depth, 2)
+                self.assertEqual(self.undo.transactionKey, None)
+        self.assertEqual(self.datamodel.calls, [("StartUndo", "Outer", 0), ("FinishUndo",)])
+        self.assertEqual(self.undo.depth, 0)
+        self.assertEqual(self.datamodel.undoDepth, 0)
+    def testExceptionAbortsEntry(self):
+        def fail():
+            with self.undo.transaction("Outer", ("key",)):
+                with self.undo.transaction("Inner"):
+                    raise RuntimeError("failed")
+        self.assertRaises(RuntimeError, fail)
+        self.assertEqual(self.datamodel.calls, [("StartUndo", "Outer", 1), ("AbortUndoableOperation",)])
+        self.assertEqual(self.undo.depth, 0)
+        self.assertEqual(self.undo.transactionKey, None)
+        self.assertEqual(self.datamodel.undoDepth, 0)
+    def testNotUndoableRestoresUndo(self):
+        with self.undo.transaction("Bulk", undoable=False):
+            self.assertFalse(self.datamodel.IsUndoEnabled())
+            with self.undo.transaction("Inner"):
+                self.assertFalse(self.datamodel.IsUndoEnabled())
+        self.assertTrue(self.datamodel.IsUndoEnabled())
+        self.assertEqual(self.datamodel.calls, [])
+    def testNotUndoableRestoresUndoOnException(self):
+        def fail():
+            with self.undo.transaction("Bulk", undoable=False):
+                raise RuntimeError("failed")
+        self.assertRaises(RuntimeError, fail)
+        self.assertTrue(self.datamodel.IsUndoEnabled())
+        self.assertEqual(self.undo.depth, 0)
+    def testDisabledUndoStaysDisabled(self):
+        self.datamodel.SetUndoEnabled(False)
+        with self.undo.transaction("Edit"):
+            pass
+        with self.undo.transaction("Bulk", undoable=False):
+            pass
+        self.assertFalse(self.datamodel.IsUndoEnabled())
+        self.assertEqual(self.datamodel.calls, [])
+    def testCoalesceKeysShareChains(self):
+        for key in [("minFlexRange", "shot", "a"), ("minFlexRange", "shot", "a"), ("maxFlexRange", "shot", "a"), None, ("maxFlexRange", "shot", "a")]:
+            with self.undo.transaction("Edit", key):
+                self.assertEqual(self.undo.transactionKey, key)
+        chainIds = [call[2] for call in self.datamodel.calls if call[0] == "StartUndo"]
+        # the same key in a row shares a chain, a transaction without a key ends it
+        self.assertEqual(chainIds, [1, 1, 2, 0, 3])
+        self.assertEqual(self.undo.transactionKey, None)
+
+if __name__ == "__main__":
+    unittest.main()